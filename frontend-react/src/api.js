@@ -1,31 +1,6 @@
 const API_BASE_URL =
   import.meta.env.VITE_API_BASE_URL || "http://localhost:8000";
 
-export const processQuestion = async (questionText, createdBy) => {
-  try {
-    const response = await fetch(`${API_BASE_URL}/process_question/`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        question_text: questionText,
-        created_by: createdBy,
-      }),
-    });
-
-    if (!response.ok) {
-      const errorData = await response.json();
-      throw new Error(errorData.detail || "Failed to process question");
-    }
-
-    return await response.json();
-  } catch (error) {
-    console.error("Error processing question:", error);
-    throw error;
-  }
-};
-
 export const getQuestionVersions = async (questionId) => {
   try {
     const response = await fetch(
@@ -43,3 +18,75 @@ export const getQuestionVersions = async (questionId) => {
     throw error;
   }
 };
+
+const parseSseEvent = (chunk) => {
+  let event = "message";
+  const dataLines = [];
+  for (const line of chunk.split("\n")) {
+    if (line.startsWith("event:")) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith("data:")) {
+      dataLines.push(line.slice(5).trim());
+    }
+  }
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join("\n")) : null };
+};
+
+export const processQuestionStream = async (questionText, createdBy, onEvent) => {
+  const response = await fetch(`${API_BASE_URL}/process_question/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify({
+      question_text: questionText,
+      created_by: createdBy,
+    }),
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.detail || "Failed to process question");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const chunk = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      if (chunk.trim()) {
+        const { event, data } = parseSseEvent(chunk);
+        if (event === "error") {
+          throw new Error(data?.detail || "Failed to process question");
+        }
+        onEvent(event, data);
+      }
+      boundary = buffer.indexOf("\n\n");
+    }
+  }
+};
+
+export const listQuestions = async ({ cursor, limit = 50, fields, ...filters } = {}) => {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  if (fields) params.set("fields", fields.join(","));
+  for (const [key, value] of Object.entries(filters)) {
+    if (value) params.set(key, value);
+  }
+
+  const response = await fetch(`${API_BASE_URL}/questions?${params}`);
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.detail || "Failed to fetch questions");
+  }
+  return await response.json();
+};
+
+export const exportUrl = (format = "csv") => `${API_BASE_URL}/export?format=${format}`;
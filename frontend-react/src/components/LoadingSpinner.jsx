@@ -1,11 +1,11 @@
 import React from "react";
 import "./LoadingSpinner.css";
 
-const LoadingSpinner = () => {
+const LoadingSpinner = ({ message = "Processing your question..." }) => {
   return (
     <div className="loading-spinner-container">
       <div className="loading-spinner-circle"></div>
-      <p>Processing your question...</p>
+      <p>{message}</p>
     </div>
   );
 };
@@ -1,12 +1,21 @@
 import { useState, useEffect, useCallback } from "react";
 import { useNavigate } from "react-router-dom";
-import { processQuestion } from "../api";
+import { processQuestionStream } from "../api";
+
+// Field of the version object that each streamed pipeline stage fills in.
+const STAGE_FIELDS = {
+  correctness: "correctness_feedback",
+  language: "language_feedback",
+  improvement: "improvement_feedback",
+  metadata: "metadata",
+};
 
 export default function useQuestionProcessor() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [responseData, setResponseData] = useState(null);
   const [selectedVersion, setSelectedVersion] = useState(null);
+  const [completedStages, setCompletedStages] = useState([]);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -26,16 +35,33 @@ export default function useQuestionProcessor() {
     setError(null);
     setResponseData(null);
     setSelectedVersion(null);
+    setCompletedStages([]);
 
     try {
-      const data = await processQuestion(questionText, createdBy);
-      setResponseData(data);
-      const latestAIProcessedVersion = Array.isArray(data.version_history)
-        ? data.version_history.find(
-            (v) => v.version_number === data.version_number
-          )
-        : null;
-      setSelectedVersion(latestAIProcessedVersion || data);
+      await processQuestionStream(questionText, createdBy, (event, data) => {
+        if (event === "accepted") {
+          setResponseData({ original_question: questionText });
+          setSelectedVersion({
+            original_text: questionText,
+            improved_text: questionText,
+          });
+        } else if (event === "stage") {
+          setSelectedVersion((prev) => ({
+            ...prev,
+            [STAGE_FIELDS[data.stage]]: data.feedback,
+            improved_text: data.question_text,
+          }));
+          setCompletedStages((prev) => [...prev, data.stage]);
+        } else if (event === "complete") {
+          setResponseData(data);
+          setSelectedVersion((prev) => ({
+            ...prev,
+            question_id: data.question_id,
+            version_number: data.version_number,
+            processed_question: data.processed_question,
+          }));
+        }
+      });
     } catch (err) {
       setError(err.message || "An unknown error occurred");
     } finally {
@@ -48,6 +74,7 @@ export default function useQuestionProcessor() {
     error,
     responseData,
     selectedVersion,
+    completedStages,
     handleProcessQuestion,
     navigate,
   };
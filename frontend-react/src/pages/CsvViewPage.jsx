@@ -1,47 +1,119 @@
-import React, { useEffect, useState } from "react";
-import Papa from "papaparse";
+import React, { useEffect, useRef, useState } from "react";
 import { DataGrid } from "@mui/x-data-grid";
+import { exportUrl, listQuestions } from "../api";
+
+const FIELDS = [
+  "question_id",
+  "version_number",
+  "timestamp",
+  "created_by",
+  "original_text",
+  "improved_text",
+  "correctness_feedback_is_correct",
+  "language_feedback_issues_found",
+  "metadata_topic",
+  "metadata_subtopic",
+  "metadata_blooms_level",
+  "metadata_difficulty",
+];
+
+const EMPTY_FILTERS = {
+  created_by: "",
+  metadata_topic: "",
+  metadata_difficulty: "",
+  since: "",
+  until: "",
+};
+
+const columns = FIELDS.map((field) => ({
+  field,
+  headerName: field,
+  flex: 1,
+  sortable: false,
+  minWidth: 120,
+}));
 
 const CsvViewPage = () => {
   const [rows, setRows] = useState([]);
-  const [columns, setColumns] = useState([]);
   const [error, setError] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const [filters, setFilters] = useState(EMPTY_FILTERS);
+  const [appliedFilters, setAppliedFilters] = useState(EMPTY_FILTERS);
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize: 25 });
+  const [hasNextPage, setHasNextPage] = useState(false);
+  // Cursor that starts each page already visited, so Previous needs no refetch of earlier pages.
+  const cursors = useRef([null]);
 
   useEffect(() => {
-    fetch("http://localhost:8000/download-csv")
-      .then((res) => {
-        if (!res.ok) throw new Error("Failed to fetch CSV");
-        return res.text();
-      })
-      .then((text) => {
-        const parsed = Papa.parse(text, { header: true, skipEmptyLines: true });
-        setRows(parsed.data.map((row, i) => ({ id: i, ...row })));
-        setColumns(
-          parsed.meta.fields.map((field) => ({
-            field,
-            headerName: field,
-            flex: 1,
-            sortable: true,
-            minWidth: 120,
-          }))
-        );
+    let cancelled = false;
+    setLoading(true);
+    listQuestions({
+      cursor: cursors.current[paginationModel.page],
+      limit: paginationModel.pageSize,
+      fields: FIELDS,
+      ...appliedFilters,
+    })
+      .then(({ items, next_cursor }) => {
+        if (cancelled) return;
+        cursors.current[paginationModel.page + 1] = next_cursor;
+        setHasNextPage(Boolean(next_cursor));
+        setRows(items.map((item) => ({ id: `${item.question_id}-${item.version_number}`, ...item })));
+        setError(null);
       })
-      .catch((err) => setError(err.message));
-  }, []);
+      .catch((err) => !cancelled && setError(err.message))
+      .finally(() => !cancelled && setLoading(false));
+    return () => {
+      cancelled = true;
+    };
+  }, [paginationModel, appliedFilters]);
+
+  const applyFilters = (event) => {
+    event.preventDefault();
+    cursors.current = [null];
+    setAppliedFilters(filters);
+    setPaginationModel((model) => ({ ...model, page: 0 }));
+  };
 
-  if (error)
-    return <div style={{ color: "red", padding: "1rem" }}>{error}</div>;
+  const changePagination = (model) => {
+    if (model.pageSize !== paginationModel.pageSize) {
+      cursors.current = [null];
+      model = { ...model, page: 0 };
+    }
+    setPaginationModel(model);
+  };
 
   return (
     <div style={styles.wrapper}>
       <h2 style={styles.heading}>📄 CSV Table Viewer</h2>
+      <form style={styles.filters} onSubmit={applyFilters}>
+        {Object.keys(EMPTY_FILTERS).map((key) => (
+          <input
+            key={key}
+            type={key === "since" || key === "until" ? "date" : "text"}
+            placeholder={key}
+            title={key}
+            value={filters[key]}
+            onChange={(e) => setFilters({ ...filters, [key]: e.target.value })}
+            style={styles.input}
+          />
+        ))}
+        <button type="submit" style={styles.button}>Apply</button>
+        <a href={exportUrl("csv")} style={styles.link}>Download CSV</a>
+        <a href={exportUrl("jsonl")} style={styles.link}>Download JSONL</a>
+      </form>
+      {error && <div style={{ color: "red", padding: "0 8px 8px" }}>{error}</div>}
       <div style={styles.tableContainer}>
         <DataGrid
           rows={rows}
           columns={columns}
-          pageSize={25}
-          rowsPerPageOptions={[10, 25, 50, 100]}
-          disableSelectionOnClick
+          loading={loading}
+          paginationMode="server"
+          rowCount={-1}
+          paginationMeta={{ hasNextPage }}
+          paginationModel={paginationModel}
+          onPaginationModelChange={changePagination}
+          pageSizeOptions={[10, 25, 50, 100]}
+          disableRowSelectionOnClick
           sx={{
             border: "none",
             fontFamily: "Segoe UI, sans-serif",
@@ -69,6 +141,31 @@ const styles = {
     marginBottom: "12px",
     paddingLeft: "8px",
   },
+  filters: {
+    display: "flex",
+    flexWrap: "wrap",
+    gap: "8px",
+    alignItems: "center",
+    padding: "0 8px 12px",
+  },
+  input: {
+    padding: "6px 8px",
+    border: "1px solid #d1d5db",
+    borderRadius: "6px",
+    fontSize: "14px",
+  },
+  button: {
+    padding: "6px 14px",
+    borderRadius: "6px",
+    border: "none",
+    backgroundColor: "#2563eb",
+    color: "#fff",
+    cursor: "pointer",
+  },
+  link: {
+    fontSize: "14px",
+    color: "#2563eb",
+  },
   tableContainer: {
     flexGrow: 1,
     backgroundColor: "#fff",
@@ -11,6 +11,7 @@ export default function MainPage() {
     error,
     responseData,
     selectedVersion,
+    completedStages,
     handleProcessQuestion,
     navigate,
   } = useQuestionProcessor();
@@ -41,7 +42,15 @@ export default function MainPage() {
         </button>
       )}
 
-      {loading && <LoadingSpinner />}
+      {loading && (
+        <LoadingSpinner
+          message={
+            completedStages.length
+              ? `Finished ${completedStages.join(", ")}...`
+              : undefined
+          }
+        />
+      )}
       {error && (
         <div className="error-message slide-in">
           <i className="fas fa-exclamation-circle"></i>
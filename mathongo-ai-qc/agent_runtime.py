@@ -0,0 +1,706 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import re
+import signal
+import string
+import threading
+
+import llm_backends
+import metrics
+import resilience
+import scheduling
+from config import settings
+from response_cleaner import parse_json_response
+from schemas import AGENT_OUTPUT_MODELS, validate_agent_output, describe_agent_output, agent_output_conflict
+from result_cache import make_cache_key, get_cached_feedback, store_feedback, aget_cached_feedback, astore_feedback
+
+GEMINI_MODEL = settings.gemini_model
+# Per-agent overrides of GEMINI_MODEL, e.g. a cheaper model for metadata.
+AGENT_MODELS = settings.agent_models
+
+# Model cascade: for CASCADE_AGENTS, CASCADE_MODEL answers first and the
+# agent's own model is only called when that reply fails validation,
+# contradicts itself, reports a confidence under CASCADE_MIN_CONFIDENCE or
+# disagrees with another agent. An empty CASCADE_MODEL turns it off.
+CASCADE_MODEL = settings.cascade_model
+CASCADE_AGENTS = settings.cascade_agents
+CASCADE_MIN_CONFIDENCE = settings.cascade_min_confidence
+# CASCADE_MODEL's price per token relative to the agent's model, for /llm/usage.
+CASCADE_COST_RATIO = settings.cascade_cost_ratio
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+
+# Sends each prompt's static instructions once per model as its system
+# instruction, so a call only carries the question paragraph.
+PROMPT_SYSTEM_INSTRUCTION = settings.prompt_system_instruction
+
+# Micro-batching: async calls arriving within the window are sent to Gemini
+# as one prompt of up to this many questions. 1 disables batching.
+MICROBATCH_SIZE = settings.microbatch_size
+MICROBATCH_WINDOW_MS = settings.microbatch_window_ms
+
+# Follow-up requests allowed per call when a reply cannot be parsed or
+# validated even after repair; 0 turns the re-ask off.
+PARSE_REASK_ATTEMPTS = settings.parse_reask_attempts
+REASK_MAX_RESPONSE_CHARS = 8000
+
+CONFIDENCE_INSTRUCTION = """Also include the key "confidence" (number from 0 to 1): how likely an expert reviewer is to agree with your assessment."""
+
+REASK_PROMPT = """Your previous reply could not be used: {error}
+
+Rewrite it as ONLY a valid JSON object with exactly these keys: {fields}.
+Keep the content of your previous reply. Do not add markdown, code fences or any text outside the JSON.
+
+Previous reply:
+{response}"""
+
+BATCH_QUESTION_BLOCK = """The input below is not a single question but a JSON array of {count} independent questions.
+Evaluate each question on its own, exactly as instructed.
+Return ONLY a JSON array of exactly {count} objects, in the same order as the questions, where each object has the keys described in the instructions.
+
+Number of questions: {count}
+{questions}"""
+
+
+class TokenBudgetExceeded(ValueError):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token for English text),
+    used to check budgets without a round trip to the API.
+    """
+    return (len(text) + 3) // 4
+
+
+def compact_prompt(text: str) -> str:
+    # Trailing spaces and runs of blank lines cost tokens and carry nothing.
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in text.splitlines())).strip()
+
+
+class PromptTemplate:
+    """
+    A prompt file parsed once into literal text and {field} slots, so
+    rendering is a join instead of a str.format parse on every call.
+
+    With `split_system`, everything before the paragraph holding the first
+    field becomes the system instruction and render() returns only the rest,
+    e.g. "Question:\n<text>".
+    """
+
+    def __init__(self, name: str, text: str, split_system: bool = None):
+        self.name = name
+        self.text = compact_prompt(text)
+        parts = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(self.text):
+            if field is not None and (format_spec or conversion):
+                raise ValueError(f"Prompt '{name}' uses an unsupported format spec on '{{{field}}}'")
+            parts.append((literal, field))
+
+        self.system_instruction = None
+        split_system = PROMPT_SYSTEM_INSTRUCTION if split_system is None else split_system
+        if split_system and parts and parts[0][1] is not None:
+            head, separator, tail = parts[0][0].rpartition("\n\n")
+            if separator and head.strip():
+                self.system_instruction = head.strip()
+                parts[0] = (tail, parts[0][1])
+        self._parts = parts
+        self.fields = {field for _, field in self._parts if field is not None}
+        # Covers the split, so cached feedback and stage fingerprints change with it.
+        identity = self.text if self.system_instruction is None else f"{self.system_instruction}\0{self.text}"
+        self.sha256 = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        self.system_tokens = estimate_tokens(self.system_instruction or "")
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' is missing values for {sorted(missing)}")
+        return "".join(
+            literal + (str(values[field]) if field is not None else "")
+            for literal, field in self._parts
+        )
+
+
+_prompts = {}
+_prompts_lock = threading.Lock()
+_first_load_lock = threading.Lock()
+
+
+def load_prompts() -> dict:
+    """
+    Reads and compiles every prompts/*.txt file, then swaps them in at once.
+    Returns {prompt_name: sha256}.
+    """
+    global _prompts
+    loaded = {}
+    for path in sorted(glob.glob(os.path.join(PROMPTS_DIR, "*.txt"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "r", encoding="utf-8") as f:
+            loaded[name] = PromptTemplate(name, f.read())
+    for client in AGENT_CLIENTS.values():
+        if client.prompt_name not in loaded:
+            raise ValueError(f"Prompt '{client.prompt_name}' used by the {client.name} agent is missing")
+        client.check_budget(loaded[client.prompt_name])
+    with _prompts_lock:
+        _prompts = loaded
+    # A changed system instruction needs new model objects; the next call builds them.
+    for client in AGENT_CLIENTS.values():
+        client.model = None
+    print(f"Loaded {len(loaded)} prompt templates from {PROMPTS_DIR}")
+    return {name: template.sha256 for name, template in loaded.items()}
+
+
+def get_prompt(prompt_name: str) -> PromptTemplate:
+    # Templates load on first use, so importing the agents reads no files.
+    if not _prompts:
+        with _first_load_lock:
+            if not _prompts:
+                load_prompts()
+    try:
+        return _prompts[prompt_name]
+    except KeyError:
+        raise KeyError(f"Unknown prompt template: {prompt_name}")
+
+
+def install_reload_signal():
+    """
+    Reloads prompt templates on SIGHUP, for deployments that edit prompts in place.
+    """
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: load_prompts())
+
+
+def check_question_budget(question_text: str):
+    """
+    Raises TokenBudgetExceeded if any agent's prompt for `question_text`
+    would exceed its budget, so a request can be refused before it is stored.
+    """
+    for client in AGENT_CLIENTS.values():
+        template = get_prompt(client.prompt_name)
+        message = client.over_budget(template, template.render(question_text=question_text))
+        if message:
+            raise TokenBudgetExceeded(message)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent calls to one agent and sends them as a single prompt
+    once `max_size` questions are pending or the window closes. Answers that
+    come back malformed or incomplete are retried as single calls. A batch is
+    scheduled as its most urgent question's traffic; retried singles as their own.
+    """
+
+    def __init__(self, client, max_size: int, window_seconds: float):
+        self.client = client
+        self.max_size = max_size
+        self.window_seconds = window_seconds
+        self.loop = asyncio.get_running_loop()
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, question_text: str) -> dict:
+        future = self.loop.create_future()
+        self._pending.append((question_text, future, scheduling.current_traffic()))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self.loop.create_task(self._run(batch))
+
+    async def _run(self, batch: list):
+        questions = [question_text for question_text, _, _ in batch]
+        results = [None] * len(batch)
+        if len(batch) > 1:
+            try:
+                with scheduling.traffic(*scheduling.most_urgent([traffic for _, _, traffic in batch])):
+                    results = await self.client._agenerate_batch(questions)
+            except Exception as e:
+                print(f"[{self.client.name}_agent] Batch of {len(batch)} failed, falling back to single calls: {e}")
+                self.client.stats["batch_fallbacks"] += len(batch)
+                metrics.llm_retries.inc(len(batch), agent=self.client.name, reason="batch_failed")
+
+        singles = []
+        for (question_text, future, traffic), result in zip(batch, results):
+            if result is not None:
+                if not future.done():
+                    future.set_result(result)
+            else:
+                singles.append(self._resolve_single(question_text, future, traffic))
+        await asyncio.gather(*singles)
+
+    async def _resolve_single(self, question_text: str, future, traffic: tuple):
+        try:
+            with scheduling.traffic(*traffic):
+                result = await self.client._agenerate(self.client.build_request(question_text)[0])
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+
+# Every AgentClient by agent name, so the graph can fingerprint a stage's inputs.
+AGENT_CLIENTS = {}
+
+
+class AgentClient:
+    """
+    The model (from llm_backends), generation config and prompt of one agent,
+    built once and shared by every call to that agent. The model is built on
+    first use, so importing an agent neither loads nor configures the SDK.
+
+    `max_prompt_tokens` bounds the estimated input of one call (system
+    instruction plus question); a longer question is rejected before it is
+    sent. `max_output_tokens` is passed to the model, per question in a batch.
+
+    With a `cascade_model_name`, that model answers each call first (see
+    CASCADE_MODEL). Its replies are marked with `answered_by`, so the graph
+    can escalate() one that disagrees with another agent.
+    """
+
+    def __init__(self, name: str, prompt_name: str, temperature: float, model_name: str = None,
+                 batch_size: int = MICROBATCH_SIZE, batch_window_ms: float = MICROBATCH_WINDOW_MS,
+                 max_prompt_tokens: int = None, max_output_tokens: int = None, cascade_model_name: str = None):
+        self.name = name
+        self.prompt_name = prompt_name
+        self.temperature = temperature
+        self.model_name = model_name or AGENT_MODELS.get(name, GEMINI_MODEL)
+        if cascade_model_name is None and name in CASCADE_AGENTS:
+            cascade_model_name = CASCADE_MODEL
+        self.cascade_model_name = cascade_model_name if cascade_model_name != self.model_name else None
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_output_tokens = max_output_tokens
+        self.batch_size = batch_size
+        self.batch_window_seconds = batch_window_ms / 1000
+        self._batcher = None
+        self.stats = {"llm_requests": 0, "batched_requests": 0, "batched_questions": 0, "batch_fallbacks": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "budget_rejections": 0}
+        self.cascade_stats = {"answers": 0, "accepted": 0, "escalated": {}, "seconds": 0.0, "tokens": 0,
+                              "model_requests": 0, "model_seconds": 0.0, "model_tokens": 0}
+        if _prompts:
+            # Otherwise load_prompts() checks it with the other agents.
+            self.check_budget(get_prompt(prompt_name))
+        self.system_instruction = None
+        self.cascade_system_instruction = None
+        self._model = None
+        self._cascade_model = None
+        AGENT_CLIENTS[name] = self
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.build_model()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        if model is None:
+            self._cascade_model = None
+
+    @property
+    def cascade_model(self):
+        if self._cascade_model is None:
+            self.build_model()
+        return self._cascade_model
+
+    @property
+    def model_id(self) -> str:
+        """
+        The model(s) behind this agent's answers, e.g. "flash-lite>flash" for a
+        cascade, as recorded in cache keys and stage fingerprints.
+        """
+        return f"{self.cascade_model_name}>{self.model_name}" if self.cascade_model_name else self.model_name
+
+    def build_model(self):
+        """
+        (Re)creates the model, and the cascade model, with the prompt's
+        current system instruction.
+        """
+        self.system_instruction = get_prompt(self.prompt_name).system_instruction
+        self._model = llm_backends.create_model(self.name, self.model_name, self.system_instruction)
+        if self.cascade_model_name:
+            # Without a system instruction, cascade_prompt() appends the request to the prompt.
+            self.cascade_system_instruction = (
+                f"{self.system_instruction}\n\n{CONFIDENCE_INSTRUCTION}" if self.system_instruction else None
+            )
+            self._cascade_model = llm_backends.create_model(self.name, self.cascade_model_name, self.cascade_system_instruction)
+
+    def generation_config(self, questions: int = 1) -> dict:
+        config = {"temperature": self.temperature}
+        if self.max_output_tokens:
+            config["max_output_tokens"] = self.max_output_tokens * questions
+        return config
+
+    def check_budget(self, template: PromptTemplate):
+        if self.max_prompt_tokens and estimate_tokens(template.text) > self.max_prompt_tokens:
+            raise ValueError(
+                f"Prompt '{template.name}' is ~{estimate_tokens(template.text)} tokens before the question, "
+                f"over the {self.name} agent's budget of {self.max_prompt_tokens}"
+            )
+
+    def over_budget(self, template: PromptTemplate, prompt: str):
+        """
+        The error message if `prompt` plus the system instruction is over the
+        agent's prompt budget, else None.
+        """
+        prompt_tokens = template.system_tokens + estimate_tokens(prompt)
+        if self.max_prompt_tokens and prompt_tokens > self.max_prompt_tokens:
+            return f"The {self.name} prompt would be ~{prompt_tokens} tokens, over its budget of {self.max_prompt_tokens}"
+        return None
+
+    def build_request(self, question_text: str):
+        template = get_prompt(self.prompt_name)
+        prompt = template.render(question_text=question_text)
+        message = self.over_budget(template, prompt)
+        if message:
+            self.stats["budget_rejections"] += 1
+            metrics.llm_errors.inc(agent=self.name, error_type="TokenBudgetExceeded")
+            raise TokenBudgetExceeded(message)
+        cache_key = make_cache_key(self.name, question_text, template.sha256, self.model_id, self.temperature)
+        return prompt, cache_key
+
+    def usage(self) -> dict:
+        """
+        Token use and budgets of this agent since start-up.
+        """
+        requests = self.stats["llm_requests"]
+        template = get_prompt(self.prompt_name)
+        return {
+            "requests": requests,
+            "prompt_tokens": self.stats["prompt_tokens"],
+            "completion_tokens": self.stats["completion_tokens"],
+            "cached_tokens": self.stats["cached_tokens"],
+            "prompt_tokens_per_request": round(self.stats["prompt_tokens"] / requests, 1) if requests else None,
+            "completion_tokens_per_request": round(self.stats["completion_tokens"] / requests, 1) if requests else None,
+            "system_instruction_tokens": template.system_tokens,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "budget_rejections": self.stats["budget_rejections"],
+            "model": self.model_name,
+            "cascade": self.cascade_usage(),
+        }
+
+    def cascade_usage(self):
+        """
+        How often the cascade model's answer was kept, why the others were
+        escalated, and an estimate of what it saved against the mean call to
+        the agent's model: latency, and cost in that model's tokens with the
+        cascade model's tokens priced at CASCADE_COST_RATIO. The estimates are
+        None until the agent's model has been called. None without a cascade.
+        """
+        if not self.cascade_model_name:
+            return None
+        stats = self.cascade_stats
+        answers = stats["answers"]
+        escalated = sum(stats["escalated"].values())
+        # Answers accepted at first and escalated later, on disagreement, saved nothing.
+        kept = stats["accepted"] - stats["escalated"].get("disagreement", 0)
+        model_requests = stats["model_requests"]
+        return {
+            "model": self.cascade_model_name,
+            "min_confidence": CASCADE_MIN_CONFIDENCE,
+            "answers": answers,
+            "kept": kept,
+            "escalated": dict(sorted(stats["escalated"].items())),
+            "escalation_rate": round(escalated / answers, 4) if answers else None,
+            "mean_seconds": round(stats["seconds"] / answers, 4) if answers else None,
+            "mean_model_seconds": round(stats["model_seconds"] / model_requests, 4) if model_requests else None,
+            "seconds_saved": round(kept * stats["model_seconds"] / model_requests - stats["seconds"], 3) if model_requests else None,
+            "tokens_saved": round(kept * stats["model_tokens"] / model_requests - stats["tokens"] * CASCADE_COST_RATIO)
+            if model_requests else None,
+        }
+
+    def _record_usage(self, call):
+        self.stats["prompt_tokens"] += call.prompt_tokens
+        self.stats["completion_tokens"] += call.completion_tokens
+        self.stats["cached_tokens"] += call.cached_tokens
+        if call.kind == "cascade":
+            self.cascade_stats["seconds"] += call.seconds
+            self.cascade_stats["tokens"] += call.prompt_tokens + call.completion_tokens
+        elif call.kind == "single":
+            self.cascade_stats["model_requests"] += 1
+            self.cascade_stats["model_seconds"] += call.seconds
+            self.cascade_stats["model_tokens"] += call.prompt_tokens + call.completion_tokens
+
+    def fingerprint(self, question_text: str) -> dict:
+        """
+        Identifies everything this agent's output depends on: the cache key
+        over the question text, prompt template, model and temperature. The
+        prompt hash and model are kept separately to find stale stages in bulk.
+        """
+        template = get_prompt(self.prompt_name)
+        return {
+            "fingerprint": make_cache_key(self.name, question_text, template.sha256, self.model_id, self.temperature),
+            "prompt_sha256": template.sha256,
+            "model": self.model_id
+        }
+
+    def _response_text(self, response) -> str:
+        text = response.text
+        if metrics.should_sample():
+            print(f"[DEBUG] [{self.name}_agent] Raw Gemini response: {text!r}")
+        if not text or not text.strip():
+            metrics.llm_errors.inc(agent=self.name, error_type="EmptyResponse")
+            raise ValueError("Empty response from Gemini model.")
+        return text
+
+    def _parse_json(self, text: str):
+        try:
+            with metrics.timer(metrics.json_extract_seconds, f"json_{self.name}", agent=self.name):
+                value, method = parse_json_response(text)
+        except ValueError:
+            metrics.llm_errors.inc(agent=self.name, error_type="UnparseableJSON")
+            raise
+        metrics.json_parse_methods.inc(agent=self.name, method=method)
+        return value
+
+    def _validate(self, value) -> dict:
+        if self.name not in AGENT_OUTPUT_MODELS:
+            return value
+        try:
+            return validate_agent_output(self.name, value)
+        except ValueError:
+            metrics.llm_errors.inc(agent=self.name, error_type="SchemaMismatch")
+            raise
+
+    def _parse_response(self, response) -> dict:
+        return self._validate(self._parse_json(self._response_text(response)))
+
+    def _reask_prompt(self, response, error: Exception):
+        """
+        A short follow-up asking the model to fix a reply that could not be
+        parsed or validated, instead of re-running the whole evaluation.
+        Returns None when there is nothing to fix.
+        """
+        if not PARSE_REASK_ATTEMPTS or self.name not in AGENT_OUTPUT_MODELS:
+            return None
+        try:
+            text = response.text
+        except ValueError:
+            return None
+        if not text or not text.strip():
+            return None
+        metrics.llm_retries.inc(agent=self.name, reason="reask")
+        return REASK_PROMPT.format(
+            error=error, fields=describe_agent_output(self.name), response=text[:REASK_MAX_RESPONSE_CHARS]
+        )
+
+    def _generate(self, prompt: str, kind: str = "single"):
+        def attempt():
+            self.stats["llm_requests"] += 1
+            model, system_instruction = self._model_for(kind)
+            with metrics.LLMCall(self.name, prompt, kind=kind, system_instruction=system_instruction) as call:
+                response = model.generate_content(
+                    prompt, generation_config=self.generation_config(),
+                    request_options={"timeout": resilience.LLM_TIMEOUT_SECONDS}
+                )
+                call.response(response)
+            self._record_usage(call)
+            return response
+        return resilience.call_with_retries(self.name, attempt)
+
+    async def _agenerate_response(self, prompt: str, kind: str = "single", generation_config=None):
+        async def attempt():
+            self.stats["llm_requests"] += 1
+            model, system_instruction = self._model_for(kind)
+            with metrics.LLMCall(self.name, prompt, kind=kind, system_instruction=system_instruction) as call:
+                response = await model.generate_content_async(
+                    prompt, generation_config=generation_config or self.generation_config()
+                )
+                call.response(response)
+            self._record_usage(call)
+            return response
+        return await resilience.acall_with_retries(self.name, attempt)
+
+    def _model_for(self, kind: str) -> tuple:
+        if kind == "cascade":
+            return self.cascade_model, self.cascade_system_instruction
+        return self.model, self.system_instruction
+
+    def cascade_prompt(self, prompt: str) -> str:
+        if self.cascade_system_instruction is None:
+            return f"{prompt}\n\n{CONFIDENCE_INSTRUCTION}"
+        return prompt
+
+    def _cascade_outcome(self, outcome: str):
+        metrics.llm_cascade.inc(agent=self.name, outcome=outcome)
+        if outcome == "accepted":
+            self.cascade_stats["accepted"] += 1
+        else:
+            escalated = self.cascade_stats["escalated"]
+            escalated[outcome] = escalated.get(outcome, 0) + 1
+
+    def _cascade_feedback(self, response):
+        """
+        The cascade model's reply if it can be kept, else None after counting
+        why it is escalated: invalid, inconsistent or low_confidence.
+        """
+        self.cascade_stats["answers"] += 1
+        try:
+            feedback = self._parse_response(response)
+        except ValueError:
+            self._cascade_outcome("invalid")
+            return None
+        confidence = feedback.pop("confidence", None)
+        if agent_output_conflict(self.name, feedback):
+            self._cascade_outcome("inconsistent")
+            return None
+        try:
+            confident = float(confidence) >= CASCADE_MIN_CONFIDENCE
+        except (TypeError, ValueError):
+            confident = False
+        if not confident:
+            self._cascade_outcome("low_confidence")
+            return None
+        self._cascade_outcome("accepted")
+        return {**feedback, "answered_by": self.cascade_model_name}
+
+    def _answered_by_model(self, feedback: dict) -> dict:
+        return {**feedback, "answered_by": self.model_name} if self.cascade_model_name else feedback
+
+    def _answer(self, prompt: str) -> dict:
+        response = self._generate(prompt)
+        for attempt in range(PARSE_REASK_ATTEMPTS + 1):
+            try:
+                return self._answered_by_model(self._parse_response(response))
+            except ValueError as e:
+                reask = self._reask_prompt(response, e) if attempt < PARSE_REASK_ATTEMPTS else None
+                if reask is None:
+                    raise
+                response = self._generate(reask, kind="reask")
+
+    def run(self, question_text: str) -> dict:
+        prompt, cache_key = self.build_request(question_text)
+        cached = get_cached_feedback(cache_key, self.name)
+        if cached is not None:
+            return cached
+        feedback = None
+        if self.cascade_model_name:
+            try:
+                feedback = self._cascade_feedback(self._generate(self.cascade_prompt(prompt), kind="cascade"))
+            except Exception as e:
+                print(f"[{self.name}_agent] Cascade model failed, escalating: {e}")
+                self._cascade_outcome("error")
+        if feedback is None:
+            feedback = self._answer(prompt)
+        store_feedback(cache_key, feedback)
+        return feedback
+
+    async def arun(self, question_text: str) -> dict:
+        prompt, cache_key = self.build_request(question_text)
+        cached = await aget_cached_feedback(cache_key, self.name)
+        if cached is not None:
+            return cached
+        feedback = None
+        if self.cascade_model_name:
+            # Cascade calls are not micro-batched; escalations are.
+            try:
+                feedback = self._cascade_feedback(await self._agenerate_response(self.cascade_prompt(prompt), kind="cascade"))
+            except Exception as e:
+                print(f"[{self.name}_agent] Cascade model failed, escalating: {e}")
+                self._cascade_outcome("error")
+        if feedback is None:
+            if self.batch_size > 1:
+                feedback = self._answered_by_model(await self._get_batcher().submit(question_text))
+            else:
+                feedback = await self._agenerate(prompt)
+        await astore_feedback(cache_key, feedback)
+        return feedback
+
+    def escalate(self, question_text: str, feedback: dict) -> dict:
+        """
+        Answers again with the agent's own model if `feedback` came from the
+        cascade model, for a reply that disagrees with another agent's.
+        Returns `feedback` unchanged otherwise, or if that call fails.
+        """
+        if not self.cascade_model_name or feedback.get("answered_by") != self.cascade_model_name:
+            return feedback
+        self._cascade_outcome("disagreement")
+        prompt, cache_key = self.build_request(question_text)
+        try:
+            escalated = self._answer(prompt)
+        except Exception as e:
+            print(f"[{self.name}_agent] Escalation failed, keeping the cascade model's answer: {e}")
+            return feedback
+        store_feedback(cache_key, escalated)
+        return escalated
+
+    async def aescalate(self, question_text: str, feedback: dict) -> dict:
+        if not self.cascade_model_name or feedback.get("answered_by") != self.cascade_model_name:
+            return feedback
+        self._cascade_outcome("disagreement")
+        prompt, cache_key = self.build_request(question_text)
+        try:
+            escalated = await self._agenerate(prompt)
+        except Exception as e:
+            print(f"[{self.name}_agent] Escalation failed, keeping the cascade model's answer: {e}")
+            return feedback
+        await astore_feedback(cache_key, escalated)
+        return escalated
+
+    def _get_batcher(self) -> MicroBatcher:
+        # A batcher's timers and futures belong to one event loop.
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.loop is not loop:
+            self._batcher = MicroBatcher(self, self.batch_size, self.batch_window_seconds)
+        return self._batcher
+
+    async def _agenerate(self, prompt: str) -> dict:
+        response = await self._agenerate_response(prompt)
+        for attempt in range(PARSE_REASK_ATTEMPTS + 1):
+            try:
+                return self._answered_by_model(self._parse_response(response))
+            except ValueError as e:
+                reask = self._reask_prompt(response, e) if attempt < PARSE_REASK_ATTEMPTS else None
+                if reask is None:
+                    raise
+                response = await self._agenerate_response(reask, kind="reask")
+
+    async def _agenerate_batch(self, questions: list) -> list:
+        """
+        Asks for all questions in one prompt. Returns one feedback dict per
+        question, or None where the array entry was unusable. A question over
+        the prompt budget on its own is left out of the prompt and gets None,
+        so its single call raises TokenBudgetExceeded.
+        """
+        template = get_prompt(self.prompt_name)
+        within_budget = [index for index, question_text in enumerate(questions)
+                         if not self.over_budget(template, template.render(question_text=question_text))]
+        results = [None] * len(questions)
+        if not within_budget:
+            return results
+        batch = [questions[index] for index in within_budget]
+        block = BATCH_QUESTION_BLOCK.format(
+            count=len(batch), questions=json.dumps(batch, ensure_ascii=False, indent=2)
+        )
+        prompt = template.render(question_text=block)
+        self.stats["batched_requests"] += 1
+        self.stats["batched_questions"] += len(batch)
+        response = await self._agenerate_response(prompt, kind="batch", generation_config=self.generation_config(len(batch)))
+        parsed = self._parse_json(self._response_text(response))
+        if not isinstance(parsed, list) or len(parsed) != len(batch):
+            raise ValueError(f"Expected a JSON array of {len(batch)} results")
+        unusable = 0
+        for index, item in zip(within_budget, parsed):
+            try:
+                results[index] = self._validate(item)
+            except ValueError:
+                unusable += 1
+        self.stats["batch_fallbacks"] += unusable
+        if unusable:
+            metrics.llm_retries.inc(unusable, agent=self.name, reason="batch_entry_unusable")
+        return results
@@ -1,40 +1,12 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-from utils import load_prompt
-from response_cleaner import extract_clean_json
+from agent_runtime import AgentClient
 
+client = AgentClient("improvement", prompt_name="improvement_prompt", temperature=0.2,
+                     max_prompt_tokens=2500, max_output_tokens=2048)
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-
+# Failures are raised rather than turned into feedback, so the graph node
+# records them in the state's errors and the result is not stored as a version.
 def improvement_agent(question_text: str) -> dict:
-    prompt_template = load_prompt("improvement_prompt")
-    prompt = prompt_template.format(question_text=question_text)
+    return client.run(question_text)
 
-    model = genai.GenerativeModel(GEMINI_MODEL)
-    generation_config = genai.types.GenerationConfig(
-        temperature=0.2,
-    )
-    try:
-        response = model.generate_content(prompt, generation_config=generation_config)
-        print(f"[improvement_agent] Raw Gemini response: {response.text!r}")
-        if not response.text or not response.text.strip():
-            raise ValueError("Empty response from Gemini model.")
-        try:
-            feedback = extract_clean_json(response.text)
-        except Exception as e:
-            print("Error in improvement_agent:", e)
-            return {
-                "improved_question": question_text,
-                "justification": f"An error occurred during AI processing: {e}"
-            }
-        return feedback
-    except Exception as e:
-        print(f"Error in improvement_agent: {e}")
-        return {
-            "improved_question": question_text,
-            "justification": f"An error occurred during AI processing: {e}"
-        }
+async def improvement_agent_async(question_text: str) -> dict:
+    return await client.arun(question_text)
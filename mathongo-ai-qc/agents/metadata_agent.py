@@ -1,46 +1,12 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-from utils import load_prompt
-from response_cleaner import extract_clean_json
+from agent_runtime import AgentClient
 
+client = AgentClient("metadata", prompt_name="metadata_prompt", temperature=0.1,
+                     max_prompt_tokens=1500, max_output_tokens=256)
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-
+# Failures are raised rather than turned into feedback, so the graph node
+# records them in the state's errors and the result is not stored as a version.
 def metadata_agent(question_text: str) -> dict:
-    prompt_template = load_prompt("metadata_prompt")
-    prompt = prompt_template.format(question_text=question_text)
+    return client.run(question_text)
 
-    model = genai.GenerativeModel(GEMINI_MODEL)
-    generation_config = genai.types.GenerationConfig(
-        temperature=0.1,
-    )
-    try:
-        response = model.generate_content(prompt, generation_config=generation_config)
-        print(f"[metadata_agent] Raw Gemini response: {response.text!r}")
-        if not response.text or not response.text.strip():
-            raise ValueError("Empty response from Gemini model.")
-        try:
-            feedback = extract_clean_json(response.text)
-        except Exception as e:
-            print("Error in metadata_agent:", e)
-            return {
-                "topic": "Error",
-                "subtopic": "Error",
-                "blooms_level": "Error",
-                "difficulty": "Error",
-                "errors": ["LLM processing error or invalid JSON output.", str(e)]
-            }
-        return feedback
-    except Exception as e:
-        print(f"Error in metadata_agent: {e}")
-        return {
-            "topic": "Error",
-            "subtopic": "Error",
-            "blooms_level": "Error",
-            "difficulty": "Error",
-            "errors": ["LLM processing error or invalid JSON output.", str(e)]
-        }
+async def metadata_agent_async(question_text: str) -> dict:
+    return await client.arun(question_text)
@@ -0,0 +1,259 @@
+import asyncio
+import csv
+import io
+import json
+import time
+import uuid
+from datetime import datetime
+
+import scheduling
+import similarity
+from config import settings
+from langgraph_flow import get_app, initial_question_state, QuestionProcessingError
+from result_cache import normalize_question_text
+from schemas import question_version_from_row
+from utils import (
+    append_question_versions_bulk_async, find_similar_versions_async,
+    get_question_versions_async
+)
+
+BATCH_WORKERS = settings.batch_workers
+BATCH_MAX_WORKERS = settings.batch_max_workers
+# Questions started per second across the whole batch; 0 disables the limit.
+BATCH_RATE_PER_SECOND = settings.batch_rate_per_second
+# A new question at least this similar to an already processed one reuses
+# that question's feedback instead of calling Gemini; 0 disables reuse.
+SIMILAR_REUSE_THRESHOLD = settings.similar_reuse_threshold
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket allowing `rate` acquisitions per second, with bursts of up to
+    `burst` acquisitions after an idle period.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_batch_file(filename: str, content: bytes, default_created_by: str) -> list:
+    """
+    Reads questions from an uploaded .csv (with a question_text column) or
+    .jsonl file (one {"question_text": ...} object per line). A per-row
+    created_by overrides the default.
+    """
+    text = content.decode("utf-8-sig")
+    items = []
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number} is not valid JSON: {e}")
+            if not isinstance(record, dict) or not record.get("question_text"):
+                raise ValueError(f"Line {line_number} has no question_text")
+            items.append({
+                "question_text": record["question_text"],
+                "created_by": record.get("created_by") or default_created_by
+            })
+    elif filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "question_text" not in reader.fieldnames:
+            raise ValueError("CSV file must have a question_text column")
+        for row in reader:
+            if not row.get("question_text"):
+                continue
+            items.append({
+                "question_text": row["question_text"],
+                "created_by": row.get("created_by") or default_created_by
+            })
+    else:
+        raise ValueError("Upload a .csv or .jsonl file")
+    return items
+
+
+def submitted_question_version(question_id: str, question_text: str, created_by: str) -> dict:
+    return {
+        "question_id": question_id,
+        "original_text": question_text,
+        "created_by": created_by,
+        "version_number": 1,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def ai_question_version(question_id: str, question_text: str, processed_question_text: str, final_state: dict,
+                        version_number: int = 2) -> dict:
+    return {
+        "question_id": question_id,
+        "original_text": question_text,
+        "created_by": "AI",
+        "version_number": version_number,
+        "improved_text": processed_question_text,
+        "correctness_feedback": final_state.get("correctness_feedback", {}),
+        "language_feedback": final_state.get("language_feedback", {}),
+        "improvement_feedback": final_state.get("improvement_feedback", {}),
+        "metadata_feedback": final_state.get("metadata_feedback", {}),
+        "stage_fingerprints": final_state.get("stage_fingerprints", {}),
+        "route": final_state.get("route")
+    }
+
+
+def previous_stages_from_version(version: dict, stage_fingerprints: dict) -> dict:
+    """
+    The stage outputs stored in an AI version, with the fingerprint of the
+    inputs each was produced from (None for versions stored before fingerprints).
+    """
+    model = question_version_from_row(version)
+    outputs = {
+        "correctness": model.correctness_feedback,
+        "language": model.language_feedback,
+        "improvement": model.improvement_feedback,
+        "metadata": model.metadata,
+    }
+    previous = {
+        stage: {"output": output.model_dump(), "fingerprint": stage_fingerprints.get(stage)}
+        for stage, output in outputs.items() if output is not None
+    }
+    # The flag is not a stored column; the route it produced is.
+    if model.route == "needs_human" and "correctness" in previous:
+        previous["correctness"]["output"]["needs_human_review"] = True
+    return previous
+
+
+async def similar_processed_stages(question_text: str):
+    """
+    (question_id, previous_stages) of the latest AI version of a stored
+    question whose submitted text is at least SIMILAR_REUSE_THRESHOLD similar
+    to `question_text`, or None. Its correctness verdict and rewrite are only
+    included when the normalized texts are equal: a question that differs in
+    a number or an option letter can score as near-identical.
+    """
+    for match in await find_similar_versions_async(question_text, SIMILAR_REUSE_THRESHOLD, limit=5):
+        ai_versions = [version for version in await get_question_versions_async(match["question_id"])
+                       if version["created_by"] == "AI"]
+        if not ai_versions:
+            continue
+        # The match may be on an improved text; the feedback is about the submitted one.
+        base = ai_versions[-1]
+        if similarity.jaccard(question_text, base["original_text"]) < SIMILAR_REUSE_THRESHOLD:
+            continue
+        previous_stages = previous_stages_from_version(base, {})
+        if normalize_question_text(question_text) != normalize_question_text(base["original_text"]):
+            for stage in ("correctness", "improvement"):
+                previous_stages.pop(stage, None)
+        return base["question_id"], previous_stages
+    return None
+
+
+async def similar_reuse(question_text: str):
+    """
+    (source_question_id, previous_stages) for a new question to reuse, with
+    only_stages=[] and reused_from=source_question_id, or None when
+    QC_SIMILAR_REUSE_THRESHOLD is off or no processed question is near-identical.
+    """
+    if SIMILAR_REUSE_THRESHOLD <= 0:
+        return None
+    match = await similar_processed_stages(question_text)
+    if match:
+        print(f"[SIMILAR] Reusing the feedback of near-identical question {match[0]}")
+    return match
+
+
+async def run_question(question_text: str, previous_stages: dict = None, only_stages: list = None):
+    """
+    Runs one question through the QC graph. Returns (processed_question_text, final_state),
+    or raises QuestionProcessingError if any stage failed. `previous_stages` and
+    `only_stages` let a reprocessed question reuse stage outputs (see reprocessing.py).
+    Otherwise a new question reuses a near-identical one's stages (similar_reuse()).
+    """
+    reused_from = None
+    if previous_stages is None:
+        match = await similar_reuse(question_text)
+        if match:
+            reused_from, previous_stages, only_stages = match[0], match[1], []
+    final_state = await get_app().ainvoke(initial_question_state(question_text, previous_stages, only_stages, reused_from))
+    if final_state.get("errors"):
+        raise QuestionProcessingError(final_state["errors"])
+    return final_state.get("question_text", question_text), final_state
+
+
+async def process_batch(items: list, workers: int = None, rate_per_second: float = None) -> list:
+    """
+    Runs every {"question_text", "created_by"} item through the QC graph with
+    a bounded worker pool, then stores all resulting versions in one bulk
+    transaction. Model calls are scheduled as bulk traffic of each item's
+    created_by. Results are returned in input order.
+    """
+    workers = max(1, min(workers or BATCH_WORKERS, BATCH_MAX_WORKERS, len(items) or 1))
+    rate_per_second = BATCH_RATE_PER_SECOND if rate_per_second is None else rate_per_second
+    limiter = AsyncRateLimiter(rate_per_second) if rate_per_second > 0 else None
+
+    queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+
+    results = [None] * len(items)
+    versions = []
+
+    async def worker():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if limiter:
+                await limiter.acquire()
+
+            question_id = str(uuid.uuid4())
+            submitted_version = submitted_question_version(question_id, item["question_text"], item["created_by"])
+            try:
+                with scheduling.traffic("bulk", item["created_by"]):
+                    processed_question_text, final_state = await run_question(item["question_text"])
+            except Exception as e:
+                print(f"[BATCH] Item {index} failed: {e}")
+                versions.append(submitted_version)
+                results[index] = {
+                    "index": index,
+                    "question_id": question_id,
+                    "status": "failed",
+                    "version_number": 1,
+                    "original_question": item["question_text"],
+                    "processed_question": None,
+                    "errors": getattr(e, "errors", [str(e)])
+                }
+                continue
+
+            versions.append(submitted_version)
+            versions.append(ai_question_version(question_id, item["question_text"], processed_question_text, final_state))
+            results[index] = {
+                "index": index,
+                "question_id": question_id,
+                "status": "ok",
+                "version_number": 2,
+                "original_question": item["question_text"],
+                "processed_question": processed_question_text,
+                "errors": final_state.get("errors", [])
+            }
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if versions:
+        await append_question_versions_bulk_async(versions)
+    return results
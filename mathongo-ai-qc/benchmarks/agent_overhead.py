@@ -0,0 +1,68 @@
+"""
+Measures the per-call setup cost of an agent request: the old path that
+re-read the prompt file and rebuilt the Gemini client on every call, the
+compiled templates from agent_runtime.get_prompt() with a client still
+rebuilt per call, and the shared AgentClient that builds both once.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.agent_overhead --calls 2000
+"""
+import argparse
+import hashlib
+import os
+import time
+
+import google.generativeai as genai
+
+from agent_runtime import AgentClient, GEMINI_MODEL, PROMPTS_DIR, get_prompt
+from result_cache import make_cache_key
+
+QUESTION = "A train travels 120 km in 2 hours. What is its average speed? (A) 40 km/h (B) 60 km/h (C) 80 km/h"
+
+
+def per_call_setup(question_text: str):
+    # The loader agents used before agent_runtime: one file read per call.
+    with open(os.path.join(PROMPTS_DIR, "correctness_prompt.txt"), "r", encoding="utf-8") as f:
+        prompt_template = f.read()
+    prompt = prompt_template.format(question_text=question_text)
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    generation_config = genai.types.GenerationConfig(temperature=0.7)
+    template_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    cache_key = make_cache_key("correctness", question_text, template_hash, GEMINI_MODEL, 0.7)
+    return model, prompt, generation_config, cache_key
+
+
+def per_call_client(question_text: str):
+    template = get_prompt("correctness_prompt")
+    prompt = template.render(question_text=question_text)
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    generation_config = genai.types.GenerationConfig(temperature=0.7)
+    cache_key = make_cache_key("correctness", question_text, template.sha256, GEMINI_MODEL, 0.7)
+    return model, prompt, generation_config, cache_key
+
+
+def time_calls(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(QUESTION)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = AgentClient("correctness", prompt_name="correctness_prompt", temperature=0.7)
+    before = time_calls(per_call_setup, args.calls)
+    templates_only = time_calls(per_call_client, args.calls)
+    after = time_calls(client.build_request, args.calls)
+    print(f"per-call setup (old):   {before * 1e6:8.1f} us")
+    print(f"get_prompt, new client: {templates_only * 1e6:8.1f} us")
+    print(f"shared AgentClient:     {after * 1e6:8.1f} us")
+    print(f"speedup:                {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
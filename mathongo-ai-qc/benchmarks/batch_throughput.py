@@ -0,0 +1,55 @@
+"""
+Compares processing a question bank one /process_question/ call at a time with
+a single /process_questions/batch call, using fixed-latency stub agents.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.batch_throughput --questions 1000 --workers 32 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.stubs import install_stub_agents, use_scratch_store
+
+
+async def main_async(args):
+    import main
+
+    items = [{"question_text": f"solve x + {i} = {2 * i}", "created_by": "bench"} for i in range(args.questions)]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        single = items[:args.single_sample]
+        start = time.perf_counter()
+        for item in single:
+            (await client.post("/process_question/", json=item)).raise_for_status()
+        single_rate = len(single) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = await client.post("/process_questions/batch", json={"items": items, "workers": args.workers})
+        response.raise_for_status()
+        batch_rate = args.questions / (time.perf_counter() - start)
+
+    body = response.json()
+    print(f"one request per question: {single_rate:8.2f} questions/s (sampled {len(single)})")
+    print(f"batch endpoint:           {batch_rate:8.2f} questions/s ({body['succeeded']}/{body['total']} ok, workers={args.workers})")
+    print(f"estimated {args.questions}-question bank: {args.questions / single_rate:.1f}s -> {args.questions / batch_rate:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each stubbed LLM call takes.")
+    parser.add_argument("--single-sample", type=int, default=10, help="Questions sent through /process_question/ for the baseline.")
+    args = parser.parse_args()
+
+    use_scratch_store()
+    install_stub_agents(args.latency)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
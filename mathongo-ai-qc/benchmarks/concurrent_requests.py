@@ -0,0 +1,56 @@
+"""
+Measures /process_question/ throughput under N concurrent clients with the
+Gemini-backed agents replaced by fixed-latency async stubs.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.concurrent_requests --latency 0.2 --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.stubs import install_stub_agents, use_scratch_store
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, requests_per_client: int) -> float:
+    async def client_loop(client_id: int):
+        for i in range(requests_per_client):
+            response = await client.post(
+                "/process_question/",
+                json={"question_text": f"solve x + {client_id} = {i}", "created_by": "bench"},
+            )
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(c) for c in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return concurrency * requests_per_client / elapsed
+
+
+async def main_async(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            throughput = await run_level(client, concurrency, args.requests)
+            print(f"concurrency={concurrency:>3}: {throughput:7.2f} questions/s (cap={main.MAX_CONCURRENT_QUESTIONS})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each stubbed LLM call takes.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=5, help="Requests issued by each concurrent client.")
+    args = parser.parse_args()
+
+    use_scratch_store()
+    install_stub_agents(args.latency)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Appends versions to one database from several processes at once, each with
+many concurrent async writers that let the store allocate version numbers,
+as uvicorn workers and job workers do. Compares one transaction per append
+with the group-commit writer, and checks afterwards that every question's
+version numbers are unique and contiguous.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.concurrent_writes --processes 1 2 4 8 --writes 500
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import utils
+from benchmarks.stubs import STUB_FEEDBACK
+
+
+def _version(question_id: str, i: int) -> dict:
+    return {
+        "question_id": question_id,
+        "original_text": f"solve x + {i} = {2 * i}",
+        "created_by": "AI",
+        "improved_text": f"Solve for x: x + {i} = {2 * i}",
+        "correctness_feedback": STUB_FEEDBACK["correctness"],
+        "language_feedback": STUB_FEEDBACK["language"],
+        "improvement_feedback": STUB_FEEDBACK["improvement"],
+        "metadata_feedback": STUB_FEEDBACK["metadata"],
+    }
+
+
+async def _write_all(mode: str, writes: int, concurrency: int, question_ids: list):
+    pending = iter(range(writes))
+
+    async def writer():
+        for i in pending:
+            version = _version(question_ids[i % len(question_ids)], i)
+            if mode == "group":
+                await utils.append_question_version_async(**version)
+            else:
+                await asyncio.to_thread(utils.append_question_version, **version)
+
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+
+
+def _process_main(db_file: str, mode: str, writes: int, concurrency: int, question_ids: list, ready, spans):
+    utils.DB_FILE = db_file
+    utils.get_connection()
+    ready.wait()
+    start = time.time()
+    asyncio.run(_write_all(mode, writes, concurrency, question_ids))
+    spans.put((start, time.time()))
+
+
+def check_versions(db_file: str, question_count: int, total: int):
+    conn = utils.get_connection()
+    rows = conn.execute(
+        "SELECT question_id, COUNT(*) AS n, COUNT(DISTINCT version_number) AS distinct_n, MAX(version_number) AS top "
+        "FROM question_versions GROUP BY question_id"
+    ).fetchall()
+    stored = sum(row["n"] for row in rows)
+    broken = [row["question_id"] for row in rows if not row["n"] == row["distinct_n"] == row["top"]]
+    if stored != total or len(rows) != question_count or broken:
+        raise SystemExit(f"Integrity check failed: {stored}/{total} rows, {len(broken)} questions with gaps or duplicates")
+
+
+def run(processes: int, mode: str, args) -> float:
+    db_file = os.path.join(tempfile.mkdtemp(), "question_versions.db")
+    utils.DB_FILE = db_file
+    utils.initialize_storage()
+    question_ids = [f"question-{n}" for n in range(args.questions)]
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(processes)
+    spans = context.Queue()
+    workers = [
+        context.Process(target=_process_main,
+                        args=(db_file, mode, args.writes, args.concurrency, question_ids, ready, spans))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    # Each process reports when its writes started and ended, so interpreter
+    # start-up and shutdown are not timed.
+    timings = [spans.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            raise SystemExit(f"Writer process exited with {worker.exitcode}")
+    elapsed = max(end for _, end in timings) - min(start for start, _ in timings)
+
+    check_versions(db_file, args.questions, processes * args.writes)
+    return processes * args.writes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writes", type=int, default=500, help="Appends per process.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent writers per process.")
+    parser.add_argument("--questions", type=int, default=20, help="Questions the appends are spread over.")
+    args = parser.parse_args()
+
+    print(f"{'processes':>9}  {'per-append txn':>15}  {'group commit':>13}")
+    for processes in args.processes:
+        single = run(processes, "single", args)
+        group = run(processes, "group", args)
+        print(f"{processes:>9}  {single:>13.0f}/s  {group:>11.0f}/s")
+    print("\nVersion numbers were unique and contiguous for every question in every run.")
+
+
+if __name__ == "__main__":
+    main()
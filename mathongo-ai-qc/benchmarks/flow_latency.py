@@ -0,0 +1,45 @@
+"""
+Compares per-question latency of the sequential and parallel LangGraph flows
+with the Gemini-backed agents replaced by fixed-latency stubs.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.flow_latency --latency 0.5 --runs 20
+"""
+import argparse
+import statistics
+import time
+
+import langgraph_flow
+from benchmarks.stubs import install_stub_agents
+
+
+def measure(flow_app, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        flow_app.invoke(langgraph_flow.initial_question_state("solve x + 3 = 7"))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds each stubbed LLM call takes.")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    install_stub_agents(args.latency)
+
+    results = {}
+    for mode, dependencies in langgraph_flow.PIPELINE_MODES.items():
+        timings = measure(langgraph_flow.build_workflow(dependencies, routing=False), args.runs)
+        results[mode] = statistics.median(timings)
+        print(f"{mode:>10}: p50={results[mode]:.3f}s  max={max(timings):.3f}s  ({args.runs} runs)")
+
+    saved = results["sequential"] - results["parallel"]
+    print(f"p50 saved: {saved:.3f}s ({saved / args.latency:.2f} stubbed LLM round trips)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measures /process_question/ latency for one teacher while bulk batches keep
+the model busy, on the mock backend behind a scheduler of --max-concurrency
+slots (standing in for the Gemini quota):
+
+- idle: the interactive requests alone.
+- fifo: with the batches running, every call in one first-come queue, as
+  before calls had a priority class.
+- priority: with the batches running, interactive calls first, bulk capped
+  at QC_SCHEDULER_BULK_SHARE of the slots and bulk calls taken round-robin
+  by created_by.
+
+The batches are a large import by one author and a small upload by another
+(--small-questions), started together; "small batch" is how long the second
+author waited for theirs. "bulk calls/s" is the bulk throughput while the
+interactive requests ran.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.llm_scheduling --max-concurrency 8 --latency-ms 200 --requests 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import scheduling
+from benchmarks.stubs import use_mock_backend, use_scratch_store
+
+CURRENT_TRAFFIC = scheduling.current_traffic
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def post_batch(client, author: str, count: int, workers: int, tag: str) -> float:
+    items = [{"question_text": f"{tag}: {author} question {i}, solve x + {i} = {2 * i}", "created_by": author}
+             for i in range(count)]
+    start = time.perf_counter()
+    (await client.post("/process_questions/batch", json={"items": items, "workers": workers})).raise_for_status()
+    return time.perf_counter() - start
+
+
+async def interactive(client, requests: int, interval: float, tag: str) -> list:
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        response = await client.post("/process_question/", json={
+            "question_text": f"{tag}: teacher question {i}, what is {i} + {i}?", "created_by": "teacher"
+        })
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run_mode(app, mode: str, args) -> dict:
+    # Texts are unique per mode, so no answer comes from the result cache.
+    bulk_share = 1.0 if mode == "fifo" else scheduling.SCHEDULER_BULK_SHARE
+    scheduling.scheduler = scheduling.Scheduler(args.max_concurrency, bulk_share, args.rate, max(1.0, args.rate))
+    if mode == "fifo":
+        scheduling.current_traffic = lambda: ("bulk", "")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        bulk = []
+        if mode != "idle":
+            bulk = [asyncio.create_task(post_batch(client, "importer", args.bulk_questions, args.bulk_workers, mode)),
+                    asyncio.create_task(post_batch(client, "other-author", args.small_questions, args.small_workers, mode))]
+            await asyncio.sleep(args.head_start)
+        bulk_calls = scheduling.scheduler.stats["bulk"]["calls"]
+        start = time.perf_counter()
+        latencies = await interactive(client, args.requests, args.interval, mode)
+        bulk_rate = (scheduling.scheduler.stats["bulk"]["calls"] - bulk_calls) / (time.perf_counter() - start)
+        small_batch = bulk[1].result() if bulk and bulk[1].done() else None
+        # Stopping the import mid-batch leaves cancelled gathers nobody awaits; they are not errors here.
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: None)
+        for task in bulk:
+            task.cancel()
+        await asyncio.gather(*bulk, return_exceptions=True)
+    scheduling.current_traffic = CURRENT_TRAFFIC
+    return {"latencies": latencies, "bulk_rate": bulk_rate, "small_batch": small_batch,
+            "snapshot": scheduling.scheduler.snapshot()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="Scheduler calls per second; 0 for none.")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="Interactive requests per mode, one at a time.")
+    parser.add_argument("--interval", type=float, default=0.25, help="Seconds between interactive requests.")
+    parser.add_argument("--bulk-questions", type=int, default=2000)
+    parser.add_argument("--bulk-workers", type=int, default=32)
+    parser.add_argument("--small-questions", type=int, default=20)
+    parser.add_argument("--small-workers", type=int, default=4)
+    parser.add_argument("--head-start", type=float, default=1.0, help="Seconds the batches run before the first interactive request.")
+    args = parser.parse_args()
+
+    use_scratch_store()
+    use_mock_backend(args.latency_ms)
+    import main
+
+    print(f"{'mode':>9}  {'p50':>7}  {'p95':>7}  {'max':>7}  {'bulk calls/s':>12}  {'small batch':>11}  {'mean slot wait':>14}")
+    for mode in ("idle", "fifo", "priority"):
+        result = asyncio.run(run_mode(main.app, mode, args))
+        latencies = result["latencies"]
+        if mode == "idle":
+            small_batch = "-"
+        else:
+            small_batch = f"{result['small_batch']:.1f}s" if result["small_batch"] is not None else "unfinished"
+        waits = ", ".join(f"{priority} {stats['mean_wait_seconds'] * 1e3:.0f}ms"
+                          for priority, stats in result["snapshot"]["classes"].items() if stats["calls"])
+        print(f"{mode:>9}  {statistics.median(latencies) * 1e3:>5.0f}ms  {percentile(latencies, 0.95) * 1e3:>5.0f}ms  "
+              f"{max(latencies) * 1e3:>5.0f}ms  {result['bulk_rate']:>12.1f}  {small_batch:>11}  {waits}")
+
+
+if __name__ == "__main__":
+    main()
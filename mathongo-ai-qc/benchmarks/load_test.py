@@ -0,0 +1,189 @@
+"""
+Load test of the whole pipeline against the mock model backend: drives
+/process_question/ (through the ASGI app) and the LangGraph app directly at
+each concurrency level, on version stores preloaded with each history size.
+Reports throughput, p50/p95/p99 latency, errors and memory per run.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --history 0 10000 --latency-ms 200
+
+--output appends one JSON line per run, tagged with the current commit, so
+results can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+import langgraph_flow
+import utils
+from benchmarks.stubs import STUB_FEEDBACK, use_mock_backend, use_scratch_store
+
+
+def preload_history(rows: int):
+    """
+    Fills the store with `rows` versions: a submitted and an AI version per question.
+    """
+    batch = []
+    for i in range(rows):
+        question_id = batch[-1]["question_id"] if i % 2 else str(uuid.uuid4())
+        batch.append({
+            "question_id": question_id,
+            "original_text": f"History question {i // 2}: solve x + {i} = {2 * i}",
+            "created_by": "AI" if i % 2 else "history",
+            "version_number": i % 2 + 1,
+            "improved_text": f"Solve for x: x + {i} = {2 * i}",
+            "correctness_feedback": STUB_FEEDBACK["correctness"] if i % 2 else {},
+            "language_feedback": STUB_FEEDBACK["language"] if i % 2 else {},
+            "improvement_feedback": STUB_FEEDBACK["improvement"] if i % 2 else {},
+            "metadata_feedback": STUB_FEEDBACK["metadata"] if i % 2 else {},
+        })
+        if len(batch) >= 5000 and i % 2:
+            utils.append_question_versions_bulk(batch)
+            batch = []
+    if batch:
+        utils.append_question_versions_bulk(batch)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def run_level(send, concurrency: int, requests: int, label: str) -> dict:
+    """
+    Issues `requests` calls to `send(question_text)` from `concurrency` concurrent clients.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client_loop():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await send(f"{label} question {i}: solve x + {i} = {3 * i}")
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+async def run_graph(question_text: str):
+    final_state = await langgraph_flow.get_app().ainvoke(langgraph_flow.initial_question_state(question_text))
+    if final_state.get("errors"):
+        raise RuntimeError("; ".join(final_state["errors"]))
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main_async(args) -> list:
+    import main
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def run_api(question_text: str):
+            response = await client.post("/process_question/", json={"question_text": question_text, "created_by": "bench"})
+            response.raise_for_status()
+
+        targets = {"api": run_api, "graph": run_graph}
+        for history in args.history:
+            use_scratch_store()
+            preload_history(history)
+            for mode in args.mode:
+                for concurrency in args.concurrency:
+                    if args.trace_memory:
+                        tracemalloc.start()
+                    result = await run_level(targets[mode], concurrency, args.requests,
+                                             label=f"{mode}-{history}-{concurrency}")
+                    if args.trace_memory:
+                        result["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+                        tracemalloc.stop()
+                    result.update(mode=mode, history=history, concurrency=concurrency,
+                                  rss_peak_mb=round(peak_rss_mb(), 1))
+                    results.append(result)
+                    print(f"{mode:>5}  {history:>8}  {concurrency:>5}  {result['throughput']:>8.2f}/s  "
+                          f"{result['p50_ms']:>8.1f}  {result['p95_ms']:>8.1f}  {result['p99_ms']:>8.1f}  "
+                          f"{result['errors']:>6}  {result['rss_peak_mb']:>8.1f}"
+                          + (f"  {result['py_peak_mb']:>8.1f}" if args.trace_memory else ""))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", nargs="+", choices=["api", "graph"], default=["api", "graph"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 10000],
+                        help="Versions preloaded into the store before each set of runs.")
+    parser.add_argument("--requests", type=int, default=200, help="Questions processed per run.")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mock model latency per call.")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls that return a 503.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="Also report peak Python allocations (slower).")
+    parser.add_argument("--output", help="Append results as JSON lines to this file.")
+    args = parser.parse_args()
+
+    use_mock_backend(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"mock latency {args.latency_ms:.0f}ms ± {args.jitter_ms:.0f}ms, error rate {args.error_rate:.0%}, "
+          f"{args.requests} questions per run\n")
+    print(f"{'mode':>5}  {'history':>8}  {'conc':>5}  {'throughput':>10}  {'p50 ms':>8}  {'p95 ms':>8}  "
+          f"{'p99 ms':>8}  {'errors':>6}  {'rss MB':>8}" + (f"  {'py MB':>8}" if args.trace_memory else ""))
+    results = asyncio.run(main_async(args))
+
+    if args.output:
+        run = {
+            "commit": current_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        }
+        with open(args.output, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps({**run, **result}) + "\n")
+        print(f"\nAppended {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
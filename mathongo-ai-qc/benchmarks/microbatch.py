@@ -0,0 +1,85 @@
+"""
+Compares LLM request count and per-question latency with and without agent
+micro-batching, against a fake Gemini model whose upstream only admits a few
+requests at a time (as under a rate-limited bulk import).
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.microbatch --questions 200 --batch-size 8 --upstream-slots 4
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+
+from agent_runtime import AgentClient
+
+FEEDBACK = {"topic": "Algebra", "subtopic": "Linear Equations", "blooms_level": "Apply", "difficulty": "Easy"}
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Answers after a fixed latency, with at most `slots` requests in flight.
+    Batched prompts get a JSON array with one entry per question.
+    """
+
+    def __init__(self, latency: float, slots: int):
+        self.latency = latency
+        self.slots = asyncio.Semaphore(slots)
+
+    async def generate_content_async(self, prompt: str, generation_config=None):
+        async with self.slots:
+            await asyncio.sleep(self.latency)
+        match = re.search(r"Number of questions: (\d+)", prompt)
+        payload = [FEEDBACK] * int(match.group(1)) if match else FEEDBACK
+        return FakeResponse(f"```json\n{json.dumps(payload)}\n```")
+
+
+async def run(batch_size: int, args) -> dict:
+    client = AgentClient("metadata", prompt_name="metadata_prompt", temperature=0.1, batch_size=batch_size,
+                         batch_window_ms=args.window_ms)
+    client.model = FakeModel(args.latency, args.upstream_slots)
+
+    async def one(i: int) -> float:
+        start = time.perf_counter()
+        await client.arun(f"Solve for x: x + {i} = {2 * i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(one(i) for i in range(args.questions))))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": client.stats["llm_requests"],
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds each fake Gemini request takes.")
+    parser.add_argument("--upstream-slots", type=int, default=4, help="Fake Gemini requests allowed in flight.")
+    args = parser.parse_args()
+
+    import result_cache
+    result_cache.CACHE_ENABLED = False
+
+    for label, batch_size in (("single calls", 1), (f"batches of {args.batch_size}", args.batch_size)):
+        result = asyncio.run(run(batch_size, args))
+        print(f"{label:>15}: {result['requests']:4d} LLM requests  p50={result['p50']:.2f}s  "
+              f"p95={result['p95']:.2f}s  total={result['elapsed']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Runs a mix of questions through the QC graph on a mock backend with two
+models, a fast cheap one and a slower strong one, first with every agent
+on the strong model and then with the cheap model cascading to it, and
+reports model calls, latency, estimated cost and why answers escalated.
+
+The cheap model's reply follows each question's kind:
+
+- easy: a confident, consistent answer, which the cascade keeps.
+- hard: the same answer with a confidence under QC_CASCADE_MIN_CONFIDENCE.
+- malformed: truncated JSON that fails validation.
+- inconsistent: contradicts itself, e.g. marked correct with errors listed.
+- disagree: correctness asks for a human while language finds no issue.
+
+The strong model answers every kind consistently. Cost counts the strong
+model's tokens at 1 and the cheap model's at --cost-ratio.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.model_cascade --questions 300 --hard-share 0.15 --cascade-latency-ms 150 --model-latency-ms 400
+"""
+import argparse
+import asyncio
+import collections
+import json
+import random
+import re
+import statistics
+import time
+
+import agent_runtime
+import langgraph_flow
+import llm_backends
+from agent_runtime import AGENT_CLIENTS
+
+CHEAP_MODEL = "cheap-model"
+STRONG_MODEL = "strong-model"
+KINDS = ("easy", "hard", "malformed", "inconsistent", "disagree")
+_KIND = re.compile(r"\b(" + "|".join(KINDS) + r"): question")
+
+
+def replies(kind: str, cheap: bool) -> dict:
+    flawed = kind != "easy"
+    answers = {
+        "correctness": {"is_correct": not flawed, "errors": ["Ambiguity: two options are correct."] if flawed else [],
+                        "explanation": "Checked the facts and options.", "needs_human_review": False},
+        "language": {"issues_found": flawed, "feedback": ["Clarity: state the unit."] if flawed else [],
+                     "explanation": "Checked the wording."},
+        "improvement": {"improved_question": f"{kind}: question, improved", "justification": "Fixed the options."},
+        "metadata": {"topic": "Algebra", "subtopic": "Linear Equations", "blooms_level": "Apply", "difficulty": "Medium"},
+    }
+    if not cheap:
+        return answers
+    if kind == "inconsistent":
+        answers["correctness"]["is_correct"] = True
+        answers["language"]["issues_found"] = False
+        answers["metadata"]["topic"] = ""
+    elif kind == "disagree":
+        answers["correctness"].update(is_correct=False, needs_human_review=True, errors=["Fragment: no question asked."])
+        answers["language"].update(issues_found=False, feedback=[])
+    confidence = 0.4 if kind == "hard" else 0.9
+    return {agent: {**answer, "confidence": confidence} for agent, answer in answers.items()}
+
+
+class TieredModel(llm_backends.MockModel):
+    """
+    A MockModel whose reply depends on the question's kind and on whether it
+    plays the cheap or the strong model. Counts calls and tokens per model.
+    """
+
+    def __init__(self, agent_name: str, model_name: str, latency_ms: float, usage: dict, system_instruction: str = None):
+        super().__init__(agent_name, {}, latency_ms=latency_ms, system_instruction=system_instruction)
+        self.model_name = model_name
+        self.usage = usage
+
+    def _respond(self, prompt: str, digest: str):
+        kind = _KIND.search(prompt).group(1)
+        reply = replies(kind, self.model_name == CHEAP_MODEL)[self.agent_name]
+        text = '{"is_correct": true, "errors": [' if kind == "malformed" and self.model_name == CHEAP_MODEL else json.dumps(reply)
+        self.template = llm_backends.string.Template(text.replace("$", "$$"))
+        response = super()._respond(prompt, digest)
+        usage = self.usage[self.model_name]
+        usage["calls"] += 1
+        usage["tokens"] += response.usage_metadata.prompt_token_count + response.usage_metadata.candidates_token_count
+        return response
+
+
+def use_tiered_backend(cascade_latency_ms: float, model_latency_ms: float, usage: dict):
+    latency = {CHEAP_MODEL: cascade_latency_ms, STRONG_MODEL: model_latency_ms}
+
+    def factory(agent_name: str, model_name: str, system_instruction: str = None):
+        return TieredModel(agent_name, model_name, latency[model_name], usage, system_instruction)
+
+    llm_backends.BACKENDS["tiered"] = factory
+    llm_backends.LLM_BACKEND = "tiered"
+
+
+def configure_agents(cascade: bool):
+    for client in AGENT_CLIENTS.values():
+        client.model_name = STRONG_MODEL
+        client.cascade_model_name = CHEAP_MODEL if cascade and client.name in agent_runtime.CASCADE_AGENTS else None
+        client.model = None
+        client.cascade_stats = {"answers": 0, "accepted": 0, "escalated": {}, "seconds": 0.0, "tokens": 0,
+                                "model_requests": 0, "model_seconds": 0.0, "model_tokens": 0}
+
+
+def make_questions(count: int, shares: dict, seed: int) -> list:
+    rng = random.Random(seed)
+    kinds = list(shares) + ["easy"]
+    weights = list(shares.values()) + [max(0.0, 1 - sum(shares.values()))]
+    return [f"{rng.choices(kinds, weights)[0]}: question {i}" for i in range(count)]
+
+
+async def run(app, questions: list, concurrency: int) -> tuple:
+    pending = iter(questions)
+    latencies = []
+    routes = collections.Counter()
+
+    async def worker():
+        for question in pending:
+            start = time.perf_counter()
+            final_state = await app.ainvoke(langgraph_flow.initial_question_state(question))
+            latencies.append(time.perf_counter() - start)
+            routes[final_state.get("route") or "none"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--hard-share", type=float, default=0.15)
+    parser.add_argument("--malformed-share", type=float, default=0.03)
+    parser.add_argument("--inconsistent-share", type=float, default=0.03)
+    parser.add_argument("--disagree-share", type=float, default=0.04)
+    parser.add_argument("--cascade-latency-ms", type=float, default=150)
+    parser.add_argument("--model-latency-ms", type=float, default=400)
+    parser.add_argument("--cost-ratio", type=float, default=agent_runtime.CASCADE_COST_RATIO)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    agent_runtime.CASCADE_COST_RATIO = args.cost_ratio
+    # Every question is new, so cached answers would only hide the routing.
+    async def no_cached_feedback(cache_key, agent_name):
+        return None
+
+    agent_runtime.aget_cached_feedback = no_cached_feedback
+    questions = make_questions(args.questions, {
+        "hard": args.hard_share, "malformed": args.malformed_share,
+        "inconsistent": args.inconsistent_share, "disagree": args.disagree_share,
+    }, args.seed)
+    app = langgraph_flow.build_workflow(langgraph_flow.PIPELINE_MODES[langgraph_flow.PIPELINE_MODE])
+    print(f"{len(questions)} questions: {dict(sorted(collections.Counter(q.split(':')[0] for q in questions).items()))}\n")
+    print(f"{'cascade':>8}  {'cheap calls':>11}  {'strong calls':>12}  {'cost':>9}  {'p50':>7}  {'mean':>7}  routes")
+    baseline = None
+    for cascade in (False, True):
+        usage = {model: {"calls": 0, "tokens": 0} for model in (CHEAP_MODEL, STRONG_MODEL)}
+        use_tiered_backend(args.cascade_latency_ms, args.model_latency_ms, usage)
+        configure_agents(cascade)
+        latencies, routes = asyncio.run(run(app, questions, args.concurrency))
+        cost = usage[STRONG_MODEL]["tokens"] + usage[CHEAP_MODEL]["tokens"] * args.cost_ratio
+        mean = statistics.mean(latencies)
+        change = f" ({cost / baseline[0] - 1:+.0%} cost, {mean / baseline[1] - 1:+.0%} mean)" if baseline else ""
+        baseline = baseline or (cost, mean)
+        print(f"{'on' if cascade else 'off':>8}  {usage[CHEAP_MODEL]['calls']:>11}  {usage[STRONG_MODEL]['calls']:>12}  "
+              f"{cost:>9.0f}  {statistics.median(latencies) * 1e3:>5.0f}ms  {mean * 1e3:>5.0f}ms  "
+              f"{dict(sorted(routes.items()))}{change}")
+
+    print("\nper agent, with the cascade on (as GET /llm/usage reports it):")
+    for name, client in sorted(AGENT_CLIENTS.items()):
+        usage = client.cascade_usage()
+        if usage and usage["answers"]:
+            print(f"  {name:>12}: {usage['answers']} answers, {usage['kept']} kept, escalation rate "
+                  f"{usage['escalation_rate']:.0%} {usage['escalated']}, ~{usage['seconds_saved']:.1f}s and "
+                  f"~{usage['tokens_saved']} tokens saved")
+
+
+if __name__ == "__main__":
+    main()
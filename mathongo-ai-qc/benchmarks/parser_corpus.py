@@ -0,0 +1,143 @@
+"""
+Replays agent replies rebuilt from the AI versions in question_versions.csv
+through the old fence-only extractor and the current parser, in the shapes
+Gemini actually produces: bare JSON, fenced JSON, JSON wrapped in prose,
+trailing commas, raw newlines inside strings and truncated output. Reports
+the parse success rate per shape and the parse cost.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.parser_corpus --csv question_versions.csv --check
+
+With --check the script exits non-zero if the current parser fails or
+changes any reply that is complete JSON, so it can gate parser changes.
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+
+from response_cleaner import parse_json_response
+from schemas import validate_agent_output
+
+
+def legacy_extract(text: str):
+    match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text.strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError("No valid JSON block found in input.")
+    return json.loads(match.group(1).strip())
+
+
+def _split(value: str) -> list:
+    return value.split("; ") if value else []
+
+
+def load_feedback(csv_path: str) -> list:
+    """
+    Returns (agent_name, feedback) pairs for every AI version in the CSV.
+    """
+    corpus = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["created_by"] != "AI":
+                continue
+            corpus.append(("correctness", {
+                "is_correct": row["correctness_feedback_is_correct"].lower() == "true",
+                "errors": _split(row["correctness_feedback_errors"]),
+                "explanation": row["correctness_feedback_explanation"],
+            }))
+            corpus.append(("language", {
+                "issues_found": row["language_feedback_issues_found"].lower() == "true",
+                "feedback": _split(row["language_feedback_feedback"]),
+                "explanation": row["language_feedback_explanation"],
+            }))
+            corpus.append(("improvement", {
+                "improved_question": row["improved_text"],
+                "justification": row["improvement_justification"],
+            }))
+            corpus.append(("metadata", {
+                "topic": row["metadata_topic"],
+                "subtopic": row["metadata_subtopic"],
+                "blooms_level": row["metadata_blooms_level"],
+                "difficulty": row["metadata_difficulty"],
+            }))
+    return corpus
+
+
+def _trailing_commas(text: str) -> str:
+    return re.sub(r'("|\]|true|false)(\s*\n\s*[}\]])', r"\1,\2", text)
+
+
+# Each shape turns feedback into reply text; the flag says whether the reply
+# is complete, so the parser must return exactly the original feedback.
+SHAPES = {
+    "bare": (lambda f: json.dumps(f, indent=2, ensure_ascii=False), True),
+    "fenced": (lambda f: f"```json\n{json.dumps(f, indent=2, ensure_ascii=False)}\n```", True),
+    "prose": (lambda f: f"Here is my evaluation:\n{json.dumps(f, ensure_ascii=False)}\nLet me know if you need more.", True),
+    "trailing_commas": (lambda f: _trailing_commas(json.dumps(f, indent=2, ensure_ascii=False)), True),
+    "raw_newlines": (lambda f: re.sub(r"(?<!\\)\\n", "\n", json.dumps(f, indent=2, ensure_ascii=False)), True),
+    "truncated": (lambda f: (lambda s: s[: int(len(s) * 0.85)])(json.dumps(f, indent=2, ensure_ascii=False)), False),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="question_versions.csv")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a complete reply fails to round-trip.")
+    args = parser.parse_args()
+
+    corpus = load_feedback(args.csv)
+    print(f"{len(corpus)} agent replies from {args.csv}\n")
+    print(f"{'shape':>16}  {'old parsed':>10}  {'new parsed':>10}  {'new valid':>9}  {'old us':>7}  {'new us':>7}")
+
+    failures = []
+    for shape, (render, complete) in SHAPES.items():
+        replies = [(agent, feedback, render(feedback)) for agent, feedback in corpus]
+        old_ok = new_ok = valid = 0
+        start = time.perf_counter()
+        for _, _, text in replies:
+            try:
+                legacy_extract(text)
+                old_ok += 1
+            except ValueError:
+                pass
+        old_us = (time.perf_counter() - start) / len(replies) * 1e6
+
+        start = time.perf_counter()
+        parsed = []
+        for _, _, text in replies:
+            try:
+                parsed.append(parse_json_response(text)[0])
+            except ValueError:
+                parsed.append(None)
+        new_us = (time.perf_counter() - start) / len(replies) * 1e6
+
+        for (agent, feedback, text), value in zip(replies, parsed):
+            if value is None:
+                if complete:
+                    failures.append((shape, agent, text))
+                continue
+            new_ok += 1
+            try:
+                validate_agent_output(agent, value)
+                valid += 1
+            except ValueError:
+                pass
+            if complete and value != feedback:
+                failures.append((shape, agent, text))
+
+        total = len(replies)
+        print(f"{shape:>16}  {old_ok / total:>10.0%}  {new_ok / total:>10.0%}  {valid / total:>9.0%}  "
+              f"{old_us:>7.1f}  {new_us:>7.1f}")
+
+    if failures:
+        print(f"\n{len(failures)} complete replies did not round-trip, e.g. ({failures[0][0]}, {failures[0][1]}):")
+        print(failures[0][2][:500])
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares the input tokens each agent sends per question with the prompts of
+an earlier revision (one undivided prompt per call) and with the current
+ones (a system instruction plus the question paragraph), then runs sample
+questions through the graph on the mock backend and prints the per-agent
+token use the agents record, as GET /llm/usage reports it.
+
+Token counts are estimates at four characters per token; Gemini's own counts
+for a real run are in GET /llm/usage and qc_llm_tokens_total.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.prompt_tokens --baseline-rev HEAD~1 --questions 50
+"""
+import argparse
+import asyncio
+import subprocess
+
+import agent_runtime
+import langgraph_flow
+from agent_runtime import PromptTemplate, estimate_tokens
+from benchmarks.stubs import use_mock_backend
+
+AGENT_PROMPTS = {
+    "correctness": "correctness_prompt",
+    "language": "language_prompt",
+    "improvement": "improvement_prompt",
+    "metadata": "metadata_prompt",
+}
+
+SAMPLE_QUESTIONS = [
+    "A train 150 m long passes a pole in 15 s. What is its speed in km/h? (a) 36 (b) 45 (c) 54 (d) 60",
+    "If 2x + 3 = 11, what is the value of x? (a) 3 (b) 4 (c) 5 (d) 7",
+    "Two pipes fill a tank in 12 and 18 hours respectively, while a third pipe empties it in 36 hours. If all "
+    "three are opened together when the tank is empty, in how many hours will the tank be full? "
+    "(a) 9 (b) 10 (c) 12 (d) 15",
+]
+
+
+def default_baseline_rev() -> str:
+    # The revision before the prompts were last changed.
+    last = subprocess.run(["git", "log", "-n", "1", "--format=%H", "--", "prompts"],
+                          capture_output=True, text=True, check=True).stdout.strip()
+    return f"{last}~1"
+
+
+def baseline_template(rev: str, prompt_name: str) -> PromptTemplate:
+    text = subprocess.run(["git", "show", f"{rev}:./prompts/{prompt_name}.txt"],
+                          capture_output=True, text=True, check=True).stdout
+    return PromptTemplate(prompt_name, text, split_system=False)
+
+
+def static_comparison(rev: str):
+    question = SAMPLE_QUESTIONS[0]
+    print(f"Input tokens per call for a {estimate_tokens(question)}-token question, baseline {rev}\n")
+    print(f"{'agent':>12}  {'baseline':>8}  {'current':>8}  {'system':>7}  {'per call':>8}  {'change':>7}")
+    totals = [0, 0]
+    for agent, prompt_name in AGENT_PROMPTS.items():
+        before = estimate_tokens(baseline_template(rev, prompt_name).render(question_text=question))
+        template = agent_runtime.get_prompt(prompt_name)
+        user_part = estimate_tokens(template.render(question_text=question))
+        after = template.system_tokens + user_part
+        totals[0] += before
+        totals[1] += after
+        print(f"{agent:>12}  {before:>8}  {after:>8}  {template.system_tokens:>7}  {user_part:>8}  "
+              f"{after / before - 1:>+7.1%}")
+    print(f"{'question':>12}  {totals[0]:>8}  {totals[1]:>8}  {'':>7}  {'':>8}  {totals[1] / totals[0] - 1:>+7.1%}\n")
+
+
+async def mock_run(questions: int):
+    use_mock_backend(0)
+    app = langgraph_flow.build_workflow(langgraph_flow.PIPELINE_MODES[langgraph_flow.PIPELINE_MODE])
+    for i in range(questions):
+        question = f"{SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]} [{i}]"
+        await app.ainvoke(langgraph_flow.initial_question_state(question))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline-rev", default=None,
+                        help="Git revision whose prompts/ to compare against (default: before the last prompt change).")
+    parser.add_argument("--questions", type=int, default=50, help="Questions to run on the mock backend.")
+    args = parser.parse_args()
+
+    static_comparison(args.baseline_rev or default_baseline_rev())
+
+    asyncio.run(mock_run(args.questions))
+    print(f"Mock run of {args.questions} questions\n")
+    print(f"{'agent':>12}  {'requests':>8}  {'prompt/req':>10}  {'output/req':>10}  {'budget in':>9}  {'budget out':>10}")
+    for name, client in sorted(agent_runtime.AGENT_CLIENTS.items()):
+        usage = client.usage()
+        if not usage["requests"]:
+            continue
+        print(f"{name:>12}  {usage['requests']:>8}  {usage['prompt_tokens_per_request']:>10}  "
+              f"{usage['completion_tokens_per_request']:>10}  {usage['max_prompt_tokens'] or '-':>9}  "
+              f"{usage['max_output_tokens'] or '-':>10}")
+
+
+if __name__ == "__main__":
+    main()
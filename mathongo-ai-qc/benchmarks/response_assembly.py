@@ -0,0 +1,110 @@
+"""
+Measures the cost of building the /process_question/ response for a question
+with a growing version history. The old handler re-read every version and
+rebuilt (and serialized) the whole response once per version; the new one
+converts the two rows it just wrote, once.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.response_assembly --history 2 10 100 1000
+"""
+import argparse
+import json
+import time
+import uuid
+
+import utils
+from benchmarks.stubs import STUB_FEEDBACK, use_scratch_store
+from schemas import (
+    CorrectnessFeedback, LanguageFeedback, ImprovementFeedback, MetadataFeedback, QuestionVersion,
+    ProcessQuestionResponse, question_versions_from_rows
+)
+
+
+def store_history(length: int) -> str:
+    question_id = str(uuid.uuid4())
+    utils.append_question_versions_bulk([
+        {
+            "question_id": question_id,
+            "original_text": "solve x + 3 = 7",
+            "created_by": "AI",
+            "version_number": number,
+            "improved_text": "Solve for x: x + 3 = 7",
+            "correctness_feedback": STUB_FEEDBACK["correctness"],
+            "language_feedback": STUB_FEEDBACK["language"],
+            "improvement_feedback": STUB_FEEDBACK["improvement"],
+            "metadata_feedback": STUB_FEEDBACK["metadata"],
+        }
+        for number in range(1, length + 1)
+    ])
+    return question_id
+
+
+def old_assembly(question_id: str):
+    all_versions_raw = utils.get_question_versions(question_id)
+    all_versions = []
+    for v_raw in all_versions_raw:
+        all_versions.append(QuestionVersion(
+            question_id=v_raw["question_id"],
+            version_number=v_raw["version_number"],
+            timestamp=v_raw["timestamp"],
+            created_by=v_raw["created_by"],
+            original_text=v_raw["original_text"],
+            improved_text=v_raw["improved_text"],
+            correctness_feedback=CorrectnessFeedback(
+                is_correct=v_raw["correctness_feedback_is_correct"],
+                errors=v_raw["correctness_feedback_errors"],
+                explanation=v_raw["correctness_feedback_explanation"]),
+            language_feedback=LanguageFeedback(
+                issues_found=v_raw["language_feedback_issues_found"],
+                feedback=v_raw["language_feedback_feedback"],
+                explanation=v_raw["language_feedback_explanation"]),
+            improvement_feedback=ImprovementFeedback(
+                improved_question=v_raw["improved_text"],
+                justification=v_raw["improvement_justification"]),
+            metadata=MetadataFeedback(
+                topic=v_raw["metadata_topic"],
+                subtopic=v_raw["metadata_subtopic"],
+                blooms_level=v_raw["metadata_blooms_level"],
+                difficulty=v_raw["metadata_difficulty"])
+        ))
+        # The response and its debug dump were rebuilt inside the loop.
+        response = ProcessQuestionResponse(
+            question_id=question_id, version_number=len(all_versions_raw), original_question="",
+            processed_question="", version_history=all_versions)
+        json.dumps(response.dict()["version_history"][-1])
+    return response
+
+
+def new_assembly(question_id: str, written_rows: list):
+    return ProcessQuestionResponse(
+        question_id=question_id, version_number=written_rows[-1]["version_number"], original_question="",
+        processed_question="", version_history=question_versions_from_rows(written_rows))
+
+
+def time_per_call(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[2, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_scratch_store()
+    print(f"{'versions':>9}  {'old handler':>12}  {'new handler':>12}  {'/versions':>12}")
+    for length in args.history:
+        question_id = store_history(length)
+        rows = utils.get_question_versions(question_id)
+        old = time_per_call(lambda: old_assembly(question_id), max(1, args.repeat // max(1, length // 100)))
+        new = time_per_call(lambda: new_assembly(question_id, rows[-2:]), args.repeat)
+        listing = time_per_call(lambda: question_versions_from_rows(utils.get_question_versions(question_id)), args.repeat)
+        print(f"{length:>9}  {old * 1000:>10.2f}ms  {new * 1000:>10.3f}ms  {listing * 1000:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
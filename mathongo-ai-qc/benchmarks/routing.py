@@ -0,0 +1,100 @@
+"""
+Runs a mix of clean, flawed and unsalvageable questions through the QC graph
+with and without conditional routing, using stub agents whose verdicts
+follow each question's kind, and reports the LLM calls per question, the
+latency and how the questions were routed.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.routing --questions 300 --clean-share 0.4 --fragment-share 0.1 --latency-ms 50
+"""
+import argparse
+import asyncio
+import collections
+import random
+import statistics
+import time
+
+import langgraph_flow
+from benchmarks.stubs import STUB_FEEDBACK
+
+
+def stub_agents(latency: float, calls: collections.Counter):
+    """
+    Async stand-ins for the four agents. A question starting with "clean:"
+    passes both checks and one starting with "fragment:" needs a human;
+    anything else gets a language issue.
+    """
+    def verdicts(question_text: str) -> dict:
+        kind = question_text.split(":", 1)[0]
+        return {
+            "correctness": {**STUB_FEEDBACK["correctness"], "needs_human_review": kind == "fragment",
+                            "is_correct": kind != "fragment"},
+            "language": {**STUB_FEEDBACK["language"], "issues_found": kind != "clean"},
+            "improvement": {"improved_question": f"improved: {question_text}", "justification": "stub"},
+            "metadata": dict(STUB_FEEDBACK["metadata"]),
+        }
+
+    def make(stage: str):
+        async def agent(question_text: str) -> dict:
+            calls[stage] += 1
+            await asyncio.sleep(latency)
+            return verdicts(question_text)[stage]
+        return agent
+
+    for stage in STUB_FEEDBACK:
+        setattr(langgraph_flow, f"{stage}_agent_async", make(stage))
+
+
+def make_questions(count: int, clean_share: float, fragment_share: float, seed: int) -> list:
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        draw = rng.random()
+        kind = "clean" if draw < clean_share else "fragment" if draw < clean_share + fragment_share else "flawed"
+        questions.append(f"{kind}: question {i}")
+    return questions
+
+
+async def run(app, questions: list, concurrency: int) -> tuple:
+    pending = iter(questions)
+    latencies = []
+    routes = collections.Counter()
+
+    async def worker():
+        for question in pending:
+            start = time.perf_counter()
+            final_state = await app.ainvoke(langgraph_flow.initial_question_state(question))
+            latencies.append(time.perf_counter() - start)
+            routes[final_state.get("route") or "none"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--clean-share", type=float, default=0.4)
+    parser.add_argument("--fragment-share", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Questions in flight; above a few, graph overhead rather than routing dominates latency.")
+    parser.add_argument("--mode", default=langgraph_flow.PIPELINE_MODE, choices=sorted(langgraph_flow.PIPELINE_MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    questions = make_questions(args.questions, args.clean_share, args.fragment_share, args.seed)
+    print(f"{'routing':>8}  {'calls/question':>14}  {'p50':>8}  {'mean':>8}  routes")
+    for routing in (False, True):
+        calls = collections.Counter()
+        stub_agents(args.latency_ms / 1000, calls)
+        app = langgraph_flow.build_workflow(langgraph_flow.PIPELINE_MODES[args.mode], routing=routing)
+        latencies, routes = asyncio.run(run(app, questions, args.concurrency))
+        print(f"{'on' if routing else 'off':>8}  {sum(calls.values()) / len(questions):>14.2f}  "
+              f"{statistics.median(latencies) * 1e3:>6.0f}ms  {statistics.mean(latencies) * 1e3:>6.0f}ms  "
+              f"{dict(sorted(routes.items()))}")
+
+
+if __name__ == "__main__":
+    main()
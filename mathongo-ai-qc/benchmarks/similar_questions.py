@@ -0,0 +1,107 @@
+"""
+Builds synthetic question banks of increasing size through the normal
+append path (which maintains the near-duplicate index), then looks up
+perturbed copies of stored questions with the LSH index and with a linear
+scan scoring every stored question. Reports append cost, lookup latency and
+the LSH recall of the matches the linear scan finds.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.similar_questions --bank-sizes 1000 10000 50000 --queries 200
+"""
+import argparse
+import random
+import statistics
+import time
+
+import similarity
+import utils
+from benchmarks.stubs import use_scratch_store
+
+WORDS = (
+    "find solve value evaluate triangle circle area perimeter probability integer prime sum product "
+    "ratio speed distance time velocity acceleration mass force energy angle degree radius diameter "
+    "equation root quadratic linear function derivative integral limit matrix vector determinant "
+    "sequence series arithmetic geometric mean median mode variance train tank pipe interest rate "
+    "percent profit loss cost price work days men women balls bag red blue drawn random"
+).split()
+
+
+def make_question(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) if rng.random() < 0.75 else str(rng.randint(1, 99)) for _ in range(rng.randint(15, 40))]
+    options = " ".join(f"({letter}) {rng.randint(1, 200)}" for letter in "abcd")
+    return f"{' '.join(words).capitalize()}? {options}"
+
+
+def perturb(text: str, rng: random.Random) -> str:
+    """Reformats the question and changes one word, as a resubmission would."""
+    words = text.split()
+    words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return "  ".join(words).upper() if rng.random() < 0.5 else " ".join(words)
+
+
+def build_bank(size: int, rng: random.Random) -> tuple:
+    use_scratch_store()
+    texts = [make_question(rng) for _ in range(size)]
+    start = time.perf_counter()
+    for offset in range(0, size, 1000):
+        utils.append_question_versions_bulk([
+            {"question_id": f"q{offset + i}", "original_text": text, "created_by": "bench", "version_number": 1}
+            for i, text in enumerate(texts[offset:offset + 1000])
+        ])
+    return texts, (time.perf_counter() - start) / size
+
+
+def linear_scan(text: str, threshold: float) -> set:
+    query = similarity.shingles(text)
+    matches = set()
+    cursor = None
+    while True:
+        versions, cursor = utils.list_question_versions(limit=1000, cursor=cursor, fields=["question_id", "original_text"])
+        for version in versions:
+            candidate = similarity.shingles(version["original_text"])
+            if len(query & candidate) / len(query | candidate) >= threshold:
+                matches.add(version["question_id"])
+        if cursor is None:
+            return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--linear-queries", type=int, default=20, help="Queries also answered by a linear scan.")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'bank':>7}  {'append':>9}  {'lsh p50':>9}  {'lsh p95':>9}  {'linear p50':>10}  {'recall':>7}")
+    for size in args.bank_sizes:
+        rng = random.Random(args.seed)
+        texts, append_seconds = build_bank(size, rng)
+        queries = [perturb(rng.choice(texts), rng) for _ in range(args.queries)]
+
+        lsh_times = []
+        lsh_results = []
+        for query in queries:
+            start = time.perf_counter()
+            lsh_results.append({match["question_id"] for match in utils.find_similar_versions(query, args.threshold, 100)})
+            lsh_times.append(time.perf_counter() - start)
+
+        linear_times = []
+        expected = found = 0
+        for query, lsh_matches in list(zip(queries, lsh_results))[:args.linear_queries]:
+            start = time.perf_counter()
+            matches = linear_scan(query, args.threshold)
+            linear_times.append(time.perf_counter() - start)
+            expected += len(matches)
+            found += len(matches & lsh_matches)
+
+        lsh_times.sort()
+        print(f"{size:>7}  {append_seconds * 1e6:>7.0f}us  {statistics.median(lsh_times) * 1e3:>7.2f}ms  "
+              f"{lsh_times[int(len(lsh_times) * 0.95) - 1] * 1e3:>7.2f}ms  "
+              f"{statistics.median(linear_times) * 1e3:>8.1f}ms  {found / expected if expected else 1:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
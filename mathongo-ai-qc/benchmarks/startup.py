@@ -0,0 +1,140 @@
+"""
+Measures cold start in fresh processes, the way an autoscaled worker pays it:
+
+- import: `import main`, and which heavy packages that import loaded.
+- eager: `import main` plus building the graph and every agent model, which
+  is what importing main used to do.
+- ready: launching uvicorn until GET /health answers, and until it reports
+  `warm` (graph and models built in the background).
+
+Each run uses a scratch database and the mock backend unless --backend is
+given. Exits with status 1 if the median time to ready exceeds --budget-ms.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.startup --runs 5 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HEAVY_MODULES = ("google.generativeai", "langgraph", "langchain_core", "google.api_core.exceptions")
+
+IMPORT_SCRIPT = """
+import json, sys
+import main
+loaded = [m for m in %r if m in sys.modules]
+if sys.argv[1] == "eager":
+    import langgraph_flow
+    langgraph_flow.warm_up()
+print(json.dumps(loaded))
+""" % (HEAVY_MODULES,)
+
+
+def environment(backend: str, scratch: str) -> dict:
+    env = dict(os.environ, QC_LLM_BACKEND=backend, QC_DB_FILE=os.path.join(scratch, "question_versions.db"),
+               QC_JOB_WORKERS="0", PYTHONDONTWRITEBYTECODE="1")
+    env.setdefault("GEMINI_API_KEY", "startup-benchmark")
+    return env
+
+
+def measure_import(mode: str, env: dict) -> tuple:
+    """
+    Seconds for a new process to import main (and, for "eager", build the
+    graph and models), and the heavy modules importing main loaded.
+    """
+    # Interpreter start-up is included, as a new worker pays it too.
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT, mode], env=env, capture_output=True,
+                            text=True, check=True).stdout
+    return time.perf_counter() - start, json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_ready(env: dict, timeout: float = 60) -> tuple:
+    """
+    Seconds from launching uvicorn until /health answers, and until it is warm.
+    """
+    port = free_port()
+    # One client for all polls: building one per attempt costs more than the poll interval.
+    client = httpx.Client(timeout=1)
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready = warm = None
+    try:
+        while time.perf_counter() - start < timeout and warm is None:
+            try:
+                health = client.get(f"http://127.0.0.1:{port}/health").json()
+            except httpx.HTTPError:
+                time.sleep(0.01)
+                continue
+            ready = ready or time.perf_counter() - start
+            if health.get("warm"):
+                warm = time.perf_counter() - start
+            else:
+                time.sleep(0.01)
+    finally:
+        client.close()
+        server.terminate()
+        server.wait()
+    return ready, warm
+
+
+def summary(values: list) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"{'-':>9}  {'-':>9}"
+    return f"{statistics.median(values) * 1e3:>7.0f}ms  {max(values) * 1e3:>7.0f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="mock", choices=("mock", "gemini"),
+                        help="gemini builds real SDK models during warm-up; no request is sent.")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Budget for the median time to ready.")
+    args = parser.parse_args()
+
+    imports, eager, ready, warm = [], [], [], []
+    loaded = set()
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            env = environment(args.backend, scratch)
+            seconds, modules = measure_import("lazy", env)
+            imports.append(seconds)
+            loaded.update(modules)
+            eager.append(measure_import("eager", env)[0])
+            ready_seconds, warm_seconds = measure_ready(env)
+            ready.append(ready_seconds)
+            warm.append(warm_seconds)
+
+    print(f"{args.runs} runs, {args.backend} backend (median, max; includes interpreter start-up)\n")
+    print(f"{'import main':>22}  {summary(imports)}")
+    print(f"{'import + eager build':>22}  {summary(eager)}")
+    print(f"{'uvicorn to /health':>22}  {summary(ready)}")
+    print(f"{'uvicorn to warm':>22}  {summary(warm)}")
+    print(f"\nloaded by import main: {sorted(loaded) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+    answered = [r for r in ready if r is not None]
+    if not answered or statistics.median(answered) * 1e3 > args.budget_ms:
+        print(f"over the {args.budget_ms:.0f}ms startup budget")
+        sys.exit(1)
+    print(f"within the {args.budget_ms:.0f}ms startup budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Grows a synthetic version history through insert_versions() and, at each
+checkpoint, compares answering GET /stats from the rollups kept on every
+append with aggregating the stored history for each request:
+
+- stats: milliseconds per query from get_stats(), for the totals, by day,
+  by author and topic, and one author by day over the last week.
+- scan: the same queries as a GROUP BY over question_versions.
+- append: microseconds per version appended one per transaction, and in
+  transactions of --group-commit as the version writer batches them, with
+  and without the rollup update.
+- rebuild: seconds for rebuild_rollups() over the final history; --check
+  also compares its counters with the ones kept incrementally.
+
+Each question is submitted by one of --authors and gets one to three AI
+versions. Timestamps are spread over --days.
+
+Run from the mathongo-ai-qc directory:
+
+    python -m benchmarks.stats_rollups --versions 1000000 --checkpoints 10000,100000 --check
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import utils
+from benchmarks.storage_format import TOPICS, paragraph
+from benchmarks.stubs import use_scratch_store
+
+QUERIES = {
+    "totals": {},
+    "by day": {"group_by": ["day"]},
+    "by author, topic": {"group_by": ["author", "metadata_topic"]},
+    "one author, week": {"group_by": ["day"], "author": "author-0", "since": "{week_ago}"},
+}
+
+
+def history(count: int, days: float, authors: int, seed: int):
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    produced = 0
+    while produced < count:
+        question_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        original = paragraph(rng, 2)
+        versions = [{"question_id": question_id, "original_text": original, "created_by": f"author-{rng.randrange(authors)}"}]
+        for _ in range(rng.choice((1, 1, 2, 3))):
+            topic, subtopic, blooms, difficulty = rng.choice(TOPICS)
+            versions.append({
+                "question_id": question_id,
+                "original_text": original,
+                "created_by": "AI",
+                "correctness_feedback": {"is_correct": rng.random() < 0.6},
+                "language_feedback": {"issues_found": rng.random() < 0.3},
+                "metadata_feedback": {"topic": topic, "subtopic": subtopic, "blooms_level": blooms, "difficulty": difficulty}
+            })
+        for version in versions[:count - produced]:
+            version["timestamp"] = (start + timedelta(days=days * produced / count)).isoformat()
+            yield version
+            produced += 1
+
+
+def append(versions, batch_size: int):
+    conn = utils.get_connection()
+    batch = []
+    for version in versions:
+        batch.append(version)
+        if len(batch) == batch_size:
+            with utils.write_transaction(conn):
+                utils.insert_versions(conn, batch)
+            batch = []
+    if batch:
+        with utils.write_transaction(conn):
+            utils.insert_versions(conn, batch)
+
+
+def scan_stats(group_by: list = None, author: str = None, since: str = None) -> list:
+    """
+    What GET /stats would cost without rollups: aggregating every AI version
+    in range, resolving each one's author.
+    """
+    author_sql = utils._AUTHOR_SQL.format(question_id="v.question_id", version_number="v.version_number")
+    keys = {"day": "substr(v.timestamp, 1, 10)", "author": f"COALESCE(({author_sql}), '')"}
+    columns = [keys.get(column, f"v.{column}") for column in group_by or []]
+    clauses, params = ["v.created_by = 'AI'"], []
+    if author is not None:
+        clauses.append(f"{keys['author']} = ?")
+        params.append(author)
+    if since:
+        clauses.append("v.timestamp >= ?")
+        params.append(since)
+    positions = ", ".join(str(i + 1) for i in range(len(columns)))
+    return utils.get_connection().execute(
+        f"SELECT {''.join(column + ', ' for column in columns)}COUNT(*), COUNT(v.correctness_feedback_is_correct), "
+        "TOTAL(v.correctness_feedback_is_correct = 1), COUNT(v.language_feedback_issues_found), "
+        f"TOTAL(v.language_feedback_issues_found = 1) FROM question_versions v WHERE {' AND '.join(clauses)}"
+        + (f" GROUP BY {positions}" if columns else ""),
+        params
+    ).fetchall()
+
+
+def timed(function, repeat: int, **kwargs) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(**kwargs)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def append_cost(count: int, days: float, authors: int, seed: int, batch_size: int) -> float:
+    start = time.perf_counter()
+    append(history(count, days, authors, seed), batch_size)
+    return (time.perf_counter() - start) / count
+
+
+def rollup_rows() -> list:
+    return [tuple(row) for row in utils.get_connection().execute("SELECT * FROM version_rollups ORDER BY 1, 2, 3, 4, 5")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=int, default=200000)
+    parser.add_argument("--checkpoints", default="10000,50000", help="Comma-separated history sizes to measure at.")
+    parser.add_argument("--days", type=float, default=365)
+    parser.add_argument("--authors", type=int, default=200)
+    parser.add_argument("--appends", type=int, default=2000, help="Single-version transactions timed per mode.")
+    parser.add_argument("--group-commit", type=int, default=50, help="Versions per transaction in the batched appends.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="Compare rebuilt rollups with the incremental ones.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    use_scratch_store()
+    week_ago = (datetime.now() - timedelta(days=7)).date().isoformat()
+    queries = {name: {key: value.format(week_ago=week_ago) if isinstance(value, str) else value for key, value in query.items()}
+               for name, query in QUERIES.items()}
+    checkpoints = sorted({int(size) for size in args.checkpoints.split(",") if size.strip()} | {args.versions})
+    versions = history(args.versions, args.days, args.authors, args.seed)
+
+    print(f"{'versions':>9}  {'query':>18}  {'stats ms':>9}  {'scan ms':>9}  {'rows':>6}")
+    stored = 0
+    for size in checkpoints:
+        append((next(versions) for _ in range(size - stored)), batch_size=1000)
+        stored = size
+        for name, query in queries.items():
+            stats_seconds = timed(utils.get_stats, args.repeat, **query)
+            scan_seconds = timed(scan_stats, args.repeat, **query)
+            rows = len(utils.get_stats(**query))
+            print(f"{size:>9}  {name:>18}  {stats_seconds * 1e3:>9.3f}  {scan_seconds * 1e3:>9.1f}  {rows:>6}")
+
+    print()
+    update_rollups = utils._update_rollups
+    for batch_size in (1, args.group_commit):
+        with_rollups = append_cost(args.appends, args.days, args.authors, args.seed + 1, batch_size)
+        utils._update_rollups = lambda conn, versions: None
+        try:
+            without_rollups = append_cost(args.appends, args.days, args.authors, args.seed + 2, batch_size)
+        finally:
+            utils._update_rollups = update_rollups
+        print(f"append, {batch_size:>3} per transaction: {with_rollups * 1e6:>5.0f}us per version with rollups, "
+              f"{without_rollups * 1e6:>5.0f}us without ({(with_rollups / without_rollups - 1) * 100:+.0f}%)")
+
+    # The appends without rollups left the counters behind; the rebuild catches them up.
+    start = time.perf_counter()
+    counted = utils.rebuild_rollups()
+    print(f"rebuild: {counted} AI versions in {time.perf_counter() - start:.1f}s")
+    if args.check:
+        append(history(args.appends, args.days, args.authors, args.seed + 3), batch_size=1)
+        incremental = rollup_rows()
+        utils.rebuild_rollups()
+        assert rollup_rows() == incremental, "rebuilt rollups differ from the incremental ones"
+        print("check: rebuilt rollups match the incremental ones")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Builds a synthetic version history in the layout used before texts were
+interned (every text inline in its row, lists as JSON text), converts a
+copy the way initialize_storage() does, compresses its cold history, and
+compares the three:
+
+- disk: file size after VACUUM, in total and per version.
+- migrate: seconds to convert, and to compress the cold history.
+- read: microseconds per version for pages of 50 from list_question_versions,
+  reading every field ("all") or only the fields a listing shows ("summary"),
+  and with `fields` limited to those ("fields"); and for whole questions
+  from get_question_versions ("question").
+
+Each question has a submitted version and one to three AI versions. Clean
+questions keep their text and get the stock justification; re-processed
+versions re-run one stage and keep the others' output, as reprocessing does.
+Timestamps are spread over --days, so --cold-days sets the share compressed.
+
+Run from the mathongo-ai-qc directory (the files take about 2.5 GB for 1M):
+
+    python -m benchmarks.storage_format --versions 1000000 --cold-days 30
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import metrics
+import utils
+
+INLINE_SCHEMA = """
+CREATE TABLE question_versions (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    original_text TEXT NOT NULL DEFAULT '',
+    improved_text TEXT NOT NULL DEFAULT '',
+    correctness_feedback_is_correct INTEGER,
+    correctness_feedback_errors TEXT NOT NULL DEFAULT '[]',
+    correctness_feedback_explanation TEXT NOT NULL DEFAULT '',
+    language_feedback_issues_found INTEGER,
+    language_feedback_feedback TEXT NOT NULL DEFAULT '[]',
+    language_feedback_explanation TEXT NOT NULL DEFAULT '',
+    improvement_justification TEXT NOT NULL DEFAULT '',
+    metadata_topic TEXT NOT NULL DEFAULT '',
+    metadata_subtopic TEXT NOT NULL DEFAULT '',
+    metadata_blooms_level TEXT NOT NULL DEFAULT '',
+    metadata_difficulty TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX idx_question_versions_question_version ON question_versions (question_id, version_number);
+CREATE INDEX idx_question_versions_created_by ON question_versions (created_by);
+CREATE INDEX idx_question_versions_topic ON question_versions (metadata_topic);
+CREATE INDEX idx_question_versions_difficulty ON question_versions (metadata_difficulty);
+CREATE INDEX idx_question_versions_timestamp ON question_versions (timestamp);
+"""
+
+WORDS = (
+    "find solve value evaluate triangle circle area perimeter probability integer prime sum product "
+    "ratio speed distance time velocity acceleration mass force energy angle degree radius diameter "
+    "equation root quadratic linear function derivative integral limit matrix vector determinant "
+    "sequence series arithmetic geometric mean median mode variance train tank pipe interest rate "
+    "percent profit loss cost price work days men women balls bag red blue drawn random the a of is "
+    "and to in which given that if then option answer correct because statement unit wording clear"
+).split()
+TOPICS = [
+    ("Algebra", "Linear equations", "Apply", "Easy"), ("Algebra", "Quadratics", "Analyze", "Medium"),
+    ("Arithmetic", "Time and work", "Apply", "Medium"), ("Arithmetic", "Percentages", "Understand", "Easy"),
+    ("Geometry", "Triangles", "Apply", "Hard"), ("Probability", "Drawing balls", "Analyze", "Hard"),
+    ("Calculus", "Derivatives", "Apply", "Medium"), ("Physics", "Kinematics", "Understand", "Easy"),
+]
+CLEAN_REASON = "No rewrite needed: the correctness and language checks found no issues."
+CLEAN_LANGUAGE = [
+    "The question is clear, grammatically correct and unambiguous.",
+    "The wording is clear and the options are consistently formatted.",
+    "No language issues were found.",
+]
+SUMMARY_FIELDS = ["question_id", "version_number", "timestamp", "created_by", "metadata_topic", "metadata_difficulty"]
+
+
+def paragraph(rng: random.Random, sentences: int, words: int = 12) -> str:
+    return " ".join(" ".join(rng.choices(WORDS, k=words)).capitalize() + "." for _ in range(sentences))
+
+
+def stage_outputs(rng: random.Random, original: str) -> dict:
+    topic, subtopic, blooms, difficulty = rng.choice(TOPICS)
+    outputs = {"metadata": (topic, subtopic, blooms, difficulty)}
+    if rng.random() < 0.4:
+        outputs["correctness"] = (1, [], paragraph(rng, 2))
+        outputs["language"] = (0, [], rng.choice(CLEAN_LANGUAGE))
+        outputs["improvement"] = (original, CLEAN_REASON)
+    else:
+        errors = [paragraph(rng, 1, 8) for _ in range(rng.randint(0, 2))]
+        outputs["correctness"] = (0 if errors else 1, errors, paragraph(rng, 3))
+        outputs["language"] = (1, [paragraph(rng, 1, 8) for _ in range(rng.randint(1, 3))], paragraph(rng, 2))
+        outputs["improvement"] = (paragraph(rng, 4), paragraph(rng, 3))
+    return outputs
+
+
+def inline_row(question_id: str, version_number: int, timestamp: str, created_by: str, original: str,
+               outputs: dict = None) -> tuple:
+    if outputs is None:
+        return (question_id, version_number, timestamp, created_by, original, "", None, "[]", "", None, "[]", "", "",
+                "", "", "", "")
+    is_correct, errors, correctness_explanation = outputs["correctness"]
+    issues_found, feedback, language_explanation = outputs["language"]
+    improved, justification = outputs["improvement"]
+    return (question_id, version_number, timestamp, "AI", original, improved, is_correct, json.dumps(errors),
+            correctness_explanation, issues_found, json.dumps(feedback), language_explanation, justification,
+            *outputs["metadata"])
+
+
+def history(count: int, days: float, seed: int):
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    produced = 0
+    while produced < count:
+        question_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        original = paragraph(rng, 3) + " (a) 12 (b) 15 (c) 18 (d) 24"
+        rows = [(question_id, 1, "user", original, None)]
+        outputs = stage_outputs(rng, original)
+        for version_number in range(2, 2 + rng.choice((1, 1, 1, 2, 2, 3))):
+            if version_number > 2:
+                rerun = rng.choice(("metadata", "language", "correctness"))
+                outputs = {**outputs, rerun: stage_outputs(rng, original)[rerun]}
+            rows.append((question_id, version_number, "AI", original, outputs))
+        for question_id, version_number, created_by, text, stages in rows[:count - produced]:
+            timestamp = (start + timedelta(days=days * produced / count)).isoformat()
+            yield inline_row(question_id, version_number, timestamp, created_by, text, stages)
+            produced += 1
+
+
+def build_inline(path: str, count: int, days: float, seed: int) -> list:
+    """
+    Writes the history to `path` and returns a sample of its question ids.
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript(INLINE_SCHEMA)
+    rows = history(count, days, seed)
+    question_ids = []
+    while True:
+        batch = [row for _, row in zip(range(10000), rows)]
+        if not batch:
+            break
+        with conn:
+            conn.executemany(f"INSERT INTO question_versions VALUES ({', '.join('?' for _ in batch[0])})", batch)
+        question_ids.append(batch[0][0])
+    conn.close()
+    return question_ids
+
+
+def vacuumed_size(conn: sqlite3.Connection, path: str) -> int:
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+
+@metrics.storage_timer("inline_read")
+def inline_versions(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    # How rows were read before texts were interned, timed as utils' reads are.
+    versions = []
+    for row in conn.execute(sql, params).fetchall():
+        version = dict(row)
+        version.pop("_cursor", None)
+        for column in utils.BOOL_COLUMNS:
+            if version.get(column) is not None:
+                version[column] = bool(version[column])
+        for column in utils.LIST_COLUMNS:
+            if column in version:
+                version[column] = json.loads(version[column])
+        versions.append(version)
+    return versions
+
+
+def read_costs(inline: sqlite3.Connection, count: int, question_ids: list, pages: int, seed: int) -> dict:
+    """
+    Microseconds per version read for each access pattern, from the inline
+    database when `inline` is given and otherwise through utils.
+    """
+    rng = random.Random(seed)
+    cursors = [rng.randrange(max(count - 50, 1)) for _ in range(pages)]
+    questions = [rng.choice(question_ids) for _ in range(pages)]
+    page_sql = "SELECT rowid AS _cursor, {} FROM question_versions WHERE rowid > ? ORDER BY rowid LIMIT 50"
+
+    def list_page(cursor: int, fields: list = None) -> list:
+        if inline is not None:
+            return inline_versions(inline, page_sql.format(", ".join(fields or utils.CSV_HEADERS)), (cursor,))
+        return utils.list_question_versions(limit=50, cursor=str(cursor), fields=fields)[0]
+
+    def get_question(question_id: str) -> list:
+        if inline is not None:
+            return inline_versions(inline, "SELECT * FROM question_versions WHERE question_id = ? ORDER BY version_number",
+                                   (question_id,))
+        return utils.get_question_versions(question_id)
+
+    patterns = {
+        "all": lambda i: [[version[key] for key in version] for version in list_page(cursors[i])],
+        "summary": lambda i: [[version[key] for key in SUMMARY_FIELDS] for version in list_page(cursors[i])],
+        "fields": lambda i: [[version[key] for key in SUMMARY_FIELDS] for version in list_page(cursors[i], SUMMARY_FIELDS)],
+        "question": lambda i: [[version[key] for key in version] for version in get_question(questions[i])],
+    }
+    costs = {}
+    for name, read in patterns.items():
+        read(0)
+        start = time.perf_counter()
+        versions = sum(len(read(i)) for i in range(pages))
+        costs[name] = (time.perf_counter() - start) / versions * 1e6
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=int, default=1000000)
+    parser.add_argument("--days", type=float, default=365, help="Span of the synthetic history.")
+    parser.add_argument("--cold-days", type=float, default=utils.COLD_HISTORY_DAYS)
+    parser.add_argument("--pages", type=int, default=1000, help="Pages (and questions) read per access pattern.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch databases and print where they are.")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="storage-format-")
+    inline_path = os.path.join(scratch, "inline.db")
+    interned_path = os.path.join(scratch, "interned.db")
+    try:
+        start = time.perf_counter()
+        question_ids = build_inline(inline_path, args.versions, args.days, args.seed)
+        print(f"Built {args.versions} versions in the inline layout in {time.perf_counter() - start:.0f}s\n")
+        inline = sqlite3.connect(inline_path)
+        inline.row_factory = sqlite3.Row
+        results = {"inline": (vacuumed_size(inline, inline_path), read_costs(inline, args.versions, question_ids, args.pages, args.seed))}
+
+        shutil.copy(inline_path, interned_path)
+        utils.DB_FILE = interned_path
+        conn = utils.get_connection()
+        start = time.perf_counter()
+        utils._migrate_inline_texts(conn)
+        migrate_seconds = time.perf_counter() - start
+        results["interned"] = (vacuumed_size(conn, interned_path), read_costs(None, args.versions, question_ids, args.pages, args.seed))
+
+        start = time.perf_counter()
+        utils.compress_cold_history(args.cold_days)
+        compact_seconds = time.perf_counter() - start
+        results["+ cold deflated"] = (vacuumed_size(conn, interned_path), read_costs(None, args.versions, question_ids, args.pages, args.seed))
+        texts, text_bytes = conn.execute("SELECT COUNT(*), SUM(length(body)) FROM version_texts").fetchone()
+
+        print(f"\nconverted in {migrate_seconds:.0f}s, cold history (> {args.cold_days:g} of {args.days:g} days) "
+              f"compressed in {compact_seconds:.0f}s; {texts} distinct texts, {text_bytes / 2 ** 20:.0f} MB\n")
+        print(f"{'layout':>15}  {'file':>8}  {'B/version':>9}  "
+              + "  ".join(f"{name + ' us':>11}" for name in results["inline"][1]))
+        base_size, base_costs = results["inline"]
+        for layout, (size, costs) in results.items():
+            print(f"{layout:>15}  {size / 2 ** 20:>6.0f}MB  {size / args.versions:>9.0f}  "
+                  + "  ".join(f"{costs[name]:>5.1f} {costs[name] / base_costs[name] - 1:>+5.0%}" for name in costs))
+        print(f"\nfile size vs inline: {results['+ cold deflated'][0] / base_size - 1:+.0%}")
+    finally:
+        if args.keep:
+            print(f"\nscratch databases in {scratch}")
+        else:
+            shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main()
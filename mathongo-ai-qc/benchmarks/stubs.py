@@ -0,0 +1,68 @@
+"""
+Stand-ins that let benchmarks run without network access or API quota:
+fixed-latency agent functions patched into langgraph_flow, or the mock
+model backend behind the real agents.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import langgraph_flow
+import llm_backends
+import utils
+
+STUB_FEEDBACK = {
+    "correctness": {"is_correct": True, "errors": [], "explanation": "stub"},
+    "language": {"issues_found": False, "feedback": [], "explanation": "stub"},
+    "improvement": {"improved_question": "stub question", "justification": "stub"},
+    "metadata": {"topic": "stub", "subtopic": "stub", "blooms_level": "Apply", "difficulty": "Easy"},
+}
+
+
+def _sync_stub(payload: dict, latency: float):
+    def agent(question_text: str) -> dict:
+        time.sleep(latency)
+        return dict(payload)
+    return agent
+
+
+def _async_stub(payload: dict, latency: float):
+    async def agent(question_text: str) -> dict:
+        await asyncio.sleep(latency)
+        return dict(payload)
+    return agent
+
+
+def install_stub_agents(latency: float):
+    for stage, payload in STUB_FEEDBACK.items():
+        setattr(langgraph_flow, f"{stage}_agent", _sync_stub(payload, latency))
+        setattr(langgraph_flow, f"{stage}_agent_async", _async_stub(payload, latency))
+
+
+def use_mock_backend(latency_ms: float, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0):
+    """
+    Puts the mock model behind the four agents, so prompt rendering, parsing,
+    validation, retries and metrics all run as they would against Gemini.
+    """
+    from agents import correctness_agent, language_agent, improvement_agent, metadata_agent
+
+    llm_backends.LLM_BACKEND = "mock"
+    llm_backends.MOCK_LATENCY_MS = latency_ms
+    llm_backends.MOCK_JITTER_MS = jitter_ms
+    llm_backends.MOCK_ERROR_RATE = error_rate
+    llm_backends.MOCK_SEED = seed
+    for module in (correctness_agent, language_agent, improvement_agent, metadata_agent):
+        client = module.client
+        client.build_model()
+
+
+def use_scratch_store():
+    """
+    Points the version store at a fresh temporary database, without importing
+    any question_versions.csv from the working directory.
+    """
+    scratch_dir = tempfile.mkdtemp()
+    utils.DB_FILE = os.path.join(scratch_dir, "question_versions.db")
+    utils.CSV_FILE = os.path.join(scratch_dir, "question_versions.csv")
+    utils.initialize_storage()
@@ -0,0 +1,126 @@
+"""
+Every setting the service reads from the environment, loaded once (along
+with a .env file, if there is one) into a single immutable Settings object.
+
+Modules bind the values they use to their own constants at import, so a
+benchmark can still patch, say, llm_backends.LLM_BACKEND. Loading settings
+reads nothing but the environment: no SDK, database or network is touched.
+"""
+import dataclasses
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+def _names(value: str) -> tuple:
+    return tuple(name.strip() for name in value.split(",") if name.strip())
+
+
+def _mapping(value: str) -> dict:
+    # "metadata=gemini-2.0-flash-lite,language=gemini-2.0-flash-lite"
+    pairs = [item.split("=", 1) for item in _names(value)]
+    if any(len(pair) != 2 for pair in pairs):
+        raise ValueError(value)
+    return {key.strip(): item.strip() for key, item in pairs}
+
+
+def _setting(env: str, default: str, parse=str, secret: bool = False):
+    return dataclasses.field(default=None, repr=not secret, metadata={"env": env, "default": default, "parse": parse})
+
+
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    # Gemini and the model backend (llm_backends.py, agent_runtime.py).
+    gemini_api_key: str = _setting("GEMINI_API_KEY", "", secret=True)
+    gemini_model: str = _setting("GEMINI_MODEL", "gemini-2.0-flash")
+    agent_models: dict = _setting("QC_AGENT_MODELS", "", _mapping)
+    cascade_model: str = _setting("QC_CASCADE_MODEL", "")
+    cascade_agents: tuple = _setting("QC_CASCADE_AGENTS", "correctness,language,metadata", _names)
+    cascade_min_confidence: float = _setting("QC_CASCADE_MIN_CONFIDENCE", "0.7", float)
+    cascade_cost_ratio: float = _setting("QC_CASCADE_COST_RATIO", "0.75", float)
+    llm_backend: str = _setting("QC_LLM_BACKEND", "gemini")
+    mock_latency_ms: float = _setting("QC_MOCK_LATENCY_MS", "0", float)
+    mock_jitter_ms: float = _setting("QC_MOCK_JITTER_MS", "0", float)
+    mock_error_rate: float = _setting("QC_MOCK_ERROR_RATE", "0", float)
+    mock_seed: int = _setting("QC_MOCK_SEED", "0", int)
+    mock_responses_file: str = _setting("QC_MOCK_RESPONSES_FILE", "")
+    prompt_system_instruction: bool = _setting("QC_PROMPT_SYSTEM_INSTRUCTION", "true", _flag)
+    microbatch_size: int = _setting("QC_MICROBATCH_SIZE", "1", int)
+    microbatch_window_ms: float = _setting("QC_MICROBATCH_WINDOW_MS", "50", float)
+    parse_reask_attempts: int = _setting("QC_PARSE_REASK_ATTEMPTS", "1", int)
+
+    # Retries, rate limiting and the circuit breaker (resilience.py).
+    llm_max_retries: int = _setting("QC_LLM_MAX_RETRIES", "3", int)
+    llm_backoff_base_seconds: float = _setting("QC_LLM_BACKOFF_BASE_SECONDS", "0.5", float)
+    llm_backoff_max_seconds: float = _setting("QC_LLM_BACKOFF_MAX_SECONDS", "20", float)
+    llm_timeout_seconds: float = _setting("QC_LLM_TIMEOUT_SECONDS", "60", float)
+    llm_rate_per_second: float = _setting("QC_LLM_RATE_PER_SECOND", "0", float)
+    llm_rate_burst: float = _setting("QC_LLM_RATE_BURST", "0", float)
+    llm_rate_db_file: str = _setting("QC_LLM_RATE_DB_FILE", "")
+    llm_breaker_threshold: int = _setting("QC_LLM_BREAKER_THRESHOLD", "5", int)
+    llm_breaker_reset_seconds: float = _setting("QC_LLM_BREAKER_RESET_SECONDS", "30", float)
+
+    # Priority scheduling of model calls (scheduling.py).
+    scheduler_max_concurrency: int = _setting("QC_SCHEDULER_MAX_CONCURRENCY", "32", int)
+    scheduler_bulk_share: float = _setting("QC_SCHEDULER_BULK_SHARE", "0.75", float)
+    scheduler_rate_per_second: float = _setting("QC_SCHEDULER_RATE_PER_SECOND", "0", float)
+    scheduler_rate_burst: float = _setting("QC_SCHEDULER_RATE_BURST", "0", float)
+
+    # Agent result cache (result_cache.py).
+    cache_enabled: bool = _setting("QC_CACHE_ENABLED", "true", _flag)
+    cache_max_entries: int = _setting("QC_CACHE_MAX_ENTRIES", "2048", int)
+    cache_ttl_seconds: float = _setting("QC_CACHE_TTL_SECONDS", "86400", float)
+    cache_db_file: str = _setting("QC_CACHE_DB_FILE", "")
+
+    # Version store (utils.py).
+    db_file: str = _setting("QC_DB_FILE", "question_versions.db")
+    db_journal_mode: str = _setting("QC_DB_JOURNAL_MODE", "wal")
+    db_synchronous: str = _setting("QC_DB_SYNCHRONOUS", "normal")
+    group_commit_max_batch: int = _setting("QC_GROUP_COMMIT_MAX_BATCH", "128", int)
+    group_commit_window_ms: float = _setting("QC_GROUP_COMMIT_WINDOW_MS", "0", float)
+    similar_max_candidates: int = _setting("QC_SIMILAR_MAX_CANDIDATES", "100", int)
+    cold_history_days: float = _setting("QC_COLD_HISTORY_DAYS", "30", float)
+
+    # The graph (langgraph_flow.py).
+    pipeline_mode: str = _setting("QC_PIPELINE_MODE", "parallel", str.lower)
+    conditional_routing: bool = _setting("QC_CONDITIONAL_ROUTING", "true", _flag)
+
+    # Batches, re-processing and the job queue.
+    batch_workers: int = _setting("QC_BATCH_WORKERS", "8", int)
+    batch_max_workers: int = _setting("QC_BATCH_MAX_WORKERS", "32", int)
+    batch_rate_per_second: float = _setting("QC_BATCH_RATE_PER_SECOND", "0", float)
+    similar_reuse_threshold: float = _setting("QC_SIMILAR_REUSE_THRESHOLD", "0", float)
+    reprocess_workers: int = _setting("QC_REPROCESS_WORKERS", "8", int)
+    job_workers: int = _setting("QC_JOB_WORKERS", "4", int)
+    job_poll_seconds: float = _setting("QC_JOB_POLL_SECONDS", "1", float)
+    job_lease_seconds: float = _setting("QC_JOB_LEASE_SECONDS", "600", float)
+    job_max_attempts: int = _setting("QC_JOB_MAX_ATTEMPTS", "3", int)
+
+    # API server (main.py, exports.py, metrics.py).
+    max_concurrent_questions: int = _setting("QC_MAX_CONCURRENT_QUESTIONS", "8", int)
+    warmup: bool = _setting("QC_WARMUP", "true", _flag)
+    export_cache_dir: str = _setting("QC_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "qc-exports"))
+    server_timing: bool = _setting("QC_SERVER_TIMING", "0", _flag)
+    debug_sample_rate: float = _setting("QC_DEBUG_SAMPLE_RATE", "0", float)
+
+    @classmethod
+    def from_env(cls, environ=None) -> "Settings":
+        environ = os.environ if environ is None else environ
+        values = {}
+        for field in dataclasses.fields(cls):
+            spec = field.metadata
+            raw = environ.get(spec["env"], spec["default"])
+            try:
+                values[field.name] = spec["parse"](raw)
+            except ValueError:
+                raise ValueError(f"{spec['env']}={raw!r} is not a valid {field.type.__name__}")
+        return cls(**values)
+
+
+load_dotenv()
+settings = Settings.from_env()
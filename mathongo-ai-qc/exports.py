@@ -0,0 +1,140 @@
+"""
+Full version-history exports (CSV or JSONL). Each export is pinned to the
+rows present when it starts, which gives it a stable ETag: unchanged history
+answers 304, gzip-capable clients get a compressed stream, and byte ranges are
+served from a snapshot file written once per ETag.
+"""
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+
+import utils
+from config import settings
+
+EXPORT_CACHE_DIR = settings.export_cache_dir
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", utils.export_versions_csv),
+    "jsonl": ("application/x-ndjson", utils.export_versions_jsonl),
+}
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def export_etag(export_format: str, snapshot: tuple) -> str:
+    row_count, last_rowid = snapshot
+    return f'"{export_format}-{row_count}-{last_rowid}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    True when an If-None-Match header names this export in any encoding.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == base or candidate == f"{base}-gzip":
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding == "gzip" and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            return True
+    return False
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a stream of text chunks into gzip bytes without buffering it.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_chunks(chunks):
+    for chunk in chunks:
+        yield chunk.encode("utf-8")
+
+
+def snapshot_path(export_format: str, snapshot: tuple) -> str:
+    """
+    Writes the export for this snapshot to the cache directory once, removing
+    older snapshots of the same format, and returns its path.
+    """
+    row_count, last_rowid = snapshot
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    store_id = hashlib.sha1(os.path.abspath(utils.DB_FILE).encode("utf-8")).hexdigest()[:12]
+    prefix = os.path.join(EXPORT_CACHE_DIR, f"versions-{store_id}-{export_format}-")
+    path = f"{prefix}{row_count}-{last_rowid}"
+    if not os.path.exists(path):
+        _, generate = EXPORT_FORMATS[export_format]
+        fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR)
+        with os.fdopen(fd, "wb") as f:
+            for chunk in generate(last_rowid):
+                f.write(chunk.encode("utf-8"))
+        os.replace(tmp_path, path)
+        for old in glob.glob(f"{prefix}*"):
+            if old != path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+    return path
+
+
+def single_range(range_header: str) -> bool:
+    """
+    True for a well-formed single `bytes=` range. Anything else (multiple
+    ranges, other units, garbage) is ignored and the full export is served.
+    """
+    match = _RANGE.match((range_header or "").strip())
+    return bool(match) and match.groups() != ("", "")
+
+
+def parse_range(range_header: str, size: int):
+    """
+    Returns (start, end) inclusive for a single `bytes=` range, or None when
+    the header is absent or not satisfiable.
+    """
+    if not single_range(range_header):
+        return None
+    first, last = _RANGE.match(range_header.strip()).groups()
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def read_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
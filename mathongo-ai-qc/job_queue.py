@@ -0,0 +1,378 @@
+"""
+Durable background job queue for question processing, stored in the same
+SQLite database as the version history. Items survive restarts: anything left
+running by a dead worker is put back in the queue and picked up again.
+
+Workers run inside the API process (QC_JOB_WORKERS) or standalone:
+
+    python -m job_queue --workers 8
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+import metrics
+import resilience
+import scheduling
+import utils
+from config import settings
+from batch_processor import run_question, submitted_question_version, ai_question_version
+
+JOB_WORKERS = settings.job_workers
+JOB_POLL_SECONDS = settings.job_poll_seconds
+# A running item whose worker has been silent this long is assumed lost.
+# Workers renew the lease every third of it while they process an item.
+JOB_LEASE_SECONDS = settings.job_lease_seconds
+JOB_MAX_ATTEMPTS = settings.job_max_attempts
+# How often a process running workers looks for items whose lease expired.
+JOB_REQUEUE_INTERVAL_SECONDS = max(JOB_POLL_SECONDS, JOB_LEASE_SECONDS / 4)
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    question_text TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    question_id TEXT,
+    version_number INTEGER,
+    processed_question TEXT,
+    error TEXT,
+    finished_at TEXT,
+    PRIMARY KEY (job_id, item_index)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, claimed_at);
+"""
+
+_work_available = None
+_workers_loop = None
+
+
+def initialize_job_tables():
+    conn = utils.get_connection()
+    with conn:
+        conn.executescript(JOB_SCHEMA)
+
+
+@metrics.storage_timer("job_submit")
+def submit_job(items: list) -> dict:
+    """
+    Queues {"question_text", "created_by"} items as one job and returns it.
+    """
+    job_id = str(uuid.uuid4())
+    conn = utils.get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (job_id, created_at, total) VALUES (?, ?, ?)",
+            (job_id, datetime.now().isoformat(), len(items))
+        )
+        conn.executemany(
+            "INSERT INTO job_items (job_id, item_index, question_text, created_by) VALUES (?, ?, ?, ?)",
+            [(job_id, index, item["question_text"], item["created_by"]) for index, item in enumerate(items)]
+        )
+    _wake_workers()
+    return {"job_id": job_id, "total": len(items)}
+
+
+def _wake_workers():
+    # Called from worker threads (asyncio.to_thread); the event belongs to the workers' loop.
+    if _work_available is None:
+        return
+    try:
+        _workers_loop.call_soon_threadsafe(_work_available.set)
+    except RuntimeError:
+        pass  # The loop has closed, so no worker is waiting.
+
+
+@metrics.storage_timer("job_claim")
+def claim_item(worker_id: str):
+    """
+    Atomically moves the oldest pending item to running for this worker.
+    Returns the item, or None when the queue is empty.
+    """
+    conn = utils.get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT job_id, item_index, question_text, created_by, attempts FROM job_items "
+            "WHERE status = 'pending' ORDER BY rowid LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        conn.execute(
+            "UPDATE job_items SET status = 'running', attempts = attempts + 1, claimed_by = ?, claimed_at = ? "
+            "WHERE job_id = ? AND item_index = ?",
+            (worker_id, time.time(), row["job_id"], row["item_index"])
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    item = dict(row)
+    item["attempts"] += 1
+    item["claimed_by"] = worker_id
+    return item
+
+
+@metrics.storage_timer("job_renew")
+def renew_lease(item: dict) -> bool:
+    """
+    Restarts the item's lease. Returns False if the item was requeued
+    meanwhile and this worker no longer holds it.
+    """
+    conn = utils.get_connection()
+    with conn:
+        return conn.execute(
+            "UPDATE job_items SET claimed_at = ? WHERE job_id = ? AND item_index = ? AND status = 'running' AND claimed_by = ?",
+            (time.time(), item["job_id"], item["item_index"], item["claimed_by"])
+        ).rowcount > 0
+
+
+@metrics.storage_timer("job_complete")
+def complete_item(item: dict, question_id: str, processed_question_text: str, final_state: dict):
+    """
+    Stores the item's versions and marks it done in the same transaction, so a
+    crash can never leave versions without a finished item or the reverse.
+    Returns False, storing nothing, if the item was requeued meanwhile.
+    """
+    with utils.write_transaction() as conn:
+        claimed = conn.execute(
+            "UPDATE job_items SET status = 'done', question_id = ?, version_number = 2, processed_question = ?, "
+            "error = NULL, finished_at = ? WHERE job_id = ? AND item_index = ? AND status = 'running' AND claimed_by = ?",
+            (question_id, processed_question_text, datetime.now().isoformat(), item["job_id"], item["item_index"],
+             item["claimed_by"])
+        ).rowcount
+        if not claimed:
+            return False
+        utils.insert_versions(conn, [
+            submitted_question_version(question_id, item["question_text"], item["created_by"]),
+            ai_question_version(question_id, item["question_text"], processed_question_text, final_state)
+        ])
+    return True
+
+
+@metrics.storage_timer("job_fail")
+def fail_item(item: dict, error: str):
+    """
+    Puts the item back in the queue, or marks it failed after JOB_MAX_ATTEMPTS.
+    """
+    retry = item["attempts"] < JOB_MAX_ATTEMPTS
+    conn = utils.get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE job_items SET status = ?, error = ?, claimed_by = NULL, claimed_at = NULL, finished_at = ? "
+            "WHERE job_id = ? AND item_index = ? AND status = 'running' AND claimed_by = ?",
+            ("pending" if retry else "failed", error, None if retry else datetime.now().isoformat(),
+             item["job_id"], item["item_index"], item["claimed_by"])
+        )
+
+
+def _worker_is_dead(worker_id: str) -> bool:
+    host, _, rest = worker_id.partition(":")
+    if host != socket.gethostname():
+        return False
+    pid = int(rest.split(":")[0])
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def requeue_stale_items() -> int:
+    """
+    Returns running items to the queue when their lease has expired or their
+    worker process on this host no longer exists.
+    """
+    conn = utils.get_connection()
+    rows = conn.execute(
+        "SELECT job_id, item_index, claimed_by, claimed_at FROM job_items WHERE status = 'running'"
+    ).fetchall()
+    expired_before = time.time() - JOB_LEASE_SECONDS
+    stale = [
+        (row["job_id"], row["item_index"], row["claimed_at"]) for row in rows
+        if (row["claimed_at"] or 0) < expired_before or _worker_is_dead(row["claimed_by"] or "")
+    ]
+    if not stale:
+        return 0
+    requeued = 0
+    with conn:
+        # A lease renewed since the read above is kept.
+        for job_id, item_index, claimed_at in stale:
+            requeued += conn.execute(
+                "UPDATE job_items SET status = 'pending', claimed_by = NULL, claimed_at = NULL "
+                "WHERE job_id = ? AND item_index = ? AND status = 'running' AND claimed_at IS ?",
+                (job_id, item_index, claimed_at)
+            ).rowcount
+    if requeued:
+        print(f"[JOBS] Requeued {requeued} unfinished items")
+    return requeued
+
+
+@metrics.storage_timer("job_status")
+def get_job(job_id: str, include_items: bool = False):
+    conn = utils.get_connection()
+    job = conn.execute("SELECT job_id, created_at, total FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+
+    counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+    for row in conn.execute(
+        "SELECT status, COUNT(*) AS n FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+    ):
+        counts[row["status"]] = row["n"]
+
+    finished = counts["done"] + counts["failed"]
+    if finished == job["total"]:
+        status = "completed"
+    elif counts["running"] or finished:
+        status = "running"
+    else:
+        status = "queued"
+
+    result = {
+        "job_id": job["job_id"],
+        "created_at": job["created_at"],
+        "status": status,
+        "total": job["total"],
+        "counts": counts,
+        "progress": round(finished / job["total"], 4) if job["total"] else 1.0
+    }
+    if include_items:
+        result["items"] = [dict(row) for row in conn.execute(
+            "SELECT item_index AS \"index\", status, attempts, question_id, version_number, processed_question, error "
+            "FROM job_items WHERE job_id = ? ORDER BY item_index", (job_id,)
+        )]
+    return result
+
+
+async def worker_loop(worker_id: str, stop: asyncio.Event):
+    while not stop.is_set():
+        # Leave items queued while Gemini is failing instead of burning their attempts.
+        circuit_wait = resilience.breaker.retry_after()
+        if circuit_wait:
+            await asyncio.sleep(min(circuit_wait, JOB_POLL_SECONDS * 10))
+            continue
+        # Cleared before the claim, so a job submitted while it runs still wakes us.
+        _work_available.clear()
+        try:
+            item = await asyncio.to_thread(claim_item, worker_id)
+        except Exception as e:
+            print(f"[JOBS] {worker_id} could not claim an item: {e}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        if item is None:
+            try:
+                await asyncio.wait_for(_work_available.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        question_id = str(uuid.uuid4())
+        heartbeat = asyncio.create_task(keep_lease(worker_id, item))
+        try:
+            with scheduling.traffic("bulk", item["created_by"]):
+                processed_question_text, final_state = await run_question(item["question_text"])
+            if not await asyncio.to_thread(complete_item, item, question_id, processed_question_text, final_state):
+                print(f"[JOBS] {worker_id} lost item {item['item_index']} of job {item['job_id']} to a requeue; discarded its result")
+        except Exception as e:
+            print(f"[JOBS] {worker_id} failed item {item['item_index']} of job {item['job_id']}: {e}")
+            try:
+                await asyncio.to_thread(fail_item, item, str(e))
+            except Exception as fail_error:
+                # The item stays running until its lease expires and it is requeued.
+                print(f"[JOBS] {worker_id} could not record the failure: {fail_error}")
+        finally:
+            heartbeat.cancel()
+
+
+async def keep_lease(worker_id: str, item: dict):
+    """
+    Renews the item's lease every third of JOB_LEASE_SECONDS while it is
+    processed, so a slow item is not requeued under a live worker.
+    """
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            if not await asyncio.to_thread(renew_lease, item):
+                return
+        except Exception as e:
+            # The next renewal may succeed before the lease runs out.
+            print(f"[JOBS] {worker_id} could not renew its lease: {e}")
+
+
+async def requeue_loop(stop: asyncio.Event):
+    """
+    Requeues expired items every JOB_REQUEUE_INTERVAL_SECONDS while workers
+    run, so a lost item does not wait for the next restart.
+    """
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=JOB_REQUEUE_INTERVAL_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            if await asyncio.to_thread(requeue_stale_items):
+                _work_available.set()
+        except Exception as e:
+            print(f"[JOBS] Could not requeue stale items: {e}")
+
+
+def start_workers(count: int):
+    """
+    Starts `count` worker tasks and the requeue task on the running event
+    loop. Returns the event that stops them and the tasks.
+    """
+    global _work_available, _workers_loop
+    _workers_loop = asyncio.get_running_loop()
+    _work_available = asyncio.Event()
+    stop = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    tasks = [asyncio.create_task(worker_loop(f"{prefix}:{n}", stop)) for n in range(count)]
+    tasks.append(asyncio.create_task(requeue_loop(stop)))
+    print(f"[JOBS] Started {count} job workers")
+    return stop, tasks
+
+
+async def stop_workers(stop: asyncio.Event, tasks: list):
+    stop.set()
+    if _work_available is not None:
+        _work_available.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_standalone(count: int):
+    stop, tasks = start_workers(count)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await stop_workers(stop, tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run job queue workers outside the API process.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    utils.initialize_storage()
+    initialize_job_tables()
+    requeue_stale_items()
+    asyncio.run(run_standalone(args.workers))
@@ -1,11 +1,18 @@
-from typing import TypedDict, Annotated
-from langgraph.graph import StateGraph, END
+import asyncio
+import functools
+import threading
+import time
+from typing import TypedDict, Annotated, Optional
 import operator
 
-from agents.correctness_agent import correctness_agent
-from agents.language_agent import language_agent
-from agents.improvement_agent import improvement_agent
-from agents.metadata_agent import metadata_agent
+import metrics
+from config import settings
+from agent_runtime import AGENT_CLIENTS
+
+from agents.correctness_agent import correctness_agent, correctness_agent_async
+from agents.language_agent import language_agent, language_agent_async
+from agents.improvement_agent import improvement_agent, improvement_agent_async
+from agents.metadata_agent import metadata_agent, metadata_agent_async
 
 class QuestionState(TypedDict):
     question_text: str
@@ -15,64 +22,440 @@ class QuestionState(TypedDict):
     improvement_feedback: dict
     metadata_feedback: dict
     errors: Annotated[list[str], operator.add]
+    # Outputs and input fingerprints of the version being reprocessed, by stage.
+    previous_stages: dict
+    # When set, only these stages run; the others keep their previous output.
+    only_stages: Optional[list]
+    stage_fingerprints: Annotated[dict, lambda current, new: {**current, **new}]
+    reused_stages: Annotated[list[str], operator.add]
+    # The near-identical question previous_stages came from, if not this one.
+    reused_from: Optional[str]
+    # Path chosen before improvement from the correctness and language feedback (see ROUTES).
+    route: Optional[str]
+    route_reason: str
+
+class QuestionProcessingError(Exception):
+    """
+    Raised when a stage failed, so its fallback feedback is reported instead
+    of being stored as an AI version.
+    """
+
+    def __init__(self, errors: list):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+def initial_question_state(question_text: str, previous_stages: dict = None, only_stages: list = None,
+                           reused_from: str = None) -> QuestionState:
+    return {
+        "question_text": question_text,
+        "original_question_text": question_text,
+        "correctness_feedback": {},
+        "language_feedback": {},
+        "improvement_feedback": {},
+        "metadata_feedback": {},
+        "errors": [],
+        "previous_stages": previous_stages or {},
+        "only_stages": only_stages,
+        "stage_fingerprints": {},
+        "reused_stages": [],
+        "reused_from": reused_from,
+        "route": None,
+        "route_reason": ""
+    }
+
+def _reused_update(state: QuestionState, stage: str):
+    """
+    The node update that reuses the stage's previous output, or None if the
+    stage has to run: its inputs changed, or it is not among only_stages.
+    Output reused from another question is fingerprinted against this
+    question's own inputs, since its stored fingerprint describes the other's.
+    """
+    previous = state.get("previous_stages", {}).get(stage)
+    if previous is None:
+        return None
+    only_stages = state.get("only_stages")
+    if only_stages is not None:
+        if stage in only_stages:
+            return None
+        if state.get("reused_from"):
+            fingerprint = AGENT_CLIENTS[stage].fingerprint(state["question_text"])
+        else:
+            fingerprint = previous.get("fingerprint")
+    else:
+        fingerprint = AGENT_CLIENTS[stage].fingerprint(state["question_text"])
+        if previous.get("fingerprint") is None or previous["fingerprint"]["fingerprint"] != fingerprint["fingerprint"]:
+            return None
+
+    output = previous["output"]
+    update = {STAGE_OUTPUT_KEYS[stage]: output, "reused_stages": [stage]}
+    if "improved_question" in output:
+        update["question_text"] = output["improved_question"]
+    if fingerprint:
+        update["stage_fingerprints"] = {stage: fingerprint}
+    return update
+
+def reusable_stage(stage: str):
+    """
+    Decorates a sync or async graph node so it returns the stage's previous
+    output when it can be reused, and otherwise records the fingerprint of
+    the inputs it ran on.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(state):
+                update = _reused_update(state, stage)
+                metrics.stage_runs.inc(stage=stage, outcome="computed" if update is None else "reused")
+                if update is not None:
+                    return update
+                return {**await fn(state), "stage_fingerprints": {stage: AGENT_CLIENTS[stage].fingerprint(state["question_text"])}}
+        else:
+            @functools.wraps(fn)
+            def wrapper(state):
+                update = _reused_update(state, stage)
+                metrics.stage_runs.inc(stage=stage, outcome="computed" if update is None else "reused")
+                if update is not None:
+                    return update
+                return {**fn(state), "stage_fingerprints": {stage: AGENT_CLIENTS[stage].fingerprint(state["question_text"])}}
+        return wrapper
+    return decorate
+
+# Feedback a failed stage reports instead of its agent's, by stage.
+STAGE_FALLBACKS = {
+    "correctness": lambda question_text, error_msg: {"is_correct": False, "errors": [error_msg], "explanation": error_msg},
+    "language": lambda question_text, error_msg: {"issues_found": True, "feedback": [error_msg], "explanation": error_msg},
+    "improvement": lambda question_text, error_msg: {"improved_question": question_text, "justification": error_msg},
+    "metadata": lambda question_text, error_msg: {"topic": "Error", "subtopic": "Error", "blooms_level": "Error", "difficulty": "Error"},
+}
+
+def _stage_update(stage: str, question_text: str, feedback: dict) -> dict:
+    update = {STAGE_OUTPUT_KEYS[stage]: feedback}
+    if stage == "improvement":
+        update["question_text"] = feedback.get("improved_question", question_text)
+    return update
+
+def _stage_failure(stage: str, question_text: str, error: Exception) -> dict:
+    error_msg = f"Error calling {stage}_agent: {error}"
+    print(error_msg)
+    return {STAGE_OUTPUT_KEYS[stage]: STAGE_FALLBACKS[stage](question_text, error_msg), "errors": [error_msg]}
+
+def stage_nodes(stage: str, agent, agent_async) -> tuple:
+    """
+    The sync and async graph nodes of a stage, calling `agent` or awaiting
+    `agent_async` on the current question text. Both build their update, or
+    the fallback feedback on failure, the same way.
+    """
+    @metrics.timed_stage(stage)
+    @reusable_stage(stage)
+    def node(state: QuestionState):
+        metrics.debug_log(f"Calling {stage.capitalize()} Agent...")
+        question_text = state["question_text"]
+        try:
+            return _stage_update(stage, question_text, agent(question_text))
+        except Exception as e:
+            return _stage_failure(stage, question_text, e)
+
+    @metrics.timed_stage(stage)
+    @reusable_stage(stage)
+    async def anode(state: QuestionState):
+        metrics.debug_log(f"Calling {stage.capitalize()} Agent...")
+        question_text = state["question_text"]
+        try:
+            return _stage_update(stage, question_text, await agent_async(question_text))
+        except Exception as e:
+            return _stage_failure(stage, question_text, e)
+
+    return node, anode
+
+call_correctness_agent, acall_correctness_agent = stage_nodes("correctness", correctness_agent, correctness_agent_async)
+call_language_agent, acall_language_agent = stage_nodes("language", language_agent, language_agent_async)
+call_improvement_agent, acall_improvement_agent = stage_nodes("improvement", improvement_agent, improvement_agent_async)
+call_metadata_agent, acall_metadata_agent = stage_nodes("metadata", metadata_agent, metadata_agent_async)
+
+# Where each route continues after the improvement node ("end" finishes the
+# run). Clean questions skip the rewrite and get metadata for their own text;
+# questions the correctness agent marks as beyond repair stop for a human, as
+# do failed checks.
+ROUTES = {
+    "improve": "metadata",
+    "clean": "metadata",
+    "needs_human": "end",
+    "failed": "end",
+}
+
+def _keeps_previous_rewrite(state: QuestionState, previous_improvement: dict) -> bool:
+    # A re-run of other stages keeps a stored rewrite even without a
+    # fingerprint (versions stored before fingerprints, or migrated).
+    only_stages = state.get("only_stages")
+    if not previous_improvement or only_stages is None or "improvement" in only_stages:
+        return False
+    return previous_improvement["output"].get("improved_question") not in (None, "", state["question_text"])
+
+def triage_question(state: QuestionState) -> dict:
+    """
+    Picks the route from the correctness and language feedback. Clean and
+    needs-human questions get an improvement entry explaining why the text
+    was not rewritten. A reprocess that asks for improvement takes the
+    improvement path, as does one whose stored rewrite is kept by a re-run
+    of other stages.
+    """
+    correctness = state["correctness_feedback"]
+    language = state["language_feedback"]
+    previous_improvement = state.get("previous_stages", {}).get("improvement")
+    if state.get("errors"):
+        route, reason = "failed", "A check failed, so nothing further was run."
+    elif correctness.get("needs_human_review"):
+        route, reason = "needs_human", f"Needs human review: {correctness.get('explanation') or 'the question cannot be repaired by rewriting.'}"
+    elif "improvement" in (state.get("only_stages") or []):
+        route, reason = "improve", "Improvement requested by reprocessing."
+    elif _keeps_previous_rewrite(state, previous_improvement):
+        route, reason = "improve", "Rewrite kept from the previous version."
+    elif correctness.get("is_correct") and not language.get("issues_found"):
+        route, reason = "clean", "No rewrite needed: the correctness and language checks found no issues."
+    else:
+        route, reason = "improve", "The correctness or language check found issues."
+
+    metrics.routes.inc(route=route)
+    metrics.debug_log(f"Routing question: {route}")
+    update = {"route": route, "route_reason": reason}
+    if route != "improve":
+        update["improvement_feedback"] = {"improved_question": state["question_text"], "justification": reason}
+    return update
+
+def checks_disagree(state: QuestionState) -> bool:
+    """
+    True when correctness says the question cannot be repaired while language
+    finds nothing wrong with its text: one of the two checks is wrong, and
+    the route depends on which.
+    """
+    if state.get("errors"):
+        return False
+    return bool(state["correctness_feedback"].get("needs_human_review")) and state["language_feedback"].get("issues_found") is False
+
+def _checks_to_escalate(state: QuestionState) -> list:
+    # Only answers from a model cascade carry answered_by; escalate() leaves the others as they are.
+    if not checks_disagree(state):
+        return []
+    return [stage for stage in ("correctness", "language") if stage not in state.get("reused_stages", [])]
+
+def routed_stage(fn):
+    """
+    Decorates the sync or async improvement node so it triages the question
+    first and only runs on the improve route. The route is part of its update
+    for the conditional edge that follows. Checks answered by a cascade model
+    that disagree are first answered again by their agent's own model.
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(state):
+            stages = _checks_to_escalate(state)
+            feedback = await asyncio.gather(*(
+                AGENT_CLIENTS[stage].aescalate(state["question_text"], state[STAGE_OUTPUT_KEYS[stage]]) for stage in stages
+            ))
+            escalated = {STAGE_OUTPUT_KEYS[stage]: output for stage, output in zip(stages, feedback)}
+            state = {**state, **escalated}
+            update = {**escalated, **triage_question(state)}
+            if update["route"] != "improve":
+                return update
+            return {**await fn(state), **update}
+    else:
+        @functools.wraps(fn)
+        def wrapper(state):
+            escalated = {
+                STAGE_OUTPUT_KEYS[stage]: AGENT_CLIENTS[stage].escalate(state["question_text"], state[STAGE_OUTPUT_KEYS[stage]])
+                for stage in _checks_to_escalate(state)
+            }
+            state = {**state, **escalated}
+            update = {**escalated, **triage_question(state)}
+            if update["route"] != "improve":
+                return update
+            return {**fn(state), **update}
+    return wrapper
+
+def next_stage(state: QuestionState):
+    return ROUTES[state["route"]]
+
+@functools.lru_cache(maxsize=None)
+def stage_runnables() -> dict:
+    """
+    The graph node for each stage, plus "routed_improvement". Built on first
+    use, so importing this module does not load LangChain.
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    class StageRunnable(RunnableLambda):
+        """
+        RunnableLambda for a graph stage. LangChain calls repr() and config_specs
+        on every node run, and RunnableLambda answers both by re-parsing the
+        function source, which costs tens of milliseconds of event-loop time per
+        question. Stage functions never wrap other runnables, so both are cheap here.
+        """
+
+        def __repr__(self):
+            return f"StageRunnable({self.name})"
+
+        @property
+        def deps(self):
+            return []
+
+    # Each stage has a sync and an async implementation so the compiled app
+    # supports both invoke() and ainvoke().
+    return {
+        "correctness": StageRunnable(call_correctness_agent, acall_correctness_agent, name="correctness"),
+        "language": StageRunnable(call_language_agent, acall_language_agent, name="language"),
+        "improvement": StageRunnable(call_improvement_agent, acall_improvement_agent, name="improvement"),
+        "metadata": StageRunnable(call_metadata_agent, acall_metadata_agent, name="metadata"),
+        "routed_improvement": StageRunnable(routed_stage(call_improvement_agent), routed_stage(acall_improvement_agent),
+                                            name="improvement"),
+    }
+
+# State key holding each stage's feedback.
+STAGE_OUTPUT_KEYS = {
+    "correctness": "correctness_feedback",
+    "language": "language_feedback",
+    "improvement": "improvement_feedback",
+    "metadata": "metadata_feedback",
+}
+
+# Each stage maps to the stages whose output it waits for. Stages with no
+# dependencies start together, and a stage runs once all of its dependencies
+# have finished. Correctness and language only read the submitted text, so in
+# parallel mode they fan out and join before improvement.
+PARALLEL_STAGE_DEPENDENCIES = {
+    "correctness": [],
+    "language": [],
+    "improvement": ["correctness", "language"],
+    "metadata": ["improvement"],
+}
+
+SEQUENTIAL_STAGE_DEPENDENCIES = {
+    "correctness": [],
+    "language": ["correctness"],
+    "improvement": ["language"],
+    "metadata": ["improvement"],
+}
+
+PIPELINE_MODES = {
+    "parallel": PARALLEL_STAGE_DEPENDENCIES,
+    "sequential": SEQUENTIAL_STAGE_DEPENDENCIES,
+}
+
+PIPELINE_MODE = settings.pipeline_mode
+# Routes questions after correctness and language instead of running every stage.
+ROUTING_ENABLED = settings.conditional_routing
+
+
+def _check_stage_dependencies(stage_dependencies: dict):
+    for stage, dependencies in stage_dependencies.items():
+        if stage not in STAGE_OUTPUT_KEYS:
+            raise ValueError(f"Unknown stage: {stage}")
+        for dependency in dependencies:
+            if dependency not in stage_dependencies:
+                raise ValueError(f"Stage '{stage}' depends on '{dependency}', which is not in the graph")
+
+    visited = set()
+    visiting = set()
+
+    def visit(stage):
+        if stage in visited:
+            return
+        if stage in visiting:
+            raise ValueError(f"Stage dependencies contain a cycle through '{stage}'")
+        visiting.add(stage)
+        for dependency in stage_dependencies[stage]:
+            visit(dependency)
+        visiting.remove(stage)
+        visited.add(stage)
+
+    for stage in stage_dependencies:
+        visit(stage)
+
+
+def _check_routing(stage_dependencies: dict):
+    def ancestors(stage):
+        found = set()
+        for dependency in stage_dependencies.get(stage, []):
+            found |= {dependency} | ancestors(dependency)
+        return found
+
+    if not {"correctness", "language"} <= ancestors("improvement"):
+        raise ValueError("Routing needs improvement to run after correctness and language")
+    if stage_dependencies.get("metadata") != ["improvement"]:
+        raise ValueError("Routing needs metadata to depend on improvement alone")
+
+
+def build_workflow(stage_dependencies: dict, routing: bool = None):
+    """
+    Compiles a LangGraph app from a {stage: [dependencies]} DAG. With
+    routing, the improvement node triages the question and a conditional
+    edge after it continues to metadata or ends the run (see ROUTES).
+    """
+    from langgraph.graph import StateGraph, END
+
+    routing = ROUTING_ENABLED if routing is None else routing
+    _check_stage_dependencies(stage_dependencies)
+    if routing:
+        _check_routing(stage_dependencies)
+
+    nodes = stage_runnables()
+    workflow = StateGraph(QuestionState)
+    for stage in stage_dependencies:
+        workflow.add_node(stage, nodes["routed_improvement"] if routing and stage == "improvement" else nodes[stage])
+
+    has_dependents = set()
+    for stage, dependencies in stage_dependencies.items():
+        if not dependencies:
+            workflow.set_entry_point(stage)
+        elif routing and dependencies == ["improvement"]:
+            continue
+        elif len(dependencies) == 1:
+            workflow.add_edge(dependencies[0], stage)
+        else:
+            workflow.add_edge(list(dependencies), stage)
+        has_dependents.update(dependencies)
+    if routing:
+        workflow.add_conditional_edges(
+            "improvement", next_stage, {target: END if target == "end" else target for target in set(ROUTES.values())}
+        )
+
+    for stage in stage_dependencies:
+        if stage not in has_dependents:
+            workflow.add_edge(stage, END)
+
+    return workflow.compile()
+
+
+if PIPELINE_MODE not in PIPELINE_MODES:
+    raise ValueError(f"QC_PIPELINE_MODE must be one of {sorted(PIPELINE_MODES)}, got '{PIPELINE_MODE}'")
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    """
+    The compiled graph for QC_PIPELINE_MODE, built on first use (or by the
+    server's warm-up) rather than at import.
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_workflow(PIPELINE_MODES[PIPELINE_MODE])
+    return _app
+
+
+def warm_up() -> float:
+    """
+    Builds the graph and every agent's model now instead of on the first
+    question. Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    get_app()
+    for client in AGENT_CLIENTS.values():
+        client.model  # built on first access
+    elapsed = time.perf_counter() - start
+    metrics.warmup_seconds.set(elapsed)
+    print(f"Warmed up the graph and {len(AGENT_CLIENTS)} agent models in {elapsed * 1000:.0f}ms")
+    return elapsed
 
-def call_correctness_agent(state: QuestionState):
-    print("Calling Correctness Agent...")
-    question_text = state["question_text"]
-    try:
-        feedback = correctness_agent(question_text)
-        return {"correctness_feedback": feedback}
-    except Exception as e:
-        error_msg = f"Error calling correctness_agent: {e}"
-        print(error_msg)
-        return {"correctness_feedback": {"is_correct": False, "errors": [error_msg], "explanation": error_msg}, "errors": [error_msg]}
-
-def call_language_agent(state: QuestionState):
-    print("Calling Language Agent...")
-    question_text = state["question_text"]
-    try:
-        feedback = language_agent(question_text)
-        return {"language_feedback": feedback}
-    except Exception as e:
-        error_msg = f"Error calling language_agent: {e}"
-        print(error_msg)
-        return {"language_feedback": {"issues_found": True, "feedback": [error_msg], "explanation": error_msg}, "errors": [error_msg]}
-
-def call_improvement_agent(state: QuestionState):
-    print("Calling Improvement Agent...")
-    question_text = state["question_text"]
-    try:
-        feedback = improvement_agent(question_text)
-        return {"improvement_feedback": feedback, "question_text": feedback.get("improved_question", question_text)}
-    except Exception as e:
-        error_msg = f"Error calling improvement_agent: {e}"
-        print(error_msg)
-        return {"improvement_feedback": {"improved_question": question_text, "justification": error_msg}, "errors": [error_msg]}
-
-def call_metadata_agent(state: QuestionState):
-    print("Calling Metadata Agent...")
-    question_text = state["question_text"]
-    try:
-        feedback = metadata_agent(question_text)
-        return {"metadata_feedback": feedback}
-    except Exception as e:
-        error_msg = f"Error calling metadata_agent: {e}"
-        print(error_msg)
-        return {"metadata_feedback": {"topic": "Error", "subtopic": "Error", "blooms_level": "Error", "difficulty": "Error"}, "errors": [error_msg]}
-
-workflow = StateGraph(QuestionState)
-
-workflow.add_node("correctness", call_correctness_agent)
-workflow.add_node("language", call_language_agent)
-workflow.add_node("improvement", call_improvement_agent)
-workflow.add_node("metadata", call_metadata_agent)
-
-workflow.set_entry_point("correctness")
-
-workflow.add_edge("correctness", "language")
-workflow.add_edge("language", "improvement")
-workflow.add_edge("improvement", "metadata")
-
-workflow.add_edge("metadata", END)
-
-app = workflow.compile()
@@ -0,0 +1,152 @@
+"""
+Model backends for the agents. A backend builds, per agent, an object with the
+two GenerativeModel methods AgentClient uses, generate_content() and
+generate_content_async(), whose responses have `.text` and optionally
+`.usage_metadata`.
+
+QC_LLM_BACKEND picks the backend: "gemini" (default) or "mock", a local
+stand-in that needs no network or API key, for benchmarks and offline runs.
+
+The Gemini SDK is imported when the first Gemini model is built, not when
+this module is, since importing it takes most of a second.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import string
+import threading
+import time
+from types import SimpleNamespace
+
+from config import settings
+
+LLM_BACKEND = settings.llm_backend
+
+# Mock backend settings.
+MOCK_LATENCY_MS = settings.mock_latency_ms
+MOCK_JITTER_MS = settings.mock_jitter_ms
+# Fraction of calls that fail with a 503, to exercise retries and the breaker.
+MOCK_ERROR_RATE = settings.mock_error_rate
+MOCK_SEED = settings.mock_seed
+# Optional JSON file mapping agent name to its reply: an object, or a string
+# template that may use $agent, $digest (of the prompt) and $prompt_chars.
+# A key "agent@model" sets the reply of that agent's model only.
+MOCK_RESPONSES_FILE = settings.mock_responses_file
+
+# Replies carry a confidence, so a model cascade keeps them (QC_CASCADE_MODEL).
+MOCK_REPLIES = {
+    "correctness": {"is_correct": True, "errors": [], "explanation": "The question is factually and logically sound.",
+                    "needs_human_review": False, "confidence": 0.9},
+    # Flags an issue so questions take the improvement route and every stage runs.
+    "language": {"issues_found": True, "feedback": ["Clarity: state what is being asked."],
+                 "explanation": "The question is correct but could be clearer.", "confidence": 0.9},
+    "improvement": '{"improved_question": "Improved question $digest", "justification": "Mock rewrite by the $agent agent.", "confidence": 0.9}',
+    "metadata": {"topic": "Algebra", "subtopic": "Linear Equations", "blooms_level": "Apply", "difficulty": "Easy",
+                 "confidence": 0.9},
+}
+
+_BATCH_COUNT = re.compile(r"Number of questions: (\d+)")
+_gemini_configured = False
+
+
+def gemini_model(agent_name: str, model_name: str, system_instruction: str = None):
+    global _gemini_configured
+    import google.generativeai as genai
+
+    if not _gemini_configured:
+        genai.configure(api_key=settings.gemini_api_key or None)
+        _gemini_configured = True
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+class MockModel:
+    """
+    Answers every prompt with the agent's canned reply after a configurable
+    latency. Latency jitter and injected errors are drawn from a generator
+    seeded by the seed, the prompt and how often that prompt was seen, so a
+    run is reproducible and a retried prompt can succeed. Batched prompts get
+    an array with one reply per question.
+    """
+
+    def __init__(self, agent_name: str, reply, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, seed: int = 0, system_instruction: str = None):
+        self.agent_name = agent_name
+        self.system_instruction = system_instruction or ""
+        if isinstance(reply, str):
+            self.template = string.Template(reply)
+        else:
+            self.template = string.Template(json.dumps(reply, ensure_ascii=False).replace("$", "$$"))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def _plan(self, prompt: str):
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.calls += 1
+            attempt = self._seen[digest] = self._seen.get(digest, 0) + 1
+        rng = random.Random(f"{self.seed}:{digest}:{attempt}")
+        delay = (self.latency_ms + rng.uniform(0, self.jitter_ms)) / 1000
+        return digest, delay, rng.random() < self.error_rate
+
+    def _respond(self, prompt: str, digest: str):
+        reply = self.template.safe_substitute(agent=self.agent_name, digest=digest[:8], prompt_chars=len(prompt))
+        match = _BATCH_COUNT.search(prompt)
+        if match:
+            reply = "[" + ", ".join([reply] * int(match.group(1))) + "]"
+        usage = SimpleNamespace(prompt_token_count=(len(self.system_instruction) + len(prompt)) // 4, candidates_token_count=len(reply) // 4)
+        return SimpleNamespace(text=reply, usage_metadata=usage)
+
+    @staticmethod
+    def _injected_failure():
+        from google.api_core import exceptions as google_exceptions
+
+        return google_exceptions.ServiceUnavailable("Mock backend injected failure")
+
+    def generate_content(self, prompt: str, generation_config=None, request_options=None):
+        digest, delay, fail = self._plan(prompt)
+        time.sleep(delay)
+        if fail:
+            raise self._injected_failure()
+        return self._respond(prompt, digest)
+
+    async def generate_content_async(self, prompt: str, generation_config=None, request_options=None):
+        digest, delay, fail = self._plan(prompt)
+        await asyncio.sleep(delay)
+        if fail:
+            raise self._injected_failure()
+        return self._respond(prompt, digest)
+
+
+def mock_replies() -> dict:
+    replies = dict(MOCK_REPLIES)
+    if MOCK_RESPONSES_FILE:
+        with open(MOCK_RESPONSES_FILE, encoding="utf-8") as f:
+            replies.update(json.load(f))
+    return replies
+
+
+def mock_model(agent_name: str, model_name: str, system_instruction: str = None):
+    replies = mock_replies()
+    return MockModel(
+        agent_name, replies.get(f"{agent_name}@{model_name}", replies.get(agent_name, {})),
+        latency_ms=MOCK_LATENCY_MS, jitter_ms=MOCK_JITTER_MS,
+        error_rate=MOCK_ERROR_RATE, seed=MOCK_SEED, system_instruction=system_instruction
+    )
+
+
+BACKENDS = {"gemini": gemini_model, "mock": mock_model}
+
+
+def create_model(agent_name: str, model_name: str, system_instruction: str = None):
+    try:
+        factory = BACKENDS[LLM_BACKEND]
+    except KeyError:
+        raise ValueError(f"Unknown QC_LLM_BACKEND '{LLM_BACKEND}'; expected one of {sorted(BACKENDS)}")
+    return factory(agent_name, model_name, system_instruction)
@@ -1,20 +1,72 @@
+import asyncio
+import contextlib
+import math
+import time
 import uuid
-from fastapi import FastAPI, HTTPException
+from datetime import date, datetime
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 import os
 import json
-from langgraph_flow import app as langgraph_app, QuestionState
-from utils import append_question_version, get_question_versions, get_next_version_number, initialize_csv
+from config import settings
+from langgraph_flow import get_app, warm_up, initial_question_state, STAGE_OUTPUT_KEYS, QuestionProcessingError
+from batch_processor import process_batch, parse_batch_file, run_question, similar_reuse
+import job_queue
+import metrics
+import resilience
+import reprocessing
+import scheduling
+import exports
+from schemas import QuestionVersion, ProcessQuestionResponse, question_versions_from_rows
+from result_cache import agent_cache
+from agent_runtime import AGENT_CLIENTS, TokenBudgetExceeded, check_question_budget, load_prompts, install_reload_signal
+from utils import (
+    append_question_version_async, get_question_versions_async, find_similar_versions_async,
+    list_question_versions_async, get_stats_async, initialize_storage, export_snapshot
+)
+
+# Caps how many questions run through the LLM pipeline at once in this worker;
+# further requests wait for a free slot instead of piling onto the Gemini quota.
+MAX_CONCURRENT_QUESTIONS = settings.max_concurrent_questions
+question_slots = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepares the version store and job queue and loads the prompt templates,
+    so a missing or over-budget prompt stops startup, then takes requests
+    while the graph and the model SDK load in the background (QC_WARMUP).
+    Importing this module does none of this, so it stays cheap for workers
+    and tools.
+    """
+    start = time.perf_counter()
+    await asyncio.to_thread(initialize_storage)
+    await asyncio.to_thread(job_queue.initialize_job_tables)
+    await asyncio.to_thread(job_queue.requeue_stale_items)
+    await asyncio.to_thread(load_prompts)
+    install_reload_signal()
+    job_workers = job_queue.start_workers(job_queue.JOB_WORKERS) if job_queue.JOB_WORKERS > 0 else None
+    warmup = asyncio.create_task(asyncio.to_thread(warm_up)) if settings.warmup else None
+    metrics.startup_seconds.set(time.perf_counter() - start)
+    print(f"Ready to serve after {(time.perf_counter() - start) * 1000:.0f}ms of startup")
+    try:
+        yield
+    finally:
+        if job_workers:
+            await job_queue.stop_workers(*job_workers)
+        if warmup:
+            await warmup
 
-initialize_csv()
 
 app = FastAPI(
     title="AI QC + Enhancement Bot for Question Banks",
     description="Backend system to process MCQ/short-answer questions using Gemini LLM for QC, enhancement, and metadata extraction, with robust versioning.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -23,50 +75,147 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    timings = metrics.start_request_timing()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.http_request_seconds.observe(
+        elapsed, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+    )
+    if metrics.SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings, elapsed)
+    return response
+
 class ProcessQuestionRequest(BaseModel):
     question_text: str
     created_by: str
 
-class CorrectnessFeedback(BaseModel):
-    is_correct: Optional[bool] = None
-    errors: Optional[List[str]] = None
-    explanation: Optional[str] = None
-
-class LanguageFeedback(BaseModel):
-    issues_found: Optional[bool] = None
-    feedback: Optional[List[str]] = None
-    explanation: Optional[str] = None
-
-class ImprovementFeedback(BaseModel):
-    improved_question: Optional[str] = None
-    justification: Optional[str] = None
-
-class MetadataFeedback(BaseModel):
-    topic: Optional[str] = None
-    subtopic: Optional[str] = None
-    blooms_level: Optional[str] = None
-    difficulty: Optional[str] = None
+class BatchProcessRequest(BaseModel):
+    items: List[ProcessQuestionRequest]
+    workers: Optional[int] = None
+    rate_per_second: Optional[float] = None
 
-class QuestionVersion(BaseModel):
+class BatchItemResult(BaseModel):
+    index: int
+    question_id: str
+    status: str
+    version_number: int
+    original_question: str
+    processed_question: Optional[str] = None
+    errors: List[str] = []
+
+class BatchProcessResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    elapsed_seconds: float
+    results: List[BatchItemResult]
+
+class QuestionListResponse(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class StatsRow(BaseModel):
+    day: Optional[str] = None
+    author: Optional[str] = None
+    metadata_topic: Optional[str] = None
+    metadata_subtopic: Optional[str] = None
+    metadata_blooms_level: Optional[str] = None
+    metadata_difficulty: Optional[str] = None
+    versions: int
+    checked: int
+    passed: int
+    pass_rate: Optional[float] = None
+    language_checked: int
+    language_issues: int
+    language_issue_rate: Optional[float] = None
+
+class StatsResponse(BaseModel):
+    group_by: List[str]
+    items: List[StatsRow]
+
+class SimilarQuestion(BaseModel):
     question_id: str
     version_number: int
-    timestamp: str
     created_by: str
-    original_text: str
-    improved_text: str
-    correctness_feedback: Optional[CorrectnessFeedback] = None
-    language_feedback: Optional[LanguageFeedback] = None
-    improvement_feedback: Optional[ImprovementFeedback] = None
-    metadata: Optional[MetadataFeedback] = None
-
-class ProcessQuestionResponse(BaseModel):
+    similarity: float
+    text: str
+
+class SimilarQuestionsResponse(BaseModel):
+    threshold: float
+    items: List[SimilarQuestion]
+
+class ReprocessRequest(BaseModel):
+    question_text: Optional[str] = None
+    created_by: Optional[str] = None
+    stages: Optional[List[str]] = None
+
+class ReprocessResponse(BaseModel):
     question_id: str
     version_number: int
-    original_question: str
     processed_question: str
-    version_history: List[QuestionVersion]
+    created: bool
+    reused_stages: List[str]
+    recomputed_stages: List[str]
+    version: QuestionVersion
+
+class StageReprocessRequest(BaseModel):
+    stage: str
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[str] = None
+
+class StageReprocessResult(BaseModel):
+    question_id: str
+    status: str
+    version_number: Optional[int] = None
+    errors: List[str] = []
+
+class StageReprocessResponse(BaseModel):
+    stage: str
+    processed: int
+    failed: int
+    skipped: int
+    results: List[StageReprocessResult]
+    next_cursor: Optional[str] = None
+
+class JobSubmitRequest(BaseModel):
+    items: List[ProcessQuestionRequest]
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    total: int
+
+class JobItem(BaseModel):
+    index: int
+    status: str
+    attempts: int
+    question_id: Optional[str] = None
+    version_number: Optional[int] = None
+    processed_question: Optional[str] = None
+    error: Optional[str] = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    created_at: str
+    status: str
+    total: int
+    counts: Dict[str, int]
+    progress: float
+    items: Optional[List[JobItem]] = None
+
+def _check_question_budget(question_text: str):
+    try:
+        check_question_budget(question_text)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
 
 @app.post("/process_question/", response_model=ProcessQuestionResponse, summary="Process a question with AI QC and Enhancement")
 async def process_question(request: ProcessQuestionRequest):
@@ -77,174 +226,515 @@ async def process_question(request: ProcessQuestionRequest):
     question_id = str(uuid.uuid4())
     original_text = request.question_text
     created_by = request.created_by
+    _check_question_budget(original_text)
 
-    initial_version_number = get_next_version_number(question_id)
-    append_question_version(
+    # A new question_id has no history yet, so its versions are 1 and 2 and
+    # the response is built from the rows just written rather than re-read.
+    submitted_version = await append_question_version_async(
         question_id=question_id,
         original_text=original_text,
         created_by=created_by,
-        version_number=initial_version_number
+        version_number=1
     )
 
-    initial_state: QuestionState = {
-        "question_text": original_text,
-        "original_question_text": original_text,
-        "correctness_feedback": {},
-        "language_feedback": {},
-        "improvement_feedback": {},
-        "metadata_feedback": {},
-        "errors": []
-    }
-    final_state = langgraph_app.invoke(initial_state)
-
-    correctness_fb_raw = final_state.get("correctness_feedback", {})
-    language_fb_raw = final_state.get("language_feedback", {})
-    improvement_fb_raw = final_state.get("improvement_feedback", {})
-    metadata_fb_raw = final_state.get("metadata_feedback", {})
-    processed_question_text = final_state.get("question_text", original_text)
+    try:
+        with scheduling.traffic("interactive", created_by):
+            async with question_slots:
+                processed_question_text, final_state = await run_question(original_text)
+    except QuestionProcessingError as e:
+        circuit_wait = resilience.breaker.retry_after()
+        raise HTTPException(
+            status_code=503,
+            detail=f"AI processing failed, so only the submitted version of question {question_id} was saved: {e}",
+            headers={"Retry-After": str(math.ceil(circuit_wait))} if circuit_wait else None
+        )
 
-    ai_version_number = get_next_version_number(question_id)
-    append_question_version(
+    ai_version = await append_question_version_async(
         question_id=question_id,
         original_text=original_text,
         created_by="AI",
-        version_number=ai_version_number,
+        version_number=2,
         improved_text=processed_question_text,
-        correctness_feedback=correctness_fb_raw,
-        language_feedback=language_fb_raw,
-        improvement_feedback=improvement_fb_raw,
-        metadata_feedback=metadata_fb_raw
+        correctness_feedback=final_state.get("correctness_feedback", {}),
+        language_feedback=final_state.get("language_feedback", {}),
+        improvement_feedback=final_state.get("improvement_feedback", {}),
+        metadata_feedback=final_state.get("metadata_feedback", {}),
+        stage_fingerprints=final_state.get("stage_fingerprints"),
+        route=final_state.get("route")
     )
 
-    all_versions_raw = get_question_versions(question_id)
-    
-    all_versions = []
-    for v_raw in all_versions_raw:
-        correctness_fb = CorrectnessFeedback(
-            is_correct=v_raw.get("correctness_feedback_is_correct"),
-            errors=v_raw.get("correctness_feedback_errors"),
-            explanation=v_raw.get("correctness_feedback_explanation")
-        ) if v_raw.get("correctness_feedback_is_correct") is not None else None
-
-        language_fb = LanguageFeedback(
-            issues_found=v_raw.get("language_feedback_issues_found"),
-            feedback=v_raw.get("language_feedback_feedback"),
-            explanation=v_raw.get("language_feedback_explanation")
-        ) if v_raw.get("language_feedback_issues_found") is not None else None
-
-        improvement_fb = ImprovementFeedback(
-            improved_question=v_raw.get("improved_text"),
-            justification=v_raw.get("improvement_justification")
-        ) if v_raw.get("improvement_justification") is not None else None
-
-        metadata_fb = MetadataFeedback(
-            topic=v_raw.get("metadata_topic"),
-            subtopic=v_raw.get("metadata_subtopic"),
-            blooms_level=v_raw.get("metadata_blooms_level"),
-            difficulty=v_raw.get("metadata_difficulty")
-        ) if v_raw.get("metadata_topic") is not None else None
-
-        all_versions.append(QuestionVersion(
-            question_id=v_raw["question_id"],
-            version_number=v_raw["version_number"],
-            timestamp=v_raw["timestamp"],
-            created_by=v_raw["created_by"],
-            original_text=v_raw["original_text"],
-            improved_text=v_raw["improved_text"],
-            correctness_feedback=correctness_fb,
-            language_feedback=language_fb,
-            improvement_feedback=improvement_fb,
-            metadata=metadata_fb
-        ))
-
-  
-
-        response_data = ProcessQuestionResponse(
-            question_id=question_id,
-            version_number=ai_version_number,
-            original_question=original_text,
-            processed_question=processed_question_text,
-            version_history=all_versions
-        )
+    response_data = ProcessQuestionResponse(
+        question_id=question_id,
+        version_number=ai_version["version_number"],
+        original_question=original_text,
+        processed_question=processed_question_text,
+        route=final_state.get("route"),
+        version_history=question_versions_from_rows([submitted_version, ai_version])
+    )
 
-        print("[RESPONSE JSON] Final API response:")
-        print(json.dumps(response_data.dict()["version_history"][-1], indent=2))
+    if metrics.should_sample():
+        print("[DEBUG] Final API response:")
+        print(response_data.version_history[-1].model_dump_json(indent=2))
 
     return response_data
 
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/process_question/stream", summary="Process a question, streaming each agent's feedback as it completes")
+async def process_question_stream(request: ProcessQuestionRequest):
+    """
+    Server-Sent Events variant of /process_question/. Emits `accepted` once the
+    original version is stored, `reused` when a near-identical question's
+    feedback is reused, one `stage` event per agent as its graph node
+    finishes, a `route` event (before improvement's) once the checks decide
+    which stages follow, and `complete` with the stored AI version number. Failures are reported as an
+    `error` event.
+    """
+    question_id = str(uuid.uuid4())
+    original_text = request.question_text
+    _check_question_budget(original_text)
+
+    initial_version_number = 1
+    await append_question_version_async(
+        question_id=question_id,
+        original_text=original_text,
+        created_by=request.created_by,
+        version_number=initial_version_number
+    )
+
+    async def events():
+        yield _sse_event("accepted", {"question_id": question_id, "version_number": initial_version_number})
+
+        try:
+            with scheduling.traffic("interactive", request.created_by):
+                previous_stages, only_stages, reused_from = None, None, None
+                match = await similar_reuse(original_text)
+                if match:
+                    reused_from, previous_stages, only_stages = match[0], match[1], []
+                    yield _sse_event("reused", {"source_question_id": reused_from})
+                final_state = initial_question_state(original_text, previous_stages, only_stages, reused_from)
+                async with question_slots:
+                    async for update in get_app().astream(final_state):
+                        for stage, stage_update in update.items():
+                            # Merged like the graph's reducers for these keys (see QuestionState).
+                            errors = stage_update.pop("errors", [])
+                            reused_stages = stage_update.pop("reused_stages", [])
+                            fingerprints = stage_update.pop("stage_fingerprints", {})
+                            final_state.update(stage_update)
+                            final_state["errors"] = final_state["errors"] + errors
+                            final_state["reused_stages"] = final_state["reused_stages"] + reused_stages
+                            final_state["stage_fingerprints"] = {**final_state["stage_fingerprints"], **fingerprints}
+                            if "route" in stage_update:
+                                yield _sse_event("route", {"route": stage_update["route"], "reason": stage_update["route_reason"]})
+                            yield _sse_event("stage", {
+                                "stage": stage,
+                                "feedback": stage_update.get(STAGE_OUTPUT_KEYS.get(stage), {}),
+                                "question_text": final_state["question_text"],
+                                "errors": errors
+                            })
+
+            if final_state["errors"]:
+                raise QuestionProcessingError(final_state["errors"])
+            processed_question_text = final_state.get("question_text", original_text)
+            ai_version = await append_question_version_async(
+                question_id=question_id,
+                original_text=original_text,
+                created_by="AI",
+                improved_text=processed_question_text,
+                correctness_feedback=final_state.get("correctness_feedback", {}),
+                language_feedback=final_state.get("language_feedback", {}),
+                improvement_feedback=final_state.get("improvement_feedback", {}),
+                metadata_feedback=final_state.get("metadata_feedback", {}),
+                stage_fingerprints=final_state.get("stage_fingerprints"),
+                route=final_state.get("route")
+            )
+        except Exception as e:
+            print(f"[STREAM] Processing failed for question {question_id}: {e}")
+            yield _sse_event("error", {"question_id": question_id, "detail": str(e)})
+            return
+
+        yield _sse_event("complete", {
+            "question_id": question_id,
+            "version_number": ai_version["version_number"],
+            "initial_version_number": initial_version_number,
+            "original_question": original_text,
+            "processed_question": processed_question_text,
+            "route": final_state["route"],
+            "reused_stages": final_state["reused_stages"],
+            "errors": final_state["errors"]
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _run_batch(items: list, workers: Optional[int], rate_per_second: Optional[float]) -> BatchProcessResponse:
+    start = time.perf_counter()
+    results = await process_batch(items, workers=workers, rate_per_second=rate_per_second)
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return BatchProcessResponse(
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        elapsed_seconds=round(time.perf_counter() - start, 3),
+        results=results
+    )
+
+
+@app.post("/process_questions/batch", response_model=BatchProcessResponse, summary="Process a list of questions")
+async def process_questions_batch(request: BatchProcessRequest):
+    """
+    Runs every question through the AI pipeline with a bounded worker pool and
+    optional rate limit, stores all versions in one transaction, and returns
+    per-item results in input order.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No questions to process.")
+    items = [item.dict() for item in request.items]
+    return await _run_batch(items, request.workers, request.rate_per_second)
+
+
+@app.post("/process_questions/batch/upload", response_model=BatchProcessResponse, summary="Process questions from an uploaded CSV or JSONL file")
+async def process_questions_batch_upload(
+    file: UploadFile = File(...),
+    created_by: str = Form(...),
+    workers: Optional[int] = Form(None),
+    rate_per_second: Optional[float] = Form(None)
+):
+    """
+    Same as /process_questions/batch, reading questions from a .csv file with a
+    question_text column or a .jsonl file of {"question_text": ...} objects.
+    """
+    try:
+        items = parse_batch_file(file.filename or "", await file.read(), created_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="No questions to process.")
+    return await _run_batch(items, workers, rate_per_second)
+
+
+@app.post("/jobs", response_model=JobSubmitResponse, status_code=202, summary="Queue questions for background processing")
+async def submit_job(request: JobSubmitRequest):
+    """
+    Stores the questions in the durable job queue and returns a job id right
+    away. Poll /jobs/{job_id} or stream /jobs/{job_id}/events for progress.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No questions to process.")
+    return await asyncio.to_thread(job_queue.submit_job, [item.dict() for item in request.items])
+
+
+@app.post("/jobs/upload", response_model=JobSubmitResponse, status_code=202, summary="Queue questions from an uploaded CSV or JSONL file")
+async def submit_job_upload(file: UploadFile = File(...), created_by: str = Form(...)):
+    try:
+        items = parse_batch_file(file.filename or "", await file.read(), created_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="No questions to process.")
+    return await asyncio.to_thread(job_queue.submit_job, items)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus, response_model_exclude_none=True, summary="Job progress and, optionally, per-item results")
+async def get_job_status(job_id: str, include_items: bool = False):
+    job = await asyncio.to_thread(job_queue.get_job, job_id, include_items)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@app.get("/jobs/{job_id}/events", summary="Stream job progress as server-sent events")
+async def stream_job_status(job_id: str):
+    """
+    Emits a `progress` event whenever the job's counts change and a final
+    `done` event with per-item results once every item has finished.
+    """
+    job = await asyncio.to_thread(job_queue.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events():
+        last_counts = None
+        while True:
+            job = await asyncio.to_thread(job_queue.get_job, job_id)
+            if job["status"] == "completed":
+                job = await asyncio.to_thread(job_queue.get_job, job_id, True)
+                yield _sse_event("done", job)
+                return
+            if job["counts"] != last_counts:
+                last_counts = job["counts"]
+                yield _sse_event("progress", job)
+            await asyncio.sleep(job_queue.JOB_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/questions/similar", response_model=SimilarQuestionsResponse, summary="Find near-duplicates of a question")
+async def similar_questions(
+    text: Optional[str] = Query(None, description="Question text to look up"),
+    question_id: Optional[str] = Query(None, description="Look up the latest text of a stored question instead"),
+    threshold: float = Query(0.7, ge=0.0, le=1.0, description="Minimum Jaccard similarity of token shingles"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Returns stored questions whose text is nearly the same as `text` (or as
+    the question `question_id`, which is left out of the results), most
+    similar first. Numbers and symbols count, so questions that differ only
+    in their values score lower than rephrasings.
+    """
+    if (text is None) == (question_id is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of text or question_id")
+    if question_id is not None:
+        versions = await get_question_versions_async(question_id)
+        if not versions:
+            raise HTTPException(status_code=404, detail=f"No versions found for question_id: {question_id}")
+        latest = versions[-1]
+        text = latest["improved_text"] if latest["created_by"] == "AI" and latest["improved_text"] else latest["original_text"]
+    items = await find_similar_versions_async(text, threshold, limit, exclude_question_id=question_id)
+    return SimilarQuestionsResponse(threshold=threshold, items=items)
+
+
 @app.get("/questions/{question_id}/versions", response_model=List[QuestionVersion], summary="Retrieve all versions of a question")
 async def get_question_versions_endpoint(question_id: str):
     """
     Retrieves and returns all stored versions for a given question ID.
     """
-    versions_raw = get_question_versions(question_id)
+    versions_raw = await get_question_versions_async(question_id)
     if not versions_raw:
         raise HTTPException(status_code=404, detail=f"No versions found for question_id: {question_id}")
-    
-    all_versions = []
-    for v_raw in versions_raw:
-        correctness_fb = CorrectnessFeedback(
-            is_correct=v_raw.get("correctness_feedback_is_correct"),
-            errors=v_raw.get("correctness_feedback_errors"),
-            explanation=v_raw.get("correctness_feedback_explanation")
-        ) if v_raw.get("correctness_feedback_is_correct") is not None else None
-
-        language_fb = LanguageFeedback(
-            issues_found=v_raw.get("language_feedback_issues_found"),
-            feedback=v_raw.get("language_feedback_feedback"),
-            explanation=v_raw.get("language_feedback_explanation")
-        ) if v_raw.get("language_feedback_issues_found") is not None else None
-
-        improvement_fb = ImprovementFeedback(
-            improved_question=v_raw.get("improved_text"),
-            justification=v_raw.get("improvement_justification")
-        ) if v_raw.get("improvement_justification") is not None else None
-
-        metadata_fb = MetadataFeedback(
-            topic=v_raw.get("metadata_topic"),
-            subtopic=v_raw.get("metadata_subtopic"),
-            blooms_level=v_raw.get("metadata_blooms_level"),
-            difficulty=v_raw.get("metadata_difficulty")
-        ) if v_raw.get("metadata_topic") is not None else None
-
-        all_versions.append(QuestionVersion(
-            question_id=v_raw["question_id"],
-            version_number=v_raw["version_number"],
-            timestamp=v_raw["timestamp"],
-            created_by=v_raw["created_by"],
-            original_text=v_raw["original_text"],
-            improved_text=v_raw["improved_text"],
-            correctness_feedback=correctness_fb,
-            language_feedback=language_fb,
-            improvement_feedback=improvement_fb,
-            metadata=metadata_fb
-        ))
-    
-    return all_versions
-
-
-from fastapi import HTTPException
-from fastapi.responses import FileResponse
-import os
+    return question_versions_from_rows(versions_raw)
+
+
+@app.post("/questions/{question_id}/reprocess", response_model=ReprocessResponse,
+          summary="Re-run a stored question, recomputing only the stages whose inputs changed")
+async def reprocess_question(question_id: str, request: ReprocessRequest):
+    """
+    Reuses each stage output of the question's latest AI version whose input
+    fingerprint (question text, prompt, model) still matches. An edited
+    `question_text` is stored as a new version by `created_by` first. `stages`
+    re-runs exactly those stages and keeps the others as stored.
+    """
+    if request.question_text is not None and not request.created_by:
+        raise HTTPException(status_code=400, detail="created_by is required when question_text is edited")
+    unknown = set(request.stages or []) - set(STAGE_OUTPUT_KEYS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown stages: {', '.join(sorted(unknown))}")
+    try:
+        with scheduling.traffic("interactive", request.created_by):
+            result = await reprocessing.reprocess_question(
+                question_id, request.question_text, request.created_by, request.stages
+            )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except QuestionProcessingError as e:
+        raise HTTPException(status_code=503, detail=f"AI processing failed for question {question_id}: {e}")
+    version = result["version"]
+    return ReprocessResponse(
+        question_id=question_id,
+        version_number=version["version_number"],
+        processed_question=version["improved_text"],
+        created=result["created"],
+        reused_stages=result["reused_stages"],
+        recomputed_stages=result["recomputed_stages"],
+        version=question_versions_from_rows([version])[0]
+    )
 
-@app.get("/download-csv", summary="Download the entire question_versions.csv file")
-async def download_csv():
-    cwd = os.getcwd()
-    print(f"[DOWNLOAD CSV] Current working directory: {cwd}")
 
-    dir_listing = os.listdir(cwd)
-    print(f"[DOWNLOAD CSV] Files in cwd: {dir_listing}")
+@app.post("/reprocess/stage", response_model=StageReprocessResponse,
+          summary="Re-run one stage for questions whose stored output used an older prompt or model")
+async def reprocess_stage(request: StageReprocessRequest):
+    """
+    Processes one page of stale questions; call again with `next_cursor`
+    until it is null. Only the requested stage calls the model.
+    """
+    if request.stage not in STAGE_OUTPUT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown stage: {request.stage}")
+    try:
+        return await reprocessing.reprocess_stale_stage(request.stage, request.limit, request.cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    csv_path = os.path.join(cwd, "question_versions.csv")
-    print(f"[DOWNLOAD CSV] Attempting to serve: {csv_path}")
 
-    if not os.path.exists(csv_path):
-        print(f"[DOWNLOAD CSV] File not found: {csv_path}")
-        raise HTTPException(status_code=404, detail="CSV file not found.")
+@app.get("/cache/stats", summary="Agent result cache hit/miss counts")
+async def cache_stats():
+    """
+    Reports how many agent calls were answered from the result cache instead of Gemini.
+    """
+    return await asyncio.to_thread(agent_cache.stats)
 
-    print(f"[DOWNLOAD CSV] File found, sending: {csv_path}")
-    return FileResponse(csv_path, media_type="text/csv", filename="question_versions.csv")
+
+@app.get("/llm/usage", summary="Per-agent token use and budgets")
+async def llm_usage():
+    """
+    Prompt, completion and cached tokens reported by Gemini for each agent
+    since start-up, with the agent's token budgets and the size of its
+    system instruction.
+    """
+    return {name: client.usage() for name, client in sorted(AGENT_CLIENTS.items())}
+
+
+@app.get("/llm/scheduler", summary="Model calls queued and running, by priority class")
+async def llm_scheduler():
+    """
+    The scheduler's limits, and per priority class the calls waiting and
+    holding a slot, how many authors are waiting, and how long calls waited
+    for a slot since start-up.
+    """
+    return scheduling.scheduler.snapshot()
+
+
+@app.get("/health", summary="Liveness and warm-up state")
+async def health():
+    """
+    Answers once startup is done. `warm` turns true when the graph and the
+    agents' models are built, so the first question pays no loading cost.
+    """
+    return {"status": "ok", "warm": metrics.warmup_seconds.value > 0}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/reload-prompts", summary="Reload prompt templates from disk")
+async def reload_prompts():
+    """
+    Re-reads prompts/*.txt after an edit. Sending SIGHUP to the server does the same.
+    """
+    try:
+        return {"prompts": await asyncio.to_thread(load_prompts)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/questions", response_model=QuestionListResponse, summary="List stored versions, a page at a time")
+async def list_questions(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    created_by: Optional[str] = None,
+    metadata_topic: Optional[str] = None,
+    metadata_difficulty: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Only versions stored at or after this ISO timestamp"),
+    until: Optional[datetime] = Query(None, description="Only versions stored before this ISO timestamp"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return; all columns by default")
+):
+    """
+    Returns up to `limit` versions in storage order, filtered and projected as
+    requested. Pass the returned `next_cursor` back to get the following page.
+    """
+    try:
+        items, next_cursor = await list_question_versions_async(
+            limit=limit,
+            cursor=cursor,
+            fields=[field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+            since=since.isoformat() if since else None,
+            until=until.isoformat() if until else None,
+            created_by=created_by,
+            metadata_topic=metadata_topic,
+            metadata_difficulty=metadata_difficulty
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return QuestionListResponse(items=items, next_cursor=next_cursor)
+
+
+@app.get("/stats", response_model=StatsResponse, response_model_exclude_unset=True,
+         summary="QC pass and language-issue rates of AI versions")
+async def get_stats(
+    group_by: Optional[str] = Query(None, description="Comma-separated: day, author and at most one metadata_* column"),
+    author: Optional[str] = Query(None, description="Only versions checking text submitted by this author"),
+    since: Optional[date] = Query(None, description="Only versions stored on or after this day"),
+    until: Optional[date] = Query(None, description="Only versions stored before this day")
+):
+    """
+    Answers from counters kept up to date on every append, so the cost does
+    not grow with the stored history. A version's author is whoever created
+    the question text the AI checked.
+    """
+    columns = [column.strip() for column in group_by.split(",") if column.strip()] if group_by else []
+    try:
+        items = await get_stats_async(
+            group_by=columns,
+            author=author,
+            since=since.isoformat() if since else None,
+            until=until.isoformat() if until else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StatsResponse(group_by=columns, items=[StatsRow(**item) for item in items])
+
+
+async def _export_response(request: Request, export_format: str) -> Response:
+    snapshot = await asyncio.to_thread(export_snapshot)
+    etag = exports.export_etag(export_format, snapshot)
+    media_type, generate = exports.EXPORT_FORMATS[export_format]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="question_versions.{export_format}"'
+    }
+    if exports.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if exports.single_range(range_header) and (not if_range or if_range == etag):
+        path = await asyncio.to_thread(exports.snapshot_path, export_format, snapshot)
+        size = os.path.getsize(path)
+        byte_range = exports.parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        return StreamingResponse(
+            exports.read_file_range(path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={**headers, "Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}",
+                     "Content-Length": str(end - start + 1)}
+        )
+
+    if exports.accepts_gzip(request.headers.get("accept-encoding")):
+        return StreamingResponse(
+            exports.gzip_chunks(generate(snapshot[1])),
+            media_type=media_type,
+            headers={**headers, "Content-Encoding": "gzip", "ETag": etag[:-1] + '-gzip"'}
+        )
+    return StreamingResponse(
+        exports.encode_chunks(generate(snapshot[1])),
+        media_type=media_type,
+        headers={**headers, "Accept-Ranges": "bytes"}
+    )
+
+
+@app.get("/export", summary="Download the entire version history as CSV or JSONL")
+async def export_versions(request: Request, format: str = Query("csv", pattern="^(csv|jsonl)$")):
+    """
+    Streams every stored version, gzip-compressed when the client accepts it.
+    Responses carry an ETag, so unchanged history answers 304 Not Modified,
+    and uncompressed downloads can be resumed with a Range header.
+    """
+    return await _export_response(request, format)
+
+
+@app.get("/download-csv", summary="Download the entire version history as CSV")
+async def download_csv(request: Request):
+    """
+    Same as /export?format=csv, in the legacy question_versions.csv column layout.
+    """
+    return await _export_response(request, "csv")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,302 @@
+"""
+In-process latency and size histograms, exposed in the Prometheus text format
+on /metrics, plus an optional per-request timing breakdown sent back in the
+Server-Timing response header.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+
+# Adds a Server-Timing header with the stages, LLM calls and storage
+# operations each request spent time in.
+SERVER_TIMING = settings.server_timing
+# Fraction of LLM calls whose raw response is logged; 0 logs none.
+DEBUG_SAMPLE_RATE = settings.debug_sample_rate
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+
+_registry = []
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read when /metrics is rendered, from `read()` if given, else the
+    last value passed to set(). With `labelnames`, `read()` returns a dict of
+    values keyed by label value tuples.
+    """
+
+    def __init__(self, name: str, help_text: str, read=None, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.labelnames = tuple(labelnames)
+        self.value = 0
+        _registry.append(self)
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        if self.labelnames:
+            for key, value in sorted(self.read().items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+            return lines
+        value = self.read() if self.read else self.value
+        return lines + [f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "qc_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"))
+stage_seconds = Histogram(
+    "qc_stage_duration_seconds", "Graph node latency.", ("stage",))
+stage_runs = Counter(
+    "qc_stage_runs_total", "Graph stage runs, by whether the previous version's output was reused.", ("stage", "outcome"))
+routes = Counter(
+    "qc_routes_total", "Questions by the path chosen after the correctness and language checks.", ("route",))
+llm_request_seconds = Histogram(
+    "qc_llm_request_duration_seconds", "Gemini call latency.", ("agent", "kind", "outcome"))
+llm_prompt_chars = Histogram(
+    "qc_llm_prompt_chars", "Prompt size in characters.", ("agent",), SIZE_BUCKETS)
+llm_response_chars = Histogram(
+    "qc_llm_response_chars", "Response size in characters.", ("agent",), SIZE_BUCKETS)
+llm_tokens = Histogram(
+    "qc_llm_tokens", "Token counts reported by Gemini.", ("agent", "direction"), TOKEN_BUCKETS)
+llm_tokens_total = Counter(
+    "qc_llm_tokens_total", "Tokens reported by Gemini (prompt, completion, and the cached part of the prompt).",
+    ("agent", "direction"))
+llm_errors = Counter(
+    "qc_llm_errors_total", "Failed Gemini calls and unparseable responses.", ("agent", "error_type"))
+llm_retries = Counter(
+    "qc_llm_retries_total", "Follow-up Gemini requests: re-asks after unparseable replies and single calls after failed batches.", ("agent", "reason"))
+llm_cascade = Counter(
+    "qc_llm_cascade_total", "Cascade model answers: accepted, or escalated to the agent's model and why.",
+    ("agent", "outcome"))
+json_parse_methods = Counter(
+    "qc_json_parse_total", "Parsed responses by what parsing took (direct, fenced, embedded, repaired).",
+    ("agent", "method"))
+json_extract_seconds = Histogram(
+    "qc_json_extract_duration_seconds", "Time spent extracting JSON from a response.", ("agent",))
+llm_backoff_seconds = Histogram(
+    "qc_llm_backoff_seconds", "Sleep before retrying a transient Gemini failure.", ("agent",))
+llm_rate_limit_wait_seconds = Histogram(
+    "qc_llm_rate_limit_wait_seconds", "Time a Gemini call waited for the shared rate limiter.", ("agent",))
+llm_rate_limit_tokens = Gauge(
+    "qc_llm_rate_limit_tokens", "Shared rate limiter tokens after this process's last request; negative means queued.")
+llm_queue_wait_seconds = Histogram(
+    "qc_llm_queue_wait_seconds", "Time model calls waited for a scheduler slot, by priority class.", ("priority",))
+llm_circuit_transitions = Counter(
+    "qc_llm_circuit_transitions_total", "Circuit breaker state changes.", ("state",))
+startup_seconds = Gauge(
+    "qc_startup_seconds", "Time the server's startup took before it began taking requests.")
+warmup_seconds = Gauge(
+    "qc_warmup_seconds", "Time spent building the graph and the agents' models after startup; 0 until done.")
+storage_seconds = Histogram(
+    "qc_storage_duration_seconds", "Version store and job queue operation latency.", ("operation",))
+group_commit_versions = Histogram(
+    "qc_storage_group_commit_versions", "Versions written per group-commit transaction.", (),
+    (1, 2, 4, 8, 16, 32, 64, 128, 512))
+
+
+# Per-request timing breakdown: a list of (name, seconds) shared by every
+# task and worker thread started while handling the request.
+_request_timings = contextvars.ContextVar("qc_request_timings", default=None)
+
+
+def start_request_timing() -> list:
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def server_timing_header(timings: list, total_seconds: float) -> str:
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+@contextmanager
+def timer(histogram: Histogram, timing_name: str = None, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        if timing_name:
+            record_timing(timing_name, elapsed)
+
+
+def storage_timer(operation: str):
+    """
+    Times a version store or job queue call. Usable as a decorator.
+    """
+    return timer(storage_seconds, f"db_{operation}", operation=operation)
+
+
+def timed_stage(stage: str):
+    """
+    Decorates a sync or async graph node to record its latency.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(state):
+                with timer(stage_seconds, f"stage_{stage}", stage=stage):
+                    return await fn(state)
+        else:
+            @functools.wraps(fn)
+            def wrapper(state):
+                with timer(stage_seconds, f"stage_{stage}", stage=stage):
+                    return fn(state)
+        return wrapper
+    return decorate
+
+
+class LLMCall:
+    """
+    Records one Gemini request: latency, prompt and response size, reported
+    token usage, and the error type if it fails. The prompt size includes the
+    model's system instruction, which is billed with every request.
+    """
+
+    def __init__(self, agent: str, prompt: str, kind: str = "single", system_instruction: str = None):
+        self.agent = agent
+        self.prompt = prompt
+        self.kind = kind
+        self.system_instruction = system_instruction
+        self.prompt_tokens = self.completion_tokens = self.cached_tokens = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        llm_prompt_chars.observe(len(self.prompt) + len(self.system_instruction or ""), agent=self.agent)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = self.seconds = time.perf_counter() - self.start
+        outcome = "ok" if exc_type is None else "error"
+        llm_request_seconds.observe(elapsed, agent=self.agent, kind=self.kind, outcome=outcome)
+        record_timing(f"llm_{self.agent}", elapsed)
+        if exc_type is not None:
+            llm_errors.inc(agent=self.agent, error_type=exc_type.__name__)
+        return False
+
+    def response(self, response):
+        try:
+            text = response.text or ""
+        except ValueError:
+            # Blocked or empty candidates; the caller reports the error.
+            text = ""
+        llm_response_chars.observe(len(text), agent=self.agent)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+            self.completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+            self.cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+            for direction, tokens in (("prompt", self.prompt_tokens), ("completion", self.completion_tokens),
+                                      ("cached", self.cached_tokens)):
+                if tokens:
+                    if direction != "cached":
+                        llm_tokens.observe(tokens, agent=self.agent, direction=direction)
+                    llm_tokens_total.inc(tokens, agent=self.agent, direction=direction)
+
+
+def should_sample() -> bool:
+    return DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
+
+
+def debug_log(message: str):
+    if should_sample():
+        print(f"[DEBUG] {message}")
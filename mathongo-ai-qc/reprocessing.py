@@ -0,0 +1,165 @@
+"""
+Re-processing of stored questions that only re-runs the stages whose inputs
+changed. Each AI version is stored with a fingerprint per stage (the question
+text the agent saw, its prompt hash, model and temperature); a re-run rebuilds
+the stage outputs from the latest AI version and reuses every stage whose
+fingerprint still matches.
+
+Bulk re-runs of one stage, e.g. after editing prompts/metadata_prompt.txt:
+
+    python -m reprocessing --stage metadata
+"""
+import argparse
+import asyncio
+
+import utils
+from agent_runtime import AGENT_CLIENTS
+from config import settings
+from batch_processor import run_question, ai_question_version, previous_stages_from_version
+from langgraph_flow import STAGE_OUTPUT_KEYS
+
+REPROCESS_WORKERS = settings.reprocess_workers
+
+
+def _stage_summary(final_state: dict) -> dict:
+    # Stages the route skipped or answered without the agent are in neither list.
+    reused = [stage for stage in STAGE_OUTPUT_KEYS if stage in final_state.get("reused_stages", [])]
+    computed = [stage for stage in STAGE_OUTPUT_KEYS
+                if stage in final_state.get("stage_fingerprints", {}) and stage not in reused]
+    return {"reused_stages": reused, "recomputed_stages": computed}
+
+
+async def reprocess_question(question_id: str, question_text: str = None, created_by: str = "AI",
+                             only_stages: list = None) -> dict:
+    """
+    Re-runs a stored question, reusing the stage outputs of its latest AI
+    version whose inputs are unchanged. A new `question_text` is first stored
+    as an edited version by `created_by`. With `only_stages`, exactly those
+    stages run and the others keep their stored output.
+
+    Returns {"version", "reused_stages", "recomputed_stages", "created"}; no
+    version is written when every stage was reused. Raises LookupError for an
+    unknown question, and QuestionProcessingError if a stage fails.
+    """
+    versions = await utils.get_question_versions_async(question_id)
+    if not versions:
+        raise LookupError(f"Question {question_id} not found")
+
+    ai_versions = [version for version in versions if version["created_by"] == "AI"]
+    base = ai_versions[-1] if ai_versions else None
+    previous_stages = {}
+    if base is not None:
+        fingerprints = await utils.get_stage_fingerprints_async(question_id, base["version_number"])
+        previous_stages = previous_stages_from_version(base, fingerprints)
+    elif only_stages is not None:
+        raise LookupError(f"Question {question_id} has no AI version to reuse stages from")
+
+    submitted_text = (base or versions[-1])["original_text"]
+    edited = question_text is not None and question_text != submitted_text
+    if edited:
+        await utils.append_question_version_async(
+            question_id=question_id,
+            original_text=question_text,
+            created_by=created_by
+        )
+        submitted_text = question_text
+
+    processed_question_text, final_state = await run_question(submitted_text, previous_stages, only_stages)
+    summary = _stage_summary(final_state)
+    if base is not None and not edited and not summary["recomputed_stages"]:
+        return {"version": base, **summary, "created": False}
+
+    version = await utils.append_question_version_async(
+        **ai_question_version(question_id, submitted_text, processed_question_text, final_state, version_number=None)
+    )
+    return {"version": version, **summary, "created": True}
+
+
+def current_stage_signature(stage: str) -> tuple:
+    """
+    (prompt_sha256, model) the stage's agent uses now.
+    """
+    fingerprint = AGENT_CLIENTS[stage].fingerprint("")
+    return fingerprint["prompt_sha256"], fingerprint["model"]
+
+
+async def reprocess_stale_stage(stage: str, limit: int = 100, cursor: str = None, workers: int = None) -> dict:
+    """
+    Re-runs only `stage` for up to `limit` questions whose latest AI version
+    was produced with a different prompt or model for that stage, and stores
+    the results in one bulk write. Questions whose route never reaches the
+    stage are reported as skipped and nothing is written for them. Returns
+    the per-question results and the cursor for the next page (None when
+    done); failed questions are skipped by the cursor rather than retried
+    forever.
+    """
+    if stage not in STAGE_OUTPUT_KEYS:
+        raise ValueError(f"Unknown stage: {stage}")
+    prompt_sha256, model = current_stage_signature(stage)
+    stale, next_cursor = await utils.list_stale_stage_versions_async(stage, prompt_sha256, model, limit, cursor)
+
+    queue = asyncio.Queue()
+    for version in stale:
+        queue.put_nowait(version)
+    results = []
+    new_versions = []
+
+    async def worker():
+        while not queue.empty():
+            version = queue.get_nowait()
+            previous_stages = previous_stages_from_version(version, version["stage_fingerprints"])
+            try:
+                processed_question_text, final_state = await run_question(
+                    version["original_text"], previous_stages, only_stages=[stage]
+                )
+            except Exception as e:
+                print(f"[REPROCESS] {stage} failed for question {version['question_id']}: {e}")
+                results.append({"question_id": version["question_id"], "status": "failed",
+                                "errors": getattr(e, "errors", [str(e)])})
+                continue
+            if stage not in _stage_summary(final_state)["recomputed_stages"]:
+                # The route ended before the stage (e.g. needs_human), so there is nothing new to store.
+                results.append({"question_id": version["question_id"], "status": "skipped", "errors": []})
+                continue
+            new_versions.append(ai_question_version(
+                version["question_id"], version["original_text"], processed_question_text, final_state, version_number=None
+            ))
+            results.append({"question_id": version["question_id"], "status": "ok", "errors": []})
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers or REPROCESS_WORKERS, len(stale) or 1)))))
+    if new_versions:
+        stored = await utils.append_question_versions_bulk_async(new_versions)
+        numbers = {version["question_id"]: version["version_number"] for version in stored}
+        for result in results:
+            result["version_number"] = numbers.get(result["question_id"])
+    return {
+        "stage": stage,
+        "processed": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "skipped": sum(result["status"] == "skipped" for result in results),
+        "results": results,
+        "next_cursor": next_cursor
+    }
+
+
+async def reprocess_all(stage: str, page_size: int):
+    cursor = None
+    totals = {"processed": 0, "failed": 0, "skipped": 0}
+    while True:
+        page = await reprocess_stale_stage(stage, page_size, cursor)
+        for key in totals:
+            totals[key] += page[key]
+        print(f"[REPROCESS] {stage}: {totals['processed']} re-run, {totals['failed']} failed, {totals['skipped']} skipped")
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run one stage for every question whose stored output is stale.")
+    parser.add_argument("--stage", required=True, choices=sorted(STAGE_OUTPUT_KEYS))
+    parser.add_argument("--page-size", type=int, default=200)
+    args = parser.parse_args()
+
+    utils.initialize_storage()
+    asyncio.run(reprocess_all(args.stage, args.page_size))
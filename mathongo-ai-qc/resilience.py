@@ -0,0 +1,269 @@
+"""
+The guard around every Gemini request: a slot from the priority scheduler
+(scheduling.py), a rate limiter shared by all agents and worker processes,
+a per-call timeout, retries with jittered exponential
+backoff for transient failures, and a circuit breaker that fails fast while
+the upstream is down.
+"""
+import asyncio
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+import metrics
+import scheduling
+import utils
+from config import settings
+
+LLM_MAX_RETRIES = settings.llm_max_retries
+LLM_BACKOFF_BASE_SECONDS = settings.llm_backoff_base_seconds
+LLM_BACKOFF_MAX_SECONDS = settings.llm_backoff_max_seconds
+LLM_TIMEOUT_SECONDS = settings.llm_timeout_seconds
+# Gemini requests per second across every agent and every process using the
+# same database; 0 disables the limiter.
+LLM_RATE_PER_SECOND = settings.llm_rate_per_second
+LLM_RATE_BURST = settings.llm_rate_burst or max(1.0, LLM_RATE_PER_SECOND)
+# SQLite file holding the limiter's bucket; empty puts it next to the version
+# store as <QC_DB_FILE>-ratelimit.
+LLM_RATE_DB_FILE = settings.llm_rate_db_file
+BREAKER_FAILURE_THRESHOLD = settings.llm_breaker_threshold
+BREAKER_RESET_SECONDS = settings.llm_breaker_reset_seconds
+
+# HTTP statuses worth retrying: timeouts, rate limits and server errors.
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # The SDK's exceptions are only loaded once a Gemini model has been built,
+    # and no call can have raised one before that.
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    if google_exceptions is not None and isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: uniform in [0, base * 2^attempt], capped.
+    """
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive transient failures and rejects calls
+    for `reset_seconds`. Then one trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            metrics.llm_circuit_transitions.inc(state=state)
+            print(f"[LLM] Circuit breaker {state}")
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the circuit lets a call through; 0 when it would now.
+        """
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpenError("Gemini circuit breaker is open; upstream is failing")
+                self._set_state("half_open")
+            if self.state == "half_open":
+                # A trial that never reported back (e.g. cancelled) stops blocking after reset_seconds.
+                now = time.monotonic()
+                if self._trial_started is not None and now - self._trial_started < self.reset_seconds:
+                    raise CircuitOpenError("Gemini circuit breaker is half-open; waiting for the trial call")
+                self._trial_started = now
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_started = None
+            self._set_state("closed")
+
+    def record_failure(self, transient: bool):
+        with self._lock:
+            self._trial_started = None
+            if not transient:
+                # The upstream answered; only the request was bad.
+                if self.state == "half_open":
+                    self._set_state("closed")
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+
+class SharedTokenBucket:
+    """
+    Token bucket kept in a small SQLite file of its own, so every agent,
+    thread and worker process draws from one budget without taking the
+    version store's write lock. Each call reserves a token in a short write
+    transaction and sleeps until its reservation comes due; a negative
+    balance is the queue of reservations.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_rate_limit (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, db_file: str = ""):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def path(self) -> str:
+        return self.db_file or f"{utils.DB_FILE}-ratelimit"
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, like utils.get_connection(). The balance
+        # only matters for the next second or so, so commits skip the fsync.
+        path = self.path()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.path != path:
+            conn = sqlite3.connect(path, timeout=30)
+            conn.execute("PRAGMA journal_mode = wal")
+            conn.execute("PRAGMA synchronous = off")
+            with conn:
+                conn.execute(self.SCHEMA)
+            self._local.conn = conn
+            self._local.path = path
+        return conn
+
+    def reserve(self) -> float:
+        """
+        Takes one token and returns how many seconds to wait before using it.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM llm_rate_limit WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_rate_limit (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        metrics.llm_rate_limit_tokens.set(round(tokens, 3))
+        return max(0.0, -tokens / self.rate)
+
+    def acquire(self, agent: str):
+        wait = self.reserve()
+        metrics.llm_rate_limit_wait_seconds.observe(wait, agent=agent)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, agent: str):
+        wait = await asyncio.to_thread(self.reserve)
+        metrics.llm_rate_limit_wait_seconds.observe(wait, agent=agent)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+rate_limiter = SharedTokenBucket("gemini", LLM_RATE_PER_SECOND, LLM_RATE_BURST, LLM_RATE_DB_FILE) if LLM_RATE_PER_SECOND > 0 else None
+metrics.Gauge("qc_llm_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.",
+              read=lambda: CircuitBreaker.STATES[breaker.state])
+
+
+def _should_retry(error: Exception, attempt: int, agent: str) -> bool:
+    transient = is_transient(error)
+    breaker.record_failure(transient)
+    if not transient or attempt >= LLM_MAX_RETRIES or breaker.state == "open":
+        return False
+    metrics.llm_retries.inc(agent=agent, reason="transient_error")
+    print(f"[{agent}_agent] Transient Gemini error, retrying ({attempt + 1}/{LLM_MAX_RETRIES}): {error}")
+    return True
+
+
+def call_with_retries(agent: str, call):
+    """
+    Runs `call()` (one Gemini request) under the limiter, scheduler, breaker
+    and retry policy. Each attempt takes a rate token, then waits for its own
+    slot; neither the token wait nor the backoff holds a slot, so a
+    rate-limited bulk call never keeps an interactive one waiting.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire(agent)
+        breaker.before_call()
+        with scheduling.scheduler.slot():
+            try:
+                result = call()
+            except Exception as e:
+                if not _should_retry(e, attempt, agent):
+                    raise
+            else:
+                breaker.record_success()
+                return result
+        delay = backoff_delay(attempt)
+        metrics.llm_backoff_seconds.observe(delay, agent=agent)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def acall_with_retries(agent: str, make_call):
+    """
+    Async variant: `make_call()` returns a fresh coroutine for each attempt,
+    which is cancelled after LLM_TIMEOUT_SECONDS (not counting the wait for
+    a scheduler slot).
+    """
+    attempt = 0
+    while True:
+        if rate_limiter:
+            await rate_limiter.aacquire(agent)
+        breaker.before_call()
+        async with scheduling.scheduler.aslot():
+            try:
+                result = await asyncio.wait_for(make_call(), timeout=LLM_TIMEOUT_SECONDS)
+            except Exception as e:
+                if not _should_retry(e, attempt, agent):
+                    raise
+            else:
+                breaker.record_success()
+                return result
+        delay = backoff_delay(attempt)
+        metrics.llm_backoff_seconds.observe(delay, agent=agent)
+        await asyncio.sleep(delay)
+        attempt += 1
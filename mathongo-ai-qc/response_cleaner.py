@@ -1,21 +1,154 @@
+import itertools
 import re
 import json
 from typing import Any
 
+_VALUE_START = re.compile(r"[{\[]")
+_decoder = json.JSONDecoder(strict=False)
 
-def extract_clean_json(text: str, debug: bool = False) -> Any:
+
+def _loads(text: str) -> Any:
+    # strict=False accepts raw newlines and tabs inside strings, which the
+    # model often emits in long explanations.
+    return _decoder.decode(text)
+
+
+def _fenced_block(text: str):
+    """
+    The contents of the first ``` fence (an unclosed fence runs to the end
+    of the text), or None if there is no fence.
+    """
+    start = text.find("```")
+    if start == -1:
+        return None
+    start += 3
+    if text[start:start + 4].lower() == "json":
+        start += 4
+    end = text.find("```", start)
+    return (text[start:] if end == -1 else text[start:end]).strip()
+
+
+def _strip_trailing_comma(chars: list):
+    index = len(chars) - 1
+    while index >= 0 and chars[index].isspace():
+        index -= 1
+    if index >= 0 and chars[index] == ",":
+        del chars[index:]
+
+
+def _close(chars: list, stack: list, in_string: bool) -> str:
+    chars = list(chars)
+    if in_string:
+        if chars and chars[-1] == "\\":
+            chars.pop()
+        chars.append('"')
+    _strip_trailing_comma(chars)
+    while chars and chars[-1].isspace():
+        chars.pop()
+    if chars and chars[-1] == ":":
+        chars.append("null")
+    for closer in reversed(stack):
+        _strip_trailing_comma(chars)
+        chars.append(closer)
+    return "".join(chars)
+
+
+def repair_json(text: str) -> list:
+    """
+    Returns candidate repairs of a JSON value that starts at text[0]: trailing
+    commas removed, anything after the value dropped, and, if the text was cut
+    off, open strings and brackets closed (then the same with the last
+    incomplete member cut away). The caller tries them in order.
+    """
+    chars = []
+    stack = []
+    commas = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            chars.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+            chars.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            chars.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(chars)
+            if stack:
+                stack.pop()
+            chars.append(ch)
+            if not stack:
+                return ["".join(chars)]
+        else:
+            if ch == ",":
+                commas.append((len(chars), list(stack)))
+            chars.append(ch)
+
+    candidates = [_close(chars, stack, in_string)]
+    for position, comma_stack in reversed(commas[-2:]):
+        candidates.append(_close(chars[:position], comma_stack, False))
+    return candidates
+
+
+def parse_json_response(text: str) -> tuple:
+    """
+    Parses the JSON value in an LLM response. Returns (value, method), where
+    method says what it took: "direct", "fenced", "embedded" (surrounded by
+    prose) or "repaired" (trailing commas or truncated output). Raises
+    ValueError when nothing parses.
+    """
     text = text.strip()
+    if not text:
+        raise ValueError("Empty response.")
+
+    if text[0] in "{[":
+        try:
+            return _loads(text), "direct"
+        except ValueError:
+            pass
 
-    match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text, re.IGNORECASE)
-    if not match:
-        raise ValueError("No valid JSON block found in input.")
+    fenced = _fenced_block(text)
+    if fenced is not None:
+        try:
+            return _loads(fenced), "fenced"
+        except ValueError:
+            pass
+        if fenced and fenced[0] in "{[":
+            text = fenced
 
-    cleaned = match.group(1).strip()
+    error = None
+    # A JSON value at the first brace wins, even if it needs repair; later
+    # braces are only tried when prose before the JSON contains one.
+    for match in itertools.islice(_VALUE_START.finditer(text), 5):
+        start = match.start()
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            return value, "embedded"
+        except ValueError as e:
+            error = error or e
+        for candidate in repair_json(text[start:]):
+            try:
+                return _loads(candidate), "repaired"
+            except ValueError:
+                continue
+    if error is None:
+        raise ValueError("No JSON object or array found in response.")
+    raise ValueError(f"Could not parse JSON from response: {error}")
 
+
+def extract_clean_json(text: str, debug: bool = False) -> Any:
     try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError as e:
+        return parse_json_response(text)[0]
+    except ValueError:
         if debug:
-            print("[!] JSON decode error:", e)
-            print("[!] Extracted JSON:\n", cleaned)
+            print("[!] Could not extract JSON from:\n", text)
         raise
@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config import settings
+
+CACHE_ENABLED = settings.cache_enabled
+CACHE_MAX_ENTRIES = settings.cache_max_entries
+CACHE_TTL_SECONDS = settings.cache_ttl_seconds
+# Optional on-disk tier that survives restarts; empty keeps the cache in memory only.
+CACHE_DB_FILE = settings.cache_db_file
+
+
+def normalize_question_text(question_text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", question_text).split())
+
+
+def make_cache_key(agent_name: str, question_text: str, template_hash: str, model_name: str, temperature: float) -> str:
+    """
+    Content address of one agent call: the same question, prompt template
+    (by its sha256), model and temperature always map to the same key.
+    """
+    material = json.dumps(
+        [agent_name, normalize_question_text(question_text), template_hash, model_name, temperature],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of parsed agent feedback with a TTL, backed by an optional
+    SQLite file that is opened on first use. Lookups check memory first, then
+    disk, promoting disk hits.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_file: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_file = db_file
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db = None
+
+    def _connection(self):
+        # Called with the lock held.
+        if self._db is None and self.db_file:
+            self._db = sqlite3.connect(self.db_file, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM cache_entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        return self._db
+
+    def _count(self, agent_name: str, outcome: str):
+        counts = self._stats.setdefault(agent_name, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def get(self, key: str, agent_name: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._count(agent_name, "memory_hits")
+                    return copy.deepcopy(value)
+                del self._entries[key]
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value, created_at FROM cache_entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    value = json.loads(row[0])
+                    self._store_in_memory(key, value, row[1])
+                    self._count(agent_name, "disk_hits")
+                    return copy.deepcopy(value)
+
+            self._count(agent_name, "misses")
+            return None
+
+    def _store_in_memory(self, key: str, value, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, value):
+        created_at = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store_in_memory(key, value, created_at)
+            db = self._connection()
+            if db is not None:
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO cache_entries (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), created_at)
+                    )
+
+    async def aget(self, key: str, agent_name: str):
+        # With a disk tier, lookups may read the file, so they run off the event loop.
+        if not self.db_file:
+            return self.get(key, agent_name)
+        return await asyncio.to_thread(self.get, key, agent_name)
+
+    async def aput(self, key: str, value):
+        if not self.db_file:
+            self.put(key, value)
+            return
+        await asyncio.to_thread(self.put, key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_agent = copy.deepcopy(self._stats)
+            disk_entries = None
+            db = self._connection()
+            if db is not None:
+                disk_entries = db.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            memory_entries = len(self._entries)
+
+        hits = sum(c["memory_hits"] + c["disk_hits"] for c in by_agent.values())
+        misses = sum(c["misses"] for c in by_agent.values())
+        return {
+            "enabled": CACHE_ENABLED,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+            "by_agent": by_agent
+        }
+
+
+agent_cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DB_FILE)
+
+
+def get_cached_feedback(key: str, agent_name: str):
+    if not CACHE_ENABLED:
+        return None
+    return agent_cache.get(key, agent_name)
+
+
+def store_feedback(key: str, feedback: dict):
+    if CACHE_ENABLED:
+        agent_cache.put(key, feedback)
+
+
+async def aget_cached_feedback(key: str, agent_name: str):
+    if not CACHE_ENABLED:
+        return None
+    return await agent_cache.aget(key, agent_name)
+
+
+async def astore_feedback(key: str, feedback: dict):
+    if CACHE_ENABLED:
+        await agent_cache.aput(key, feedback)
@@ -0,0 +1,260 @@
+"""
+Admission control for model calls. Every attempt resilience.py makes waits
+here for one of SCHEDULER_MAX_CONCURRENCY slots in this process and, when
+SCHEDULER_RATE_PER_SECOND is set, for a token of that rate budget.
+
+Waiting calls are ordered by priority class, interactive before bulk, and
+within a class round-robin by the created_by that started them, so one
+author's 5,000-question import takes turns with every other author's
+upload instead of queueing them behind it. Bulk calls never hold more than
+SCHEDULER_BULK_SHARE of the slots, which keeps the rest free for the next
+interactive request.
+
+The class and author come from the context: API handlers run their work in
+traffic("interactive", created_by), batches and jobs tag each item with
+traffic("bulk", created_by), and anything untagged is bulk.
+"""
+import asyncio
+import collections
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+from config import settings
+
+# Model calls in flight at once in this process; 0 leaves concurrency unbounded.
+SCHEDULER_MAX_CONCURRENCY = settings.scheduler_max_concurrency
+# Fraction of those slots bulk calls may hold together.
+SCHEDULER_BULK_SHARE = settings.scheduler_bulk_share
+# Calls started per second in this process, handed out in priority order;
+# 0 disables it. QC_LLM_RATE_PER_SECOND still caps all processes together.
+SCHEDULER_RATE_PER_SECOND = settings.scheduler_rate_per_second
+SCHEDULER_RATE_BURST = settings.scheduler_rate_burst or max(1.0, SCHEDULER_RATE_PER_SECOND)
+
+# Most urgent first.
+PRIORITIES = ("interactive", "bulk")
+
+_traffic = contextvars.ContextVar("qc_llm_traffic", default=("bulk", ""))
+
+
+@contextmanager
+def traffic(priority: str, created_by: str = None):
+    """
+    Schedules the model calls made inside the block, including those of
+    tasks and threads it starts, as `priority` traffic of `created_by`.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    previous = _traffic.get()
+    _traffic.set((priority, created_by or ""))
+    try:
+        yield
+    finally:
+        # Not reset(): a streaming response's generator may be closed from another context.
+        _traffic.set(previous)
+
+
+def current_traffic() -> tuple:
+    return _traffic.get()
+
+
+def most_urgent(traffic_list: list) -> tuple:
+    return min(traffic_list, key=lambda item: PRIORITIES.index(item[0]))
+
+
+class _Waiter:
+    __slots__ = ("priority", "created_by", "queued_at", "notify", "granted")
+
+    def __init__(self, priority: str, created_by: str, notify):
+        self.priority = priority
+        self.created_by = created_by
+        self.queued_at = time.monotonic()
+        self.notify = notify
+        self.granted = False
+
+
+class Scheduler:
+    """
+    Priority queues of waiting calls, one deque per created_by inside each
+    class, served round-robin whenever a slot or rate token frees up. Usable
+    from both event loops and worker threads.
+    """
+
+    def __init__(self, max_concurrency: int, bulk_share: float, rate: float, burst: float):
+        self.max_concurrency = max_concurrency
+        self.bulk_limit = max(1, int(max_concurrency * bulk_share)) if max_concurrency else 0
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.running = dict.fromkeys(PRIORITIES, 0)
+        self.stats = {priority: {"calls": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for priority in PRIORITIES}
+        self._queues = {priority: collections.OrderedDict() for priority in PRIORITIES}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_concurrency or self.rate)
+
+    def queue_depth(self, priority: str) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    def _has_slot(self, priority: str) -> bool:
+        if not self.max_concurrency:
+            return True
+        if sum(self.running.values()) >= self.max_concurrency:
+            return False
+        return priority != "bulk" or self.running["bulk"] < self.bulk_limit
+
+    def _rate_wait(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def _dispatch(self):
+        # Called with the lock held.
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._has_slot(priority):
+                if self.rate:
+                    wait = self._rate_wait()
+                    if wait:
+                        self._wake_in(wait)
+                        return
+                    self.tokens -= 1
+                created_by, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(created_by)
+                else:
+                    del queue[created_by]
+                self._start(waiter)
+
+    def _start(self, waiter: _Waiter):
+        waited = time.monotonic() - waiter.queued_at
+        self.running[waiter.priority] += 1
+        waiter.granted = True
+        stats = self.stats[waiter.priority]
+        stats["calls"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        metrics.llm_queue_wait_seconds.observe(waited, priority=waiter.priority)
+        waiter.notify()
+
+    def _wake_in(self, seconds: float):
+        if self._timer is None:
+            self._timer = threading.Timer(seconds, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, notify) -> _Waiter:
+        priority, created_by = current_traffic()
+        waiter = _Waiter(priority, created_by, notify)
+        with self._lock:
+            self._queues[priority].setdefault(created_by, collections.deque()).append(waiter)
+            self._dispatch()
+        return waiter
+
+    def release(self, priority: str):
+        with self._lock:
+            self.running[priority] -= 1
+            self._dispatch()
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                self.running[waiter.priority] -= 1
+                self._dispatch()
+                return
+            queue = self._queues[waiter.priority]
+            waiters = queue.get(waiter.created_by)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del queue[waiter.created_by]
+
+    def acquire(self) -> str:
+        """
+        Blocks until the calling thread's call may start; returns its
+        priority, to pass to release().
+        """
+        event = threading.Event()
+        waiter = self._enqueue(event.set)
+        event.wait()
+        return waiter.priority
+
+    async def aacquire(self) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(notify)
+        if not waiter.granted:
+            try:
+                await future
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        return waiter.priority
+
+    @contextmanager
+    def slot(self):
+        if not self.enabled:
+            yield
+            return
+        priority = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    @asynccontextmanager
+    async def aslot(self):
+        if not self.enabled:
+            yield
+            return
+        priority = await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            classes = {
+                priority: {
+                    "queued": sum(len(waiters) for waiters in self._queues[priority].values()),
+                    "queued_authors": len(self._queues[priority]),
+                    "running": self.running[priority],
+                    "calls": self.stats[priority]["calls"],
+                    "mean_wait_seconds": round(self.stats[priority]["wait_seconds"] / self.stats[priority]["calls"], 4)
+                    if self.stats[priority]["calls"] else 0.0,
+                    "max_wait_seconds": round(self.stats[priority]["max_wait_seconds"], 4),
+                }
+                for priority in PRIORITIES
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "bulk_limit": self.bulk_limit,
+            "rate_per_second": self.rate,
+            "classes": classes,
+        }
+
+
+scheduler = Scheduler(SCHEDULER_MAX_CONCURRENCY, SCHEDULER_BULK_SHARE, SCHEDULER_RATE_PER_SECOND, SCHEDULER_RATE_BURST)
+metrics.Gauge("qc_llm_queue_depth", "Model calls waiting for a scheduler slot.", labelnames=("priority",),
+              read=lambda: {(priority,): scheduler.queue_depth(priority) for priority in PRIORITIES})
+metrics.Gauge("qc_llm_in_flight", "Model calls holding a scheduler slot.", labelnames=("priority",),
+              read=lambda: {(priority,): scheduler.running[priority] for priority in PRIORITIES})
@@ -0,0 +1,167 @@
+from typing import List, Optional, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+
+
+class CorrectnessFeedback(BaseModel):
+    is_correct: Optional[bool] = None
+    errors: Optional[List[str]] = None
+    explanation: Optional[str] = None
+
+class LanguageFeedback(BaseModel):
+    issues_found: Optional[bool] = None
+    feedback: Optional[List[str]] = None
+    explanation: Optional[str] = None
+
+class ImprovementFeedback(BaseModel):
+    improved_question: Optional[str] = None
+    justification: Optional[str] = None
+
+class MetadataFeedback(BaseModel):
+    topic: Optional[str] = None
+    subtopic: Optional[str] = None
+    blooms_level: Optional[str] = None
+    difficulty: Optional[str] = None
+
+class QuestionVersion(BaseModel):
+    question_id: str
+    version_number: int
+    timestamp: str
+    created_by: str
+    original_text: str
+    improved_text: str
+    correctness_feedback: Optional[CorrectnessFeedback] = None
+    language_feedback: Optional[LanguageFeedback] = None
+    improvement_feedback: Optional[ImprovementFeedback] = None
+    metadata: Optional[MetadataFeedback] = None
+    # The graph's route for AI versions: improve, clean or needs_human.
+    route: Optional[str] = None
+
+class ProcessQuestionResponse(BaseModel):
+    question_id: str
+    version_number: int
+    original_question: str
+    processed_question: str
+    route: Optional[str] = None
+    version_history: List[QuestionVersion]
+
+
+def question_version_from_row(row: dict) -> QuestionVersion:
+    """
+    Builds the API model for one stored version, as returned by
+    utils.get_question_versions() or utils.append_question_version().
+    """
+    correctness_feedback = None
+    if row.get("correctness_feedback_is_correct") is not None:
+        correctness_feedback = CorrectnessFeedback(
+            is_correct=row["correctness_feedback_is_correct"],
+            errors=row.get("correctness_feedback_errors"),
+            explanation=row.get("correctness_feedback_explanation")
+        )
+
+    language_feedback = None
+    if row.get("language_feedback_issues_found") is not None:
+        language_feedback = LanguageFeedback(
+            issues_found=row["language_feedback_issues_found"],
+            feedback=row.get("language_feedback_feedback"),
+            explanation=row.get("language_feedback_explanation")
+        )
+
+    improvement_feedback = None
+    if row.get("improvement_justification") is not None:
+        improvement_feedback = ImprovementFeedback(
+            improved_question=row.get("improved_text"),
+            justification=row["improvement_justification"]
+        )
+
+    metadata = None
+    if row.get("metadata_topic") is not None:
+        metadata = MetadataFeedback(
+            topic=row["metadata_topic"],
+            subtopic=row.get("metadata_subtopic"),
+            blooms_level=row.get("metadata_blooms_level"),
+            difficulty=row.get("metadata_difficulty")
+        )
+
+    return QuestionVersion(
+        question_id=row["question_id"],
+        version_number=row["version_number"],
+        timestamp=row["timestamp"],
+        created_by=row["created_by"],
+        original_text=row["original_text"],
+        improved_text=row["improved_text"],
+        correctness_feedback=correctness_feedback,
+        language_feedback=language_feedback,
+        improvement_feedback=improvement_feedback,
+        metadata=metadata,
+        route=row.get("route")
+    )
+
+
+def question_versions_from_rows(rows: list) -> List[QuestionVersion]:
+    return [question_version_from_row(row) for row in rows]
+
+
+# The feedback model each agent's reply must match.
+AGENT_OUTPUT_MODELS = {
+    "correctness": CorrectnessFeedback,
+    "language": LanguageFeedback,
+    "improvement": ImprovementFeedback,
+    "metadata": MetadataFeedback,
+}
+
+
+def validate_agent_output(agent_name: str, value) -> dict:
+    """
+    Checks a parsed LLM reply against the agent's feedback model: every field
+    present and of the right type. Returns the reply with field values
+    coerced (e.g. "true" -> True), keeping any extra keys. Raises ValueError.
+    """
+    model = AGENT_OUTPUT_MODELS[agent_name]
+    if not isinstance(value, dict):
+        raise ValueError(f"Expected a JSON object, got {type(value).__name__}")
+    missing = [field for field in model.model_fields if value.get(field) is None]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    try:
+        validated = model.model_validate(value)
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+        raise ValueError(f"Invalid fields: {problems}")
+    return {**value, **validated.model_dump()}
+
+
+def agent_output_conflict(agent_name: str, value: dict):
+    """
+    Why a validated reply contradicts itself, e.g. a question marked correct
+    with errors listed, or None. The model cascade escalates such replies.
+    """
+    if agent_name == "correctness":
+        if value["is_correct"] == bool(value["errors"]):
+            return "is_correct disagrees with the errors listed"
+        if value["is_correct"] and value.get("needs_human_review"):
+            return "a correct question is marked for human review"
+    elif agent_name == "language":
+        if value["issues_found"] != bool(value["feedback"]):
+            return "issues_found disagrees with the feedback listed"
+    elif agent_name == "improvement":
+        if not value["improved_question"].strip():
+            return "the improved question is empty"
+    elif agent_name == "metadata":
+        blank = [field for field in AGENT_OUTPUT_MODELS[agent_name].model_fields if not value[field].strip()]
+        if blank:
+            return f"blank {', '.join(blank)}"
+    return None
+
+
+def describe_agent_output(agent_name: str) -> str:
+    """
+    The agent's reply fields as prompt text, e.g. '"is_correct" (boolean), ...'.
+    """
+    kinds = {bool: "boolean", str: "string"}
+    parts = []
+    for field, info in AGENT_OUTPUT_MODELS[agent_name].model_fields.items():
+        inner = next(arg for arg in get_args(info.annotation) if arg is not type(None))
+        kind = "list of strings" if get_origin(inner) is list else kinds[inner]
+        parts.append(f'"{field}" ({kind})')
+    return ", ".join(parts)
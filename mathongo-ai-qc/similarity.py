@@ -0,0 +1,93 @@
+"""
+MinHash signatures and LSH band keys for near-duplicate question detection.
+
+Text is normalized (NFKC, case-folded) and split into math-aware tokens:
+numbers, words and single symbols, so "2x + 3 = 7" and "2x+3=7" match while
+"x + 4" and "x + 3" stay different. Overlapping 3-token shingles are hashed
+once each into SIGNATURE_SIZE bins (one-permutation MinHash, with empty bins
+filled from their neighbours), which costs one hash per shingle instead of
+one per shingle and permutation.
+
+Signatures are split into LSH_BANDS bands; two texts whose signatures agree
+on every value of any band share a bucket. utils.py stores the buckets in an
+indexed table, so finding candidates is a few index lookups regardless of
+how many questions are stored. Candidates are then scored by the exact
+Jaccard similarity of their shingles, which is cheap for question-sized text
+and steadier than the signature's estimate.
+"""
+import hashlib
+import re
+import struct
+import unicodedata
+
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16
+BAND_ROWS = SIGNATURE_SIZE // LSH_BANDS
+SHINGLE_TOKENS = 3
+
+_TOKEN = re.compile(r"\d+(?:\.\d+)?|[^\W\d_]+|[^\w\s]")
+_VALUE_BITS = 58
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_BAND_FORMAT = f"<{BAND_ROWS}Q"
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def shingles(text: str) -> set:
+    tokens = tokenize(text)
+    if len(tokens) <= SHINGLE_TOKENS:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_TOKENS]) for i in range(len(tokens) - SHINGLE_TOKENS + 1)}
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def signature(text: str):
+    """
+    The MinHash signature of `text` as a tuple of SIGNATURE_SIZE ints, or
+    None if the text has no tokens.
+    """
+    values = [None] * SIGNATURE_SIZE
+    for shingle in shingles(text):
+        h = _hash64(shingle.encode("utf-8"))
+        index = h % SIGNATURE_SIZE
+        value = (h >> 6) & _VALUE_MASK
+        if values[index] is None or value < values[index]:
+            values[index] = value
+    filled = {index for index, value in enumerate(values) if value is not None}
+    if not filled:
+        return None
+    # Densify: an empty bin borrows the next filled bin's value, offset by
+    # the distance so borrowed values only match bins that borrowed alike.
+    for index in range(SIGNATURE_SIZE):
+        if index not in filled:
+            distance = 1
+            while (index + distance) % SIGNATURE_SIZE not in filled:
+                distance += 1
+            values[index] = values[(index + distance) % SIGNATURE_SIZE] + (distance << _VALUE_BITS)
+    return tuple(values)
+
+
+def band_keys(sig: tuple) -> list:
+    """
+    One signed 64-bit bucket key per band, as (band, key) pairs.
+    """
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = struct.pack(_BAND_FORMAT, *sig[band * BAND_ROWS:(band + 1) * BAND_ROWS])
+        keys.append((band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)))
+    return keys
+
+
+def jaccard(a: str, b: str) -> float:
+    """
+    Jaccard similarity of the two texts' shingle sets.
+    """
+    a, b = shingles(a), shingles(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,29 @@
+"""
+Runs every test against the mock model backend and a scratch version store.
+Settings are read once at import, so the environment is set before any
+service module is imported. Run from the mathongo-ai-qc directory:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+os.environ.update({
+    "QC_LLM_BACKEND": "mock",
+    "QC_CACHE_ENABLED": "false",
+    "QC_JOB_WORKERS": "0",
+    "QC_WARMUP": "false",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "DB_FILE", str(tmp_path / "question_versions.db"))
+    monkeypatch.setattr(utils, "CSV_FILE", str(tmp_path / "question_versions.csv"))
+    utils.initialize_storage()
+    return tmp_path
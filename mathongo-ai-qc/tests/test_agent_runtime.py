@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import agent_runtime
+import langgraph_flow
+import llm_backends
+from agent_runtime import AGENT_CLIENTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_agents_reads_no_prompts():
+    script = (
+        "import agent_runtime, agents.correctness_agent, agents.metadata_agent\n"
+        "assert not agent_runtime._prompts\n"
+        "print(agent_runtime.get_prompt('metadata_prompt').name)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=os.environ.copy(),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert lines[0].startswith("Loaded ") and lines[1] == "metadata_prompt"
+
+
+def test_get_prompt_loads_the_templates_on_first_use(monkeypatch):
+    monkeypatch.setattr(agent_runtime, "_prompts", {})
+    assert agent_runtime.get_prompt("metadata_prompt").sha256
+
+
+def test_batch_leaves_out_a_question_over_the_prompt_budget(monkeypatch):
+    monkeypatch.setattr(agent_runtime, "AGENT_CLIENTS", {})
+    template = agent_runtime.get_prompt("metadata_prompt")
+    short, long = "What is 2 + 2?", "Simplify " + "x + " * 2000 + "x."
+    budget = template.system_tokens + agent_runtime.estimate_tokens(template.render(question_text=short)) + 100
+    client = agent_runtime.AgentClient("metadata", "metadata_prompt", 0.2, batch_size=2, max_prompt_tokens=budget)
+
+    async def scenario():
+        batched = await client._agenerate_batch([short, long])
+        batcher = client._get_batcher()
+        queued = await asyncio.gather(batcher.submit(short), batcher.submit(long), return_exceptions=True)
+        return batched, queued
+
+    (short_result, long_result), queued = asyncio.run(scenario())
+    assert short_result["topic"] and long_result is None
+    assert client.stats["batched_questions"] == 2
+    assert queued[0]["topic"]
+    assert isinstance(queued[1], agent_runtime.TokenBudgetExceeded)
+
+
+CHEAP, STRONG = "cheap-model", "strong-model"
+QUESTION = "Which of these is a prime number? (A) 4 (B) 6 (C) 7 (D) 9"
+
+
+@pytest.fixture
+def cascade(tmp_path, monkeypatch):
+    """
+    Correctness and language clients whose cheap model says the question
+    needs a human while finding no language issue, a disagreement the strong
+    model resolves, with a function that changes one agent@model reply.
+    """
+    replies = {
+        f"correctness@{CHEAP}": {"is_correct": False, "errors": ["Fragment: no question asked."], "explanation": "Unclear.",
+                                 "needs_human_review": True, "confidence": 0.9},
+        f"correctness@{STRONG}": {"is_correct": True, "errors": [], "explanation": "Sound.", "needs_human_review": False},
+        f"language@{CHEAP}": {"issues_found": False, "feedback": [], "explanation": "Fine.", "confidence": 0.9},
+        f"language@{STRONG}": {"issues_found": True, "feedback": ["Clarity: say which option."], "explanation": "Vague."},
+    }
+    path = tmp_path / "replies.json"
+    monkeypatch.setattr(llm_backends, "MOCK_RESPONSES_FILE", str(path))
+    saved = dict(AGENT_CLIENTS)
+    clients = {
+        stage: agent_runtime.AgentClient(stage, f"{stage}_prompt", 0.2, model_name=STRONG, batch_size=1, cascade_model_name=CHEAP)
+        for stage in ("correctness", "language")
+    }
+
+    def reply(key: str, value):
+        replies[key] = value
+        path.write_text(json.dumps(replies), encoding="utf-8")
+        for client in clients.values():
+            client.model = None
+
+    path.write_text(json.dumps(replies), encoding="utf-8")
+    yield clients, reply
+    AGENT_CLIENTS.clear()
+    AGENT_CLIENTS.update(saved)
+
+
+def test_cascade_keeps_a_confident_answer_and_escalates_the_rest(cascade):
+    clients, reply = cascade
+    client = clients["correctness"]
+    kept = client.run(QUESTION)
+    assert kept["answered_by"] == CHEAP and kept["needs_human_review"] and "confidence" not in kept
+    assert client.model.calls == 0
+
+    reply(f"correctness@{CHEAP}", {"is_correct": True, "errors": [], "explanation": "Sound.", "needs_human_review": False,
+                                   "confidence": 0.2})
+    assert client.run(QUESTION)["answered_by"] == STRONG
+    reply(f"correctness@{CHEAP}", '{"is_correct": true, "errors": [')
+    assert asyncio.run(client.arun(QUESTION))["answered_by"] == STRONG
+    reply(f"correctness@{CHEAP}", {"is_correct": True, "errors": ["Ambiguity: two answers."], "explanation": "Mixed.",
+                                   "needs_human_review": False, "confidence": 0.9})
+    assert client.run(QUESTION)["answered_by"] == STRONG
+
+    usage = client.cascade_usage()
+    assert (usage["answers"], usage["kept"]) == (4, 1)
+    assert usage["escalated"] == {"inconsistent": 1, "invalid": 1, "low_confidence": 1}
+    assert client.model.calls == 1
+
+
+def test_escalate_only_reanswers_cascade_answers(cascade):
+    client = cascade[0]["correctness"]
+    cheap = client.run(QUESTION)
+    assert client.escalate(QUESTION, {**cheap, "answered_by": STRONG})["answered_by"] == STRONG
+    assert client.model.calls == 0
+    assert client.cascade_usage()["escalated"] == {}
+
+    strong = client.escalate(QUESTION, cheap)
+    assert strong["answered_by"] == STRONG and strong["is_correct"]
+    assert asyncio.run(client.aescalate(QUESTION, cheap))["answered_by"] == STRONG
+    assert asyncio.run(client.aescalate(QUESTION, strong)) is strong
+    assert client.model.calls == 2
+    assert client.cascade_usage()["escalated"] == {"disagreement": 2}
+
+
+def routed_state(clients: dict) -> dict:
+    return {
+        "question_text": QUESTION,
+        "correctness_feedback": clients["correctness"].run(QUESTION),
+        "language_feedback": clients["language"].run(QUESTION),
+        "errors": [],
+    }
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_routed_stage_escalates_disagreeing_checks(cascade, run_async):
+    clients = cascade[0]
+    improved = {"improvement_feedback": {"improved_question": "Improved", "justification": "Named the options."}}
+
+    async def improve_async(state):
+        return improved
+
+    node = langgraph_flow.routed_stage(improve_async if run_async else lambda state: improved)
+    state = routed_state(clients)
+    assert langgraph_flow.checks_disagree(state)
+    update = asyncio.run(node(state)) if run_async else node(state)
+
+    assert update["route"] == "improve"
+    assert update["improvement_feedback"] == improved["improvement_feedback"]
+    assert update["correctness_feedback"]["answered_by"] == STRONG
+    assert update["language_feedback"]["answered_by"] == STRONG
+    for client in clients.values():
+        assert client.model.calls == 1
+        assert client.cascade_usage()["escalated"] == {"disagreement": 1}
+        assert client.cascade_usage()["kept"] == 0
+
+
+def test_routed_stage_keeps_agreeing_cascade_answers(cascade):
+    clients, reply = cascade
+    reply(f"language@{CHEAP}", {"issues_found": True, "feedback": ["Clarity: say which option."], "explanation": "Vague.",
+                                "confidence": 0.9})
+    state = routed_state(clients)
+    update = langgraph_flow.routed_stage(lambda state: {})(state)
+
+    assert update["route"] == "needs_human"
+    assert "correctness_feedback" not in update and "language_feedback" not in update
+    for client in clients.values():
+        assert client.model.calls == 0
+        assert client.cascade_usage()["escalated"] == {}
@@ -0,0 +1,34 @@
+import asyncio
+
+import batch_processor
+import similarity
+from agent_runtime import AGENT_CLIENTS
+
+QUESTION = "A train travels 120 km in 2 hours at a constant speed. What is its speed in km per hour?"
+CHANGED_NUMBER = "A train travels 180 km in 2 hours at a constant speed. What is its speed in km per hour?"
+
+
+def process(text: str) -> dict:
+    return asyncio.run(batch_processor.process_batch([{"question_text": text, "created_by": "teacher"}]))[0]
+
+
+def test_near_identical_question_keeps_its_own_verdict_and_text(store, monkeypatch):
+    threshold = similarity.jaccard(QUESTION, CHANGED_NUMBER) - 0.01
+    monkeypatch.setattr(batch_processor, "SIMILAR_REUSE_THRESHOLD", threshold)
+    source = process(QUESTION)
+
+    processed_text, final_state = asyncio.run(batch_processor.run_question(CHANGED_NUMBER))
+    assert final_state["reused_from"] == source["question_id"]
+    assert sorted(final_state["reused_stages"]) == ["language", "metadata"]
+    assert processed_text != source["processed_question"]
+    assert final_state["stage_fingerprints"]["language"] == AGENT_CLIENTS["language"].fingerprint(CHANGED_NUMBER)
+    assert final_state["stage_fingerprints"]["metadata"] == AGENT_CLIENTS["metadata"].fingerprint(processed_text)
+
+
+def test_exact_duplicate_reuses_every_stage(store, monkeypatch):
+    monkeypatch.setattr(batch_processor, "SIMILAR_REUSE_THRESHOLD", 0.9)
+    source = process(QUESTION)
+
+    processed_text, final_state = asyncio.run(batch_processor.run_question("  " + QUESTION.replace(" ", "  ")))
+    assert sorted(final_state["reused_stages"]) == ["correctness", "improvement", "language", "metadata"]
+    assert processed_text == source["processed_question"]
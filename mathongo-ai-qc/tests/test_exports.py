@@ -0,0 +1,148 @@
+import asyncio
+import gzip
+import os
+
+import httpx
+import pytest
+
+import exports
+import main
+import utils
+
+
+@pytest.fixture
+def history(store, monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_CACHE_DIR", str(store / "exports"))
+    for n in range(3):
+        utils.append_question_version(question_id=f"q-{n}", original_text=f"What is {n} + {n}?", created_by="teacher")
+    return store
+
+
+def get(path: str, **headers) -> httpx.Response:
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers={"Accept-Encoding": "identity", **headers})
+    return asyncio.run(request())
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-0", 10, (0, 0)),
+    ("bytes=0-9", 10, (0, 9)),
+    ("bytes=3-", 10, (3, 9)),
+    ("bytes=9-", 10, (9, 9)),
+    ("bytes=5-100", 10, (5, 9)),
+    ("bytes=-1", 10, (9, 9)),
+    ("bytes=-4", 10, (6, 9)),
+    ("bytes=-100", 10, (0, 9)),
+    (" bytes=2-4 ", 10, (2, 4)),
+])
+def test_parse_range(header, size, expected):
+    assert exports.parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=10-", 10),
+    ("bytes=10-20", 10),
+    ("bytes=5-4", 10),
+    ("bytes=-0", 10),
+    ("bytes=-5", 0),
+    ("bytes=0-0", 0),
+])
+def test_unsatisfiable_range(header, size):
+    assert exports.parse_range(header, size) is None
+
+
+@pytest.mark.parametrize("header", [None, "", "bytes=-", "bytes=0-1,4-5", "bytes=a-b", "items=0-5", "bytes=1"])
+def test_only_single_byte_ranges_are_honoured(header):
+    assert not exports.single_range(header)
+
+
+def test_etag_matches_any_encoding_of_the_export():
+    etag = exports.export_etag("csv", (3, 7))
+    assert etag == '"csv-3-7"'
+    assert exports.etag_matches('"csv-3-7"', etag)
+    assert exports.etag_matches('W/"csv-3-7-gzip"', etag)
+    assert exports.etag_matches('"jsonl-3-7", "csv-3-7"', etag)
+    assert exports.etag_matches("*", etag)
+    assert not exports.etag_matches('"csv-3-6"', etag)
+    assert not exports.etag_matches(None, etag)
+
+
+def test_accepts_gzip():
+    assert exports.accepts_gzip("gzip, deflate")
+    assert exports.accepts_gzip("br;q=1.0, GZIP;q=0.5")
+    assert not exports.accepts_gzip("gzip;q=0")
+    assert not exports.accepts_gzip("deflate")
+    assert not exports.accepts_gzip(None)
+
+
+def test_gzip_chunks_round_trip():
+    chunks = ["question_id,text\n", "", "q-1,What is 1 + 1?\n" * 1000]
+    assert gzip.decompress(b"".join(exports.gzip_chunks(chunks))).decode("utf-8") == "".join(chunks)
+
+
+def test_export_etag_and_not_modified(history):
+    full = get("/export?format=jsonl")
+    assert full.status_code == 200
+    assert full.text.count("\n") == 3
+    assert get("/export?format=jsonl", **{"If-None-Match": full.headers["etag"]}).status_code == 304
+
+    utils.append_question_version(question_id="q-new", original_text="What is 9 + 9?", created_by="teacher")
+    changed = get("/export?format=jsonl", **{"If-None-Match": full.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != full.headers["etag"]
+
+
+def test_gzip_export_has_its_own_etag(history):
+    plain = get("/export")
+    compressed = get("/export", **{"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == plain.content
+    assert compressed.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+
+
+def test_range_requests(history):
+    full = get("/export").content
+    size = len(full)
+
+    head = get("/export", Range="bytes=0-9")
+    assert head.status_code == 206
+    assert head.content == full[:10]
+    assert head.headers["content-range"] == f"bytes 0-9/{size}"
+
+    tail = get("/export", Range="bytes=-5")
+    assert (tail.status_code, tail.content) == (206, full[-5:])
+    assert tail.headers["content-range"] == f"bytes {size - 5}-{size - 1}/{size}"
+
+    rest = get("/export", Range=f"bytes={size - 1}-")
+    assert rest.content == full[-1:]
+
+    unsatisfiable = get("/export", Range=f"bytes={size}-")
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{size}"
+
+    several = get("/export", Range="bytes=0-1,4-5")
+    assert (several.status_code, several.content) == (200, full)
+
+    stale = get("/export", Range="bytes=0-9", **{"If-Range": '"csv-0-0"'})
+    assert (stale.status_code, stale.content) == (200, full)
+
+
+def test_snapshot_is_written_once_per_etag(history, monkeypatch):
+    writes = []
+    media_type, generate = exports.EXPORT_FORMATS["csv"]
+
+    def counting_generate(last_rowid):
+        writes.append(last_rowid)
+        return generate(last_rowid)
+
+    monkeypatch.setitem(exports.EXPORT_FORMATS, "csv", (media_type, counting_generate))
+    first = exports.snapshot_path("csv", utils.export_snapshot())
+    assert exports.snapshot_path("csv", utils.export_snapshot()) == first
+    assert len(writes) == 1
+
+    utils.append_question_version(question_id="q-new", original_text="What is 9 + 9?", created_by="teacher")
+    second = exports.snapshot_path("csv", utils.export_snapshot())
+    assert second != first and len(writes) == 2
+    assert not os.path.exists(first)
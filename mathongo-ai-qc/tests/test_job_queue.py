@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import job_queue
+import utils
+
+
+@pytest.fixture
+def jobs(store, monkeypatch):
+    job_queue.initialize_job_tables()
+    # Long enough that a test only passes if workers are woken, not polled.
+    monkeypatch.setattr(job_queue, "JOB_POLL_SECONDS", 30)
+    return store
+
+
+async def wait_for_job(job_id: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = await asyncio.to_thread(job_queue.get_job, job_id, True)
+        if job["status"] == "completed":
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not complete: {job}")
+
+
+def run_with_workers(scenario, count: int = 1):
+    async def main():
+        stop, tasks = job_queue.start_workers(count)
+        try:
+            return await scenario()
+        finally:
+            await job_queue.stop_workers(stop, tasks)
+    return asyncio.run(main())
+
+
+def test_job_submitted_from_a_thread_wakes_idle_workers(jobs):
+    submitted = {}
+
+    def submit():
+        submitted["at"] = time.time()
+        submitted["job"] = job_queue.submit_job([{"question_text": "What is 2 + 2?", "created_by": "teacher"}])
+
+    async def scenario():
+        await asyncio.sleep(0.1)  # The worker is now waiting for work.
+        threading.Thread(target=submit).start()
+        # One long sleep: nothing else wakes the event loop before it ends.
+        await asyncio.sleep(1)
+        return await wait_for_job(submitted["job"]["job_id"], timeout=5)
+
+    job = run_with_workers(scenario)
+    assert job["counts"]["done"] == 1
+    claimed_at = utils.get_connection().execute("SELECT claimed_at FROM job_items").fetchone()[0]
+    assert claimed_at - submitted["at"] < 0.5
+
+
+def test_storage_error_on_completion_requeues_the_item_and_keeps_the_worker(jobs, monkeypatch):
+    complete_item = job_queue.complete_item
+    calls = []
+
+    def flaky_complete(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return complete_item(*args)
+
+    monkeypatch.setattr(job_queue, "complete_item", flaky_complete)
+
+    async def scenario():
+        job = await asyncio.to_thread(job_queue.submit_job, [{"question_text": "What is 3 + 3?", "created_by": "teacher"}])
+        return await wait_for_job(job["job_id"])
+
+    job = run_with_workers(scenario)
+    item = job["items"][0]
+    assert (item["status"], item["attempts"]) == ("done", 2)
+    assert len(utils.get_question_versions(item["question_id"])) == 2
+
+
+def test_expired_lease_is_requeued_while_workers_run(jobs, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.2)
+    monkeypatch.setattr(job_queue, "JOB_REQUEUE_INTERVAL_SECONDS", 0.1)
+    job = job_queue.submit_job([{"question_text": "What is 4 + 4?", "created_by": "teacher"}])
+    # Claimed by a worker on another host that went away.
+    assert job_queue.claim_item("other-host:1234:0") is not None
+
+    async def scenario():
+        return await wait_for_job(job["job_id"])
+
+    item = run_with_workers(scenario)["items"][0]
+    assert (item["status"], item["attempts"]) == ("done", 2)
+
+
+def test_completion_after_a_requeue_stores_nothing(jobs):
+    job = job_queue.submit_job([{"question_text": "What is 5 + 5?", "created_by": "teacher"}])
+    item = job_queue.claim_item("host:1:0")
+    utils.get_connection().execute("UPDATE job_items SET status = 'pending', claimed_by = NULL")
+    utils.get_connection().commit()
+    final_state = {"question_text": "What is 5 + 5?"}
+    assert job_queue.complete_item(item, "q-lost", "What is 5 + 5?", final_state) is False
+    assert utils.get_question_versions("q-lost") == []
+    assert job_queue.get_job(job["job_id"])["counts"]["pending"] == 1
+
+
+def test_job_submitted_during_an_empty_claim_is_not_missed(jobs, monkeypatch):
+    claim_item = job_queue.claim_item
+    submitted = []
+
+    def claim_while_a_job_arrives(worker_id):
+        item = claim_item(worker_id)
+        if item is None and not submitted:
+            # Lands after the claim found nothing, before the worker waits.
+            submitted.append(job_queue.submit_job([{"question_text": "What is 5 + 5?", "created_by": "teacher"}]))
+        return item
+
+    monkeypatch.setattr(job_queue, "claim_item", claim_while_a_job_arrives)
+
+    async def scenario():
+        await asyncio.sleep(0.2)
+        return await wait_for_job(submitted[0]["job_id"], timeout=5)
+
+    assert run_with_workers(scenario)["counts"]["done"] == 1
+
+
+def test_item_outliving_its_lease_is_not_requeued_under_a_live_worker(jobs, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(job_queue, "JOB_REQUEUE_INTERVAL_SECONDS", 0.05)
+    run_question = job_queue.run_question
+    runs = []
+
+    async def slow_run_question(question_text):
+        runs.append(question_text)
+        await asyncio.sleep(1)  # Several leases long.
+        return await run_question(question_text)
+
+    monkeypatch.setattr(job_queue, "run_question", slow_run_question)
+
+    async def scenario():
+        job = await asyncio.to_thread(job_queue.submit_job, [{"question_text": "What is 6 + 6?", "created_by": "teacher"}])
+        return await wait_for_job(job["job_id"])
+
+    job = run_with_workers(scenario, count=2)
+    assert len(runs) == 1
+    assert (job["items"][0]["status"], job["items"][0]["attempts"]) == ("done", 1)
@@ -0,0 +1,63 @@
+import asyncio
+
+import langgraph_flow
+from agent_runtime import AGENT_CLIENTS
+
+QUESTION = "What is the boiling point of water at sea level in degrees Celsius?"
+
+
+def stored_stage(stage: str, output: dict, text: str = QUESTION) -> dict:
+    return {"output": output, "fingerprint": AGENT_CLIENTS[stage].fingerprint(text)}
+
+
+def run(previous_stages: dict, only_stages: list = None) -> dict:
+    state = langgraph_flow.initial_question_state(QUESTION, previous_stages, only_stages)
+    return asyncio.run(langgraph_flow.build_workflow(langgraph_flow.PARALLEL_STAGE_DEPENDENCIES, routing=True).ainvoke(state))
+
+
+def test_reprocessed_question_that_now_passes_its_checks_goes_back_to_clean():
+    previous_stages = {
+        "correctness": stored_stage("correctness", {"is_correct": True, "errors": [], "explanation": "Sound."}),
+        "language": stored_stage("language", {"issues_found": False, "feedback": [], "explanation": "Clear."}),
+        "improvement": stored_stage("improvement", {"improved_question": "An older rewrite.", "justification": "Was unclear."}),
+    }
+    final_state = run(previous_stages)
+    assert final_state["route"] == "clean"
+    assert final_state["question_text"] == QUESTION
+    assert "improvement" not in final_state["reused_stages"]
+
+
+def test_reprocess_of_improvement_takes_the_improvement_path():
+    previous_stages = {
+        "correctness": stored_stage("correctness", {"is_correct": True, "errors": [], "explanation": "Sound."}),
+        "language": stored_stage("language", {"issues_found": False, "feedback": [], "explanation": "Clear."}),
+    }
+    final_state = run(previous_stages, only_stages=["improvement"])
+    assert final_state["route"] == "improve"
+    assert final_state["question_text"].startswith("Improved question")
+
+
+def test_sync_and_async_nodes_build_the_same_update():
+    def rewrite(question_text):
+        return {"improved_question": "Rewritten.", "justification": "Clearer."}
+
+    async def arewrite(question_text):
+        return rewrite(question_text)
+
+    def fail(question_text):
+        raise RuntimeError("upstream down")
+
+    async def afail(question_text):
+        fail(question_text)
+
+    state = langgraph_flow.initial_question_state(QUESTION)
+    node, anode = langgraph_flow.stage_nodes("improvement", rewrite, arewrite)
+    update = node(state)
+    assert update == asyncio.run(anode(state))
+    assert update["question_text"] == "Rewritten."
+
+    node, anode = langgraph_flow.stage_nodes("improvement", fail, afail)
+    update = node(state)
+    assert update == asyncio.run(anode(state))
+    assert update["errors"] == ["Error calling improvement_agent: upstream down"]
+    assert update["improvement_feedback"]["improved_question"] == QUESTION
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+import httpx
+
+import batch_processor
+import main
+from agent_runtime import AGENT_CLIENTS
+
+
+def sse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_reuses_a_near_identical_question(store, monkeypatch):
+    monkeypatch.setattr(batch_processor, "SIMILAR_REUSE_THRESHOLD", 0.9)
+    question = {"question_text": "What is the derivative of x^2 with respect to x?", "created_by": "teacher"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = (await client.post("/process_question/", json=question)).json()
+            requests = sum(client.stats["llm_requests"] for client in AGENT_CLIENTS.values())
+            response = await client.post("/process_question/stream", json=question)
+            return first, requests, response.text
+
+    first, requests_before, body = asyncio.run(scenario())
+    events = sse_events(body)
+    names = [name for name, _ in events]
+    assert names[:2] == ["accepted", "reused"] and names[-1] == "complete"
+    assert events[1][1] == {"source_question_id": first["question_id"]}
+    assert sum(client.stats["llm_requests"] for client in AGENT_CLIENTS.values()) == requests_before
+    assert events[-1][1]["processed_question"] == first["processed_question"]
+    assert sorted(events[-1][1]["reused_stages"]) == ["correctness", "improvement", "language", "metadata"]
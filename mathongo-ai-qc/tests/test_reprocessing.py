@@ -0,0 +1,70 @@
+import asyncio
+
+import reprocessing
+import utils
+
+
+def store_versions(*versions):
+    with utils.write_transaction() as conn:
+        return utils.insert_versions(conn, list(versions))
+
+
+def ai_version(question_id: str, original_text: str, **fields) -> dict:
+    return {
+        "question_id": question_id,
+        "original_text": original_text,
+        "created_by": "AI",
+        "correctness_feedback": {"is_correct": True, "errors": [], "explanation": "Checked."},
+        "language_feedback": {"issues_found": False, "feedback": [], "explanation": "Checked."},
+        "metadata_feedback": {"topic": "Old", "subtopic": "Old", "blooms_level": "Apply", "difficulty": "Easy"},
+        **fields,
+    }
+
+
+def ai_version_numbers(question_id: str) -> list:
+    return [version["version_number"] for version in utils.get_question_versions(question_id) if version["created_by"] == "AI"]
+
+
+def test_stale_stage_leaves_needs_human_questions_alone(store):
+    text = "Which of the following"
+    store_versions(
+        {"question_id": "q-human", "original_text": text, "created_by": "teacher"},
+        ai_version("q-human", text, route="needs_human",
+                   improvement_feedback={"improved_question": text, "justification": "Needs human review: a fragment."},
+                   metadata_feedback={}),
+    )
+    for _ in range(3):
+        page = asyncio.run(reprocessing.reprocess_stale_stage("metadata"))
+        assert page["processed"] == 0 and page["results"] == []
+    assert ai_version_numbers("q-human") == [2]
+
+
+def test_stale_stage_reports_a_stage_the_route_never_reached_as_skipped(store, monkeypatch):
+    text = "Which of the following"
+    stored = store_versions(ai_version("q-human", text, route="needs_human", metadata_feedback={}))
+    stale = [{**stored[0], "stage_fingerprints": {}}]
+
+    async def list_stale(stage, prompt_sha256, model, limit=100, cursor=None):
+        return stale, None
+
+    monkeypatch.setattr(utils, "list_stale_stage_versions_async", list_stale)
+    page = asyncio.run(reprocessing.reprocess_stale_stage("metadata"))
+    assert (page["processed"], page["skipped"]) == (0, 1)
+    assert page["results"][0]["status"] == "skipped"
+    assert ai_version_numbers("q-human") == [1]
+
+
+def test_metadata_rerun_keeps_a_rewrite_stored_without_fingerprints(store):
+    # As migrated from question_versions.csv: no route, no stage fingerprints.
+    original = "What is the capital of france?"
+    improved = "What is the capital of France?"
+    store_versions(
+        {"question_id": "q-legacy", "original_text": original, "created_by": "teacher"},
+        ai_version("q-legacy", original, improved_text=improved,
+                   improvement_feedback={"improved_question": improved, "justification": "Capitalised France."}),
+    )
+    result = asyncio.run(reprocessing.reprocess_question("q-legacy", only_stages=["metadata"]))
+    assert result["created"] and result["recomputed_stages"] == ["metadata"]
+    assert result["version"]["improved_text"] == improved
+    assert result["version"]["route"] == "improve"
+    assert result["version"]["metadata_topic"] != "Old"
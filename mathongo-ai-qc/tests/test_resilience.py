@@ -0,0 +1,50 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+import resilience
+import scheduling
+import utils
+
+
+def test_rate_limiter_does_not_wait_for_the_version_store_lock(store):
+    bucket = resilience.SharedTokenBucket("gemini", 10, 2)
+    writer = sqlite3.connect(utils.DB_FILE)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        waits = []
+        reserving = threading.Thread(target=lambda: waits.extend(bucket.reserve() for _ in range(3)))
+        reserving.start()
+        reserving.join(timeout=5)
+        assert not reserving.is_alive()
+    finally:
+        writer.rollback()
+        writer.close()
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02)
+    tables = {row[0] for row in utils.get_connection().execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "llm_rate_limit" not in tables
+
+
+def test_rate_limit_wait_does_not_hold_a_scheduler_slot(store, monkeypatch):
+    monkeypatch.setattr(scheduling, "scheduler", scheduling.Scheduler(1, 1.0, 0, 1))
+    bucket = resilience.SharedTokenBucket("gemini", 2, 1)
+    bucket.reserve()  # The next call waits about half a second for its token.
+    monkeypatch.setattr(resilience, "rate_limiter", bucket)
+
+    async def call():
+        return "ok"
+
+    async def scenario():
+        with scheduling.traffic("bulk", "importer"):
+            waiting = asyncio.create_task(resilience.acall_with_retries("metadata", call))
+        await asyncio.sleep(0.2)
+        running = dict(scheduling.scheduler.running)
+        return running, await waiting
+
+    running, result = asyncio.run(scenario())
+    assert running == {"interactive": 0, "bulk": 0}
+    assert result == "ok"
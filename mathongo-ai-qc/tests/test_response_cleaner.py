@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from benchmarks.parser_corpus import SHAPES, load_feedback
+from response_cleaner import parse_json_response
+
+CORPUS = load_feedback(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "question_versions.csv"))
+
+EXPECTED_METHODS = {
+    "bare": "direct",
+    "fenced": "fenced",
+    "prose": "embedded",
+    "trailing_commas": "repaired",
+    "raw_newlines": "direct",
+    "truncated": "repaired",
+}
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_parser_corpus(shape):
+    render, complete = SHAPES[shape]
+    assert CORPUS
+    for agent, feedback in CORPUS:
+        value, method = parse_json_response(render(feedback))
+        assert method == EXPECTED_METHODS[shape], (agent, feedback)
+        if complete:
+            assert value == feedback
+        else:
+            # A truncated reply keeps the fields that arrived, never invents any.
+            assert value and set(value) <= set(feedback)
+
+
+def test_reply_without_json_is_an_error():
+    with pytest.raises(ValueError):
+        parse_json_response("I cannot evaluate this question.")
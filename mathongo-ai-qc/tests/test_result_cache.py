@@ -0,0 +1,47 @@
+import asyncio
+import threading
+import time
+
+import result_cache
+import agents.metadata_agent  # noqa: F401, registers the agent
+from agent_runtime import AGENT_CLIENTS
+
+
+def test_disk_cache_does_not_block_the_event_loop(tmp_path, monkeypatch):
+    cache = result_cache.ResultCache(16, 60, str(tmp_path / "cache.db"))
+    monkeypatch.setattr(result_cache, "agent_cache", cache)
+    monkeypatch.setattr(result_cache, "CACHE_ENABLED", True)
+    client = AGENT_CLIENTS["metadata"]
+    question = "Which gas do plants absorb during photosynthesis?"
+    asyncio.run(client.arun(question))
+
+    def slow_disk():
+        # Stands in for a lookup stuck on a busy disk.
+        with cache._lock:
+            time.sleep(0.5)
+
+    async def scenario():
+        gaps = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        busy = threading.Thread(target=slow_disk)
+        busy.start()
+        await asyncio.sleep(0.05)
+        feedback = await client.arun(question)
+        await asyncio.sleep(0.05)
+        ticking.cancel()
+        busy.join()
+        return feedback, max(gaps)
+
+    feedback, longest_gap = asyncio.run(scenario())
+    assert feedback["topic"] == "Algebra"
+    assert cache.stats()["by_agent"]["metadata"]["memory_hits"] == 1
+    assert longest_gap < 0.2
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import scheduling
+
+
+class Recorder:
+    """
+    Queues waiters straight into a Scheduler and records the order they are
+    granted in, so no threads or timers are involved.
+    """
+
+    def __init__(self, scheduler: scheduling.Scheduler):
+        self.scheduler = scheduler
+        self.granted = []
+
+    def queue(self, priority: str, created_by: str, label: str = None):
+        with scheduling.traffic(priority, created_by):
+            return self.scheduler._enqueue(lambda: self.granted.append(label or created_by))
+
+    def release_all(self, priority: str, times: int):
+        for _ in range(times):
+            self.scheduler.release(priority)
+
+
+def test_interactive_calls_go_before_queued_bulk_calls():
+    recorder = Recorder(scheduling.Scheduler(1, 1.0, 0, 1))
+    recorder.queue("bulk", "importer", "holder")
+    recorder.queue("bulk", "importer", "bulk-1")
+    recorder.queue("bulk", "other", "bulk-2")
+    recorder.queue("interactive", "teacher", "interactive")
+    assert recorder.granted == ["holder"]
+
+    recorder.release_all("bulk", 1)
+    recorder.release_all("interactive", 1)
+    recorder.release_all("bulk", 1)
+    assert recorder.granted == ["holder", "interactive", "bulk-1", "bulk-2"]
+
+
+def test_authors_take_turns_within_a_class():
+    recorder = Recorder(scheduling.Scheduler(1, 1.0, 0, 1))
+    recorder.queue("bulk", "", "holder")
+    for author, count in (("alice", 3), ("bob", 2), ("carol", 1)):
+        for _ in range(count):
+            recorder.queue("bulk", author)
+    assert recorder.scheduler.snapshot()["classes"]["bulk"]["queued_authors"] == 3
+
+    recorder.release_all("bulk", 6)
+    assert recorder.granted == ["holder", "alice", "bob", "carol", "alice", "bob", "alice"]
+
+
+def test_bulk_calls_keep_to_their_share_of_the_slots():
+    scheduler = scheduling.Scheduler(4, 0.5, 0, 1)
+    recorder = Recorder(scheduler)
+    assert scheduler.bulk_limit == 2
+    for n in range(4):
+        recorder.queue("bulk", "importer", f"bulk-{n}")
+    assert recorder.granted == ["bulk-0", "bulk-1"]
+
+    recorder.queue("interactive", "teacher", "interactive-0")
+    recorder.queue("interactive", "teacher", "interactive-1")
+    recorder.queue("interactive", "teacher", "interactive-2")
+    assert recorder.granted[2:] == ["interactive-0", "interactive-1"]
+    assert scheduler.running == {"interactive": 2, "bulk": 2}
+
+    # A freed interactive slot goes to the waiting interactive call, and
+    # once none is left a free slot stays empty rather than exceed the share.
+    recorder.release_all("interactive", 2)
+    assert recorder.granted[4:] == ["interactive-2"]
+    assert scheduler.queue_depth("bulk") == 2 and scheduler.running["bulk"] == 2
+
+    recorder.release_all("bulk", 1)
+    assert recorder.granted[5:] == ["bulk-2"]
+
+
+def test_rate_tokens_limit_starts_beyond_the_burst():
+    scheduler = scheduling.Scheduler(0, 1.0, 0.001, 2)
+    recorder = Recorder(scheduler)
+    for n in range(3):
+        recorder.queue("bulk", "importer", f"bulk-{n}")
+    waiter = recorder.queue("interactive", "teacher")
+    assert recorder.granted == ["bulk-0", "bulk-1"]
+    assert scheduler.queue_depth("bulk") == 1 and scheduler.queue_depth("interactive") == 1
+
+    scheduler._abandon(waiter)
+    assert scheduler.queue_depth("interactive") == 0
+    scheduler._timer.cancel()
+
+
+def test_async_waiters_are_granted_in_order():
+    scheduler = scheduling.Scheduler(1, 1.0, 0, 1)
+    order = []
+
+    async def call(priority: str, created_by: str):
+        with scheduling.traffic(priority, created_by):
+            async with scheduler.aslot():
+                order.append((priority, created_by))
+
+    async def main():
+        holder = await scheduler.aacquire()
+        tasks = [
+            asyncio.create_task(call(*traffic))
+            for traffic in (("bulk", "alice"), ("bulk", "alice"), ("bulk", "bob"), ("interactive", "teacher"))
+        ]
+        cancelled = asyncio.create_task(call("interactive", "gone"))
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["classes"]["bulk"]["queued"] == 3
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        scheduler.release(holder)
+        await asyncio.gather(*tasks)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(main())
+    assert order == [("interactive", "teacher"), ("bulk", "alice"), ("bulk", "bob"), ("bulk", "alice")]
+    assert scheduler.running == {"interactive": 0, "bulk": 0}
+    assert scheduler.snapshot()["classes"]["interactive"]["calls"] == 1
@@ -0,0 +1,79 @@
+import pytest
+
+import similarity
+import utils
+
+# The example QC_SIMILAR_REUSE_THRESHOLD in the README.
+REUSE_THRESHOLD = 0.95
+
+QUADRATIC = (
+    "If the roots of the quadratic equation x^2 - 5x + 6 = 0 are a and b, find the value of a^2 + b^2. "
+    "Options: (A) 13 (B) 12 (C) 11 (D) 10"
+)
+CHANGED_NUMBERS = [
+    ("Solve for x: 2x + 3 = 7", "Solve for x: 2x + 3 = 9"),
+    (
+        "A train travels 120 km in 2 hours at a constant speed. What is its speed in km per hour?",
+        "A train travels 180 km in 2 hours at a constant speed. What is its speed in km per hour?",
+    ),
+    (QUADRATIC, QUADRATIC.replace("5x", "7x")),
+    (QUADRATIC, QUADRATIC.replace("(A) 13", "(A) 15")),
+]
+
+
+def test_tokens_ignore_spacing_and_case_but_keep_numbers_and_symbols():
+    assert similarity.tokenize("2X+3=7") == similarity.tokenize("2x + 3 = 7") == ["2", "x", "+", "3", "=", "7"]
+    assert similarity.tokenize("x ≤ 3.5") == ["x", "≤", "3.5"]
+    assert similarity.tokenize("ｘ＋１") == ["x", "+", "1"]
+
+
+def test_shingles():
+    assert similarity.shingles("") == set()
+    assert similarity.shingles("x + 4") == {"x + 4"}
+    assert similarity.shingles("a + b = c") == {"a + b", "+ b =", "b = c"}
+
+
+def test_signature_and_bands():
+    assert similarity.signature("   ") is None
+    sig = similarity.signature("x + 4")
+    assert len(sig) == similarity.SIGNATURE_SIZE
+    assert sig == similarity.signature("X+4")
+    keys = similarity.band_keys(sig)
+    assert [band for band, _ in keys] == list(range(similarity.LSH_BANDS))
+    assert all(-2 ** 63 <= key < 2 ** 63 for _, key in keys)
+    assert set(keys).isdisjoint(similarity.band_keys(similarity.signature("x + 3")))
+
+
+@pytest.mark.parametrize("text, changed", CHANGED_NUMBERS)
+def test_changed_numbers_score_below_the_reuse_threshold(text, changed):
+    assert similarity.jaccard(text, changed) < REUSE_THRESHOLD
+    assert similarity.jaccard(text, "  " + text.upper().replace(" ", "  ")) == 1.0
+
+
+@pytest.mark.parametrize("text, changed", CHANGED_NUMBERS[1:])
+def test_near_duplicates_share_a_band(text, changed):
+    keys = set(similarity.band_keys(similarity.signature(text)))
+    assert keys & set(similarity.band_keys(similarity.signature(changed)))
+
+
+def test_find_similar_versions_applies_the_threshold(store):
+    text, changed = CHANGED_NUMBERS[1]
+    utils.append_question_version(question_id="train", original_text=text, created_by="teacher")
+    utils.append_question_version(question_id="other", original_text="Name the capital of France.", created_by="teacher")
+
+    exact = utils.find_similar_versions(text.replace(" ", "  "), REUSE_THRESHOLD)
+    assert [(match["question_id"], match["similarity"]) for match in exact] == [("train", 1.0)]
+    assert utils.find_similar_versions(changed, REUSE_THRESHOLD) == []
+
+    near = utils.find_similar_versions(changed, 0.5)
+    assert [match["question_id"] for match in near] == ["train"]
+    assert near[0]["similarity"] == pytest.approx(similarity.jaccard(text, changed))
+    assert utils.find_similar_versions(changed, 0.5, exclude_question_id="train") == []
+
+
+def test_ai_versions_are_matched_by_their_rewrite(store):
+    utils.append_question_version(
+        question_id="q", original_text="wat is 2 + 2", improved_text="What is 2 + 2?", created_by="AI"
+    )
+    assert [match["text"] for match in utils.find_similar_versions("What is 2 + 2?", REUSE_THRESHOLD)] == ["What is 2 + 2?"]
+    assert utils.find_similar_versions("wat is 2 + 2", REUSE_THRESHOLD) == []
@@ -0,0 +1,195 @@
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+
+import utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# question_versions before texts were interned.
+INLINE_SCHEMA = """
+CREATE TABLE question_versions (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    original_text TEXT NOT NULL DEFAULT '',
+    improved_text TEXT NOT NULL DEFAULT '',
+    correctness_feedback_is_correct INTEGER,
+    correctness_feedback_errors TEXT NOT NULL DEFAULT '[]',
+    correctness_feedback_explanation TEXT NOT NULL DEFAULT '',
+    language_feedback_issues_found INTEGER,
+    language_feedback_feedback TEXT NOT NULL DEFAULT '[]',
+    language_feedback_explanation TEXT NOT NULL DEFAULT '',
+    improvement_justification TEXT NOT NULL DEFAULT '',
+    metadata_topic TEXT NOT NULL DEFAULT '',
+    metadata_subtopic TEXT NOT NULL DEFAULT '',
+    metadata_blooms_level TEXT NOT NULL DEFAULT '',
+    metadata_difficulty TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX idx_question_versions_question_version ON question_versions (question_id, version_number);
+CREATE INDEX idx_question_versions_topic ON question_versions (metadata_topic);
+"""
+LONG_EXPLANATION = "The options are distinct, exactly one of them is correct and the stem states every quantity needed. " * 3
+
+
+def legacy_versions() -> list:
+    versions = []
+    for n in range(3):
+        versions.append(utils._version_fields(
+            f"q-{n}", f"What is {n} + {n}?", "teacher", 1, timestamp=f"2024-01-0{n + 1}T09:00:00"
+        ))
+        versions.append(utils._version_fields(
+            f"q-{n}", f"What is {n} + {n}?", "AI", 2, improved_text=f"What is the value of {n} + {n}?",
+            correctness_feedback={"is_correct": n != 1, "errors": ["Ambiguity: two answers."] if n == 1 else [],
+                                  "explanation": LONG_EXPLANATION},
+            language_feedback={"issues_found": True, "feedback": ["Clarity: state the unit.", "Grammar: add a verb."],
+                               "explanation": "Wordy."},
+            improvement_feedback={"justification": "Asked for the value."},
+            metadata_feedback={"topic": "Arithmetic", "subtopic": "Addition", "blooms_level": "Remember",
+                               "difficulty": ["Easy", "Medium", "Easy"][n]},
+            timestamp=f"2024-01-0{n + 1}T10:00:00"
+        ))
+    return versions
+
+
+def assert_reads_back(versions: list):
+    for version in versions:
+        [stored] = [v for v in utils.get_question_versions(version["question_id"])
+                    if v["version_number"] == version["version_number"]]
+        assert isinstance(stored, utils.StoredVersion)
+        assert {column: stored[column] for column in utils.CSV_HEADERS} == version
+    assert utils.get_stats(group_by=["metadata_difficulty"]) == expected_stats(versions)
+
+
+def expected_stats(versions: list) -> list:
+    # What get_stats() counts, worked out from the versions themselves.
+    groups = {}
+    for version in versions:
+        if version["created_by"] != "AI":
+            continue
+        group = groups.setdefault(version["metadata_difficulty"], dict.fromkeys(
+            ("versions", "checked", "passed", "language_checked", "language_issues"), 0
+        ))
+        is_correct, issues_found = version["correctness_feedback_is_correct"], version["language_feedback_issues_found"]
+        group["versions"] += 1
+        group["checked"] += is_correct is not None
+        group["passed"] += is_correct is True
+        group["language_checked"] += issues_found is not None
+        group["language_issues"] += issues_found is True
+    return [
+        {"metadata_difficulty": difficulty, **group,
+         "pass_rate": group["passed"] / group["checked"] if group["checked"] else None,
+         "language_issue_rate": group["language_issues"] / group["language_checked"] if group["language_checked"] else None}
+        for difficulty, group in sorted(groups.items())
+    ]
+
+
+def test_cancelled_queued_append_does_not_stop_the_writer(store, monkeypatch):
+    # A long window keeps the first append queued while its caller gives up.
+    monkeypatch.setattr(utils, "version_writer", utils.GroupCommitWriter(8, 0.2))
+
+    async def scenario():
+        abandoned = asyncio.create_task(utils.append_question_version_async(
+            question_id="q-cancelled", original_text="first", created_by="teacher", version_number=1
+        ))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        return await asyncio.wait_for(utils.append_question_version_async(
+            question_id="q-next", original_text="second", created_by="teacher", version_number=1
+        ), timeout=5)
+
+    stored = asyncio.run(scenario())
+    assert stored["question_id"] == "q-next"
+    assert utils.get_question_versions("q-next")[0]["original_text"] == "second"
+    assert utils.get_question_versions("q-cancelled") == []
+
+
+def test_failed_batch_fails_only_its_own_appends(store, monkeypatch):
+    writer = utils.GroupCommitWriter(8, 0)
+    insert_versions = utils.insert_versions
+
+    def flaky_insert(conn, versions):
+        if versions[0]["question_id"] == "q-bad":
+            raise RuntimeError("disk I/O error")
+        return insert_versions(conn, versions)
+
+    monkeypatch.setattr(utils, "insert_versions", flaky_insert)
+    bad = writer.submit([{"question_id": "q-bad", "original_text": "x", "created_by": "teacher", "version_number": 1}])
+    good = writer.submit([{"question_id": "q-good", "original_text": "y", "created_by": "teacher", "version_number": 1}])
+    assert isinstance(bad.exception(timeout=5), RuntimeError)
+    assert good.result(timeout=5)[0]["question_id"] == "q-good"
+
+
+def test_inline_schema_is_migrated_in_place(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "question_versions.db")
+    versions = legacy_versions()
+    conn = sqlite3.connect(db_file)
+    conn.executescript(INLINE_SCHEMA)
+    for version in versions:
+        row = {**version, **{column: json.dumps(version[column]) for column in utils.LIST_COLUMNS}}
+        conn.execute(
+            f"INSERT INTO question_versions ({', '.join(utils.CSV_HEADERS)}) VALUES ({', '.join('?' for _ in utils.CSV_HEADERS)})",
+            [row[column] for column in utils.CSV_HEADERS]
+        )
+    conn.commit()
+    rowids = conn.execute("SELECT rowid, question_id, version_number FROM question_versions ORDER BY rowid").fetchall()
+    conn.close()
+
+    monkeypatch.setattr(utils, "DB_FILE", db_file)
+    monkeypatch.setattr(utils, "CSV_FILE", str(tmp_path / "missing.csv"))
+    utils.initialize_storage()
+    utils.initialize_storage()
+
+    assert_reads_back(versions)
+    conn = utils.get_connection()
+    assert [tuple(row) for row in conn.execute(
+        "SELECT rowid, question_id, version_number FROM question_versions ORDER BY rowid"
+    )] == rowids
+    assert "original_text" not in {row["name"] for row in conn.execute("PRAGMA table_info(question_versions)")}
+    assert utils.find_similar_versions("What is the value of 2 + 2?", 0.99)[0]["question_id"] == "q-2"
+
+
+def run_cli(db_file: str, *args):
+    # Run outside the service directory, so a new store does not import its question_versions.csv.
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "utils.py"), *args], cwd=os.path.dirname(db_file),
+                            env={**os.environ, "QC_DB_FILE": db_file}, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_cli_migrate_compact_and_rollups_keep_every_version(tmp_path, monkeypatch):
+    versions = legacy_versions()
+    csv_file = tmp_path / "legacy.csv"
+    with open(csv_file, "w", newline="", encoding="utf-8") as f:
+        # As the CSV store wrote them: lists joined with "; ", booleans as true/false.
+        writer = csv.DictWriter(f, fieldnames=utils.CSV_HEADERS)
+        writer.writeheader()
+        for version in versions:
+            writer.writerow({
+                **version,
+                **{column: "; ".join(version[column]) for column in utils.LIST_COLUMNS},
+                **{column: "" if version[column] is None else str(version[column]).lower() for column in utils.BOOL_COLUMNS},
+            })
+    db_file = str(tmp_path / "question_versions.db")
+    monkeypatch.setattr(utils, "DB_FILE", db_file)
+
+    assert "Migrated 6 of 6 rows" in run_cli(db_file, "migrate", str(csv_file))
+    assert "Migrated 0 of 6 rows" in run_cli(db_file, "migrate", str(csv_file))
+    assert_reads_back(versions)
+
+    assert "Vacuumed" in run_cli(db_file, "compact", "0", "--vacuum")
+    assert utils.get_connection().execute("SELECT COUNT(*) FROM version_texts WHERE typeof(body) = 'blob'").fetchone()[0]
+    assert_reads_back(versions)
+
+    conn = utils.get_connection()
+    with conn:
+        conn.execute("DELETE FROM version_rollups")
+    assert utils.get_stats(group_by=["metadata_difficulty"]) == []
+    assert "Rebuilt rollups from 3 AI versions" in run_cli(db_file, "rollups")
+    assert_reads_back(versions)
@@ -1,30 +1,314 @@
+import asyncio
+import concurrent.futures
 import csv
+import functools
+import hashlib
+import io
+import json
 import os
-from datetime import datetime
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import uuid
 
+import metrics
+import similarity
+from config import settings
+
+DB_FILE = settings.db_file
+# Legacy storage; only read by the one-shot migrator and mirrored by the CSV export.
 CSV_FILE = "question_versions.csv"
+# WAL lets readers run alongside the single writer and lets several
+# processes (uvicorn workers, job workers) share the database safely.
+DB_JOURNAL_MODE = settings.db_journal_mode
+DB_SYNCHRONOUS = settings.db_synchronous
+# Async appends queued together are committed in one transaction of up to
+# this many versions. The window is how long the writer waits for more; 0
+# commits whatever is queued, adding no latency when idle.
+GROUP_COMMIT_MAX_BATCH = settings.group_commit_max_batch
+GROUP_COMMIT_WINDOW_MS = settings.group_commit_window_ms
+# Near-duplicate lookups score at most this many LSH candidates, those
+# sharing the most bands first.
+SIMILAR_MAX_CANDIDATES = settings.similar_max_candidates
+# `python utils.py compact` compresses the texts of versions older than this.
+COLD_HISTORY_DAYS = settings.cold_history_days
+# Deflate saves little on shorter texts, so they are left as they are.
+COMPRESS_MIN_BYTES = 128
 
-def load_prompt(prompt_name: str) -> str:
-    prompt_path = os.path.join(os.path.dirname(__file__), "prompts", f"{prompt_name}.txt")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read()
-
-def initialize_csv():
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                "question_id", "version_number", "timestamp", "created_by",
-                "original_text", "improved_text",
-                "correctness_feedback_is_correct", "correctness_feedback_errors", "correctness_feedback_explanation",
-                "language_feedback_issues_found", "language_feedback_feedback", "language_feedback_explanation",
-                "improvement_justification",
-                "metadata_topic", "metadata_subtopic", "metadata_blooms_level", "metadata_difficulty"
-            ])
-        print(f"Initialized CSV file: {CSV_FILE}")
+CSV_HEADERS = [
+    "question_id", "version_number", "timestamp", "created_by",
+    "original_text", "improved_text",
+    "correctness_feedback_is_correct", "correctness_feedback_errors", "correctness_feedback_explanation",
+    "language_feedback_issues_found", "language_feedback_feedback", "language_feedback_explanation",
+    "improvement_justification",
+    "metadata_topic", "metadata_subtopic", "metadata_blooms_level", "metadata_difficulty"
+]
 
-def append_question_version(
+BOOL_COLUMNS = ("correctness_feedback_is_correct", "language_feedback_issues_found")
+LIST_COLUMNS = ("correctness_feedback_errors", "language_feedback_feedback")
+TEXT_COLUMNS = (
+    "original_text", "improved_text", "correctness_feedback_explanation",
+    "language_feedback_explanation", "improvement_justification"
+)
+# Stored once in version_texts, found again by a hash of their content;
+# versions hold the text's id in a <column>_id column, NULL for "" or [].
+# Lists are stored as JSON arrays.
+INTERNED_COLUMNS = TEXT_COLUMNS + LIST_COLUMNS
+# GET /stats counts AI versions by each of these, per author and day.
+ROLLUP_DIMENSIONS = ("metadata_topic", "metadata_subtopic", "metadata_blooms_level", "metadata_difficulty")
+
+# Lookups and next-version queries are range scans on this unique index, so
+# their cost is O(log n) in total history instead of a full-file scan.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS version_texts (
+    text_id INTEGER PRIMARY KEY,
+    digest INTEGER NOT NULL,
+    -- TEXT as written, a deflated BLOB once compress_cold_history() has run.
+    body NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_version_texts_digest ON version_texts (digest);
+CREATE TABLE IF NOT EXISTS question_versions (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    original_text_id INTEGER,
+    improved_text_id INTEGER,
+    correctness_feedback_is_correct INTEGER,
+    correctness_feedback_errors_id INTEGER,
+    correctness_feedback_explanation_id INTEGER,
+    language_feedback_issues_found INTEGER,
+    language_feedback_feedback_id INTEGER,
+    language_feedback_explanation_id INTEGER,
+    improvement_justification_id INTEGER,
+    metadata_topic TEXT NOT NULL DEFAULT '',
+    metadata_subtopic TEXT NOT NULL DEFAULT '',
+    metadata_blooms_level TEXT NOT NULL DEFAULT '',
+    metadata_difficulty TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_question_versions_question_version
+    ON question_versions (question_id, version_number);
+CREATE INDEX IF NOT EXISTS idx_question_versions_created_by ON question_versions (created_by);
+CREATE INDEX IF NOT EXISTS idx_question_versions_topic ON question_versions (metadata_topic);
+CREATE INDEX IF NOT EXISTS idx_question_versions_difficulty ON question_versions (metadata_difficulty);
+CREATE INDEX IF NOT EXISTS idx_question_versions_timestamp ON question_versions (timestamp);
+CREATE TABLE IF NOT EXISTS stage_fingerprints (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    prompt_sha256 TEXT NOT NULL,
+    model TEXT NOT NULL,
+    PRIMARY KEY (question_id, version_number, stage)
+);
+CREATE TABLE IF NOT EXISTS version_routes (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    PRIMARY KEY (question_id, version_number)
+);
+CREATE TABLE IF NOT EXISTS similarity_indexed (
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    PRIMARY KEY (question_id, version_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS similarity_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    question_id TEXT NOT NULL,
+    version_number INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, question_id, version_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS version_rollups (
+    -- '' counts every AI version; otherwise one of ROLLUP_DIMENSIONS, by value.
+    -- Each version is also counted under day '' (all days) and, with
+    -- by_author 0, for all authors, so a query reads only the rows it returns.
+    dimension TEXT NOT NULL,
+    by_author INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    author TEXT NOT NULL,
+    value TEXT NOT NULL,
+    versions INTEGER NOT NULL,
+    checked INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    language_checked INTEGER NOT NULL,
+    language_issues INTEGER NOT NULL,
+    PRIMARY KEY (dimension, by_author, day, author, value)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_COUNTS = ("versions", "checked", "passed", "language_checked", "language_issues")
+
+_ROLLUP_UPSERT = (
+    f"INSERT INTO version_rollups (dimension, by_author, day, author, value, {', '.join(ROLLUP_COUNTS)}) {{values}} "
+    "ON CONFLICT (dimension, by_author, day, author, value) DO UPDATE SET "
+    + ", ".join(f"{count} = {count} + excluded.{count}" for count in ROLLUP_COUNTS)
+)
+
+_ROLLUP_INSERT_SQL = _ROLLUP_UPSERT.format(values=f"VALUES ({', '.join('?' * (5 + len(ROLLUP_COUNTS)))})")
+
+# The author of an AI version is whoever submitted the text it checked: the
+# question's latest earlier version not written by the AI.
+_AUTHOR_SQL = (
+    "SELECT a.created_by FROM question_versions a WHERE a.question_id = {question_id} "
+    "AND a.version_number < {version_number} AND a.created_by != 'AI' ORDER BY a.version_number DESC LIMIT 1"
+)
+
+def _stored_column(column: str) -> str:
+    return f"{column}_id" if column in INTERNED_COLUMNS else column
+
+_INSERT_SQL = (
+    f"INSERT INTO question_versions ({', '.join(_stored_column(column) for column in CSV_HEADERS)}) "
+    f"VALUES ({', '.join('?' for _ in CSV_HEADERS)})"
+)
+
+_local = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    # sqlite3 connections are not shared across threads, and storage calls
+    # arrive from asyncio.to_thread workers, so each thread keeps its own.
+    # The timeout lets writers from other processes (job workers) finish first.
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_FILE:
+        conn = sqlite3.connect(DB_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        _local.conn = conn
+        _local.path = DB_FILE
+    return conn
+
+@contextmanager
+def write_transaction(conn: sqlite3.Connection = None):
+    """
+    Runs the block in a BEGIN IMMEDIATE transaction, which takes the write
+    lock up front: reads inside it (such as the next version number) cannot
+    be invalidated by another writer before the commit.
+    """
+    conn = conn or get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# Raw deflate: no zlib header or checksum, which are a sizeable part of a short text.
+DEFLATE_WBITS = -15
+
+def _decode_body(body) -> str:
+    return zlib.decompress(body, DEFLATE_WBITS).decode("utf-8") if body.__class__ is bytes else body
+
+def _intern_text(conn: sqlite3.Connection, text: str):
+    """
+    Returns the version_texts id for `text`, storing it if no version has
+    used it yet, inside the caller's transaction. Empty text has no id.
+    """
+    if not text:
+        return None
+    digest = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+    # Ids follow insertion order rather than the digest, so the texts of
+    # versions stored together share database pages and read back together.
+    for text_id, body in conn.execute("SELECT text_id, body FROM version_texts WHERE digest = ?", (digest,)):
+        if _decode_body(body) == text:
+            return text_id
+    return conn.execute("INSERT INTO version_texts (digest, body) VALUES (?, ?)", (digest, text)).lastrowid
+
+def _stored_row(conn: sqlite3.Connection, version: dict) -> tuple:
+    # `version` maps CSV_HEADERS to decoded values, as _version_fields() builds them.
+    row = []
+    for column in CSV_HEADERS:
+        value = version[column]
+        if column in LIST_COLUMNS:
+            value = _intern_text(conn, json.dumps(value)) if value else None
+        elif column in TEXT_COLUMNS:
+            value = _intern_text(conn, value)
+        row.append(value)
+    return tuple(row)
+
+def _schema_statements() -> list:
+    # SCHEMA's comments contain semicolons, so a plain split breaks statements.
+    statements, statement = [], ""
+    for line in SCHEMA.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement)
+            statement = ""
+    return statements
+
+def _migrate_inline_texts(conn: sqlite3.Connection, batch_size: int = 1000):
+    """
+    Converts a question_versions table written before texts were interned,
+    keeping each version's rowid so cursors and export snapshots stay valid.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(question_versions)")}
+    if "original_text" not in columns:
+        return
+    print(f"Interning version texts in {DB_FILE}; this runs once")
+    with write_transaction(conn):
+        for (index,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'question_versions' AND sql IS NOT NULL"
+        ).fetchall():
+            conn.execute(f"DROP INDEX {index}")
+        conn.execute("ALTER TABLE question_versions RENAME TO question_versions_inline")
+        # executescript() would commit the open transaction.
+        for statement in _schema_statements():
+            conn.execute(statement)
+        insert_sql = _INSERT_SQL.replace("(", "(rowid, ", 1).replace("VALUES (", "VALUES (?, ", 1)
+        migrated = 0
+        rows = conn.execute(f"SELECT rowid, {', '.join(CSV_HEADERS)} FROM question_versions_inline ORDER BY rowid")
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            stored = []
+            for row in batch:
+                version = {column: row[column] for column in CSV_HEADERS}
+                for column in BOOL_COLUMNS:
+                    version[column] = _to_bool(version[column])
+                for column in LIST_COLUMNS:
+                    version[column] = json.loads(version[column] or "[]")
+                stored.append((row["rowid"], *_stored_row(conn, version)))
+            conn.executemany(insert_sql, stored)
+            migrated += len(stored)
+        conn.execute("DROP TABLE question_versions_inline")
+    print(f"Interned the texts of {migrated} versions; run VACUUM to return the freed space to the filesystem")
+
+def initialize_storage():
+    conn = get_connection()
+    is_new = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_versions'"
+    ).fetchone() is None
+    needs_rollups = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'version_rollups'"
+    ).fetchone() is None
+    if not is_new:
+        _migrate_inline_texts(conn)
+    with conn:
+        conn.executescript(SCHEMA)
+    if is_new:
+        print(f"Initialized version store: {DB_FILE}")
+        if os.path.exists(CSV_FILE):
+            migrate_csv(CSV_FILE)
+    elif needs_rollups:
+        rebuild_rollups()
+    index_missing_similarity()
+
+def _to_bool(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+def _version_fields(
     question_id: str,
     original_text: str,
     created_by: str,
@@ -33,92 +317,810 @@ def append_question_version(
     correctness_feedback: dict = None,
     language_feedback: dict = None,
     improvement_feedback: dict = None,
-    metadata_feedback: dict = None
-):
-    timestamp = datetime.now().isoformat()
-
-    correctness_is_correct = correctness_feedback.get("is_correct") if correctness_feedback else None
-    correctness_errors = "; ".join(correctness_feedback.get("errors", [])) if correctness_feedback and correctness_feedback.get("errors") else ""
-    correctness_explanation = correctness_feedback.get("explanation") if correctness_feedback else ""
-
-    language_issues_found = language_feedback.get("issues_found") if language_feedback else None
-    language_feedback_str = "; ".join(language_feedback.get("feedback", [])) if language_feedback and language_feedback.get("feedback") else ""
-    language_explanation = language_feedback.get("explanation") if language_feedback else ""
+    metadata_feedback: dict = None,
+    timestamp: str = None
+) -> dict:
+    correctness_feedback = correctness_feedback or {}
+    language_feedback = language_feedback or {}
+    improvement_feedback = improvement_feedback or {}
+    metadata_feedback = metadata_feedback or {}
 
-    improvement_justification = improvement_feedback.get("justification") if improvement_feedback else ""
-
-    metadata_topic = metadata_feedback.get("topic") if metadata_feedback else ""
-    metadata_subtopic = metadata_feedback.get("subtopic") if metadata_feedback else ""
-    metadata_blooms_level = metadata_feedback.get("blooms_level") if metadata_feedback else ""
-    metadata_difficulty = metadata_feedback.get("difficulty") if metadata_feedback else ""
-
-    row = {
+    return {
         "question_id": question_id,
         "version_number": version_number,
-        "timestamp": timestamp,
+        "timestamp": timestamp or datetime.now().isoformat(),
         "created_by": created_by,
-        "original_text": original_text,
-        "improved_text": improved_text,
-        "correctness_feedback_is_correct": str(correctness_is_correct).lower() if correctness_is_correct is not None else "",
-        "correctness_feedback_errors": correctness_errors,
-        "correctness_feedback_explanation": correctness_explanation,
-        "language_feedback_issues_found": str(language_issues_found).lower() if language_issues_found is not None else "",
-        "language_feedback_feedback": language_feedback_str,
-        "language_feedback_explanation": language_explanation,
-        "improvement_justification": improvement_justification,
-        "metadata_topic": metadata_topic,
-        "metadata_subtopic": metadata_subtopic,
-        "metadata_blooms_level": metadata_blooms_level,
-        "metadata_difficulty": metadata_difficulty
+        "original_text": original_text or "",
+        "improved_text": improved_text or "",
+        "correctness_feedback_is_correct": _to_bool(correctness_feedback.get("is_correct")),
+        "correctness_feedback_errors": list(correctness_feedback.get("errors") or []),
+        "correctness_feedback_explanation": correctness_feedback.get("explanation") or "",
+        "language_feedback_issues_found": _to_bool(language_feedback.get("issues_found")),
+        "language_feedback_feedback": list(language_feedback.get("feedback") or []),
+        "language_feedback_explanation": language_feedback.get("explanation") or "",
+        "improvement_justification": improvement_feedback.get("justification") or "",
+        "metadata_topic": metadata_feedback.get("topic") or "",
+        "metadata_subtopic": metadata_feedback.get("subtopic") or "",
+        "metadata_blooms_level": metadata_feedback.get("blooms_level") or "",
+        "metadata_difficulty": metadata_feedback.get("difficulty") or ""
     }
 
-    headers = [
-        "question_id", "version_number", "timestamp", "created_by",
-        "original_text", "improved_text",
-        "correctness_feedback_is_correct", "correctness_feedback_errors", "correctness_feedback_explanation",
-        "language_feedback_issues_found", "language_feedback_feedback", "language_feedback_explanation",
-        "improvement_justification",
-        "metadata_topic", "metadata_subtopic", "metadata_blooms_level", "metadata_difficulty"
-    ]
+@metrics.storage_timer("append_version")
+def append_question_version(
+    question_id: str,
+    original_text: str,
+    created_by: str,
+    version_number: int = None,
+    improved_text: str = "",
+    correctness_feedback: dict = None,
+    language_feedback: dict = None,
+    improvement_feedback: dict = None,
+    metadata_feedback: dict = None,
+    stage_fingerprints: dict = None,
+    route: str = None
+) -> dict:
+    """
+    Stores one version, with the input fingerprints of the stages that
+    produced it and the route the graph took, and returns it as
+    get_question_versions() would. Without a version_number the question's
+    next number is allocated atomically.
+    """
+    with write_transaction() as conn:
+        stored = insert_versions(conn, [{
+            "question_id": question_id,
+            "original_text": original_text,
+            "created_by": created_by,
+            "version_number": version_number,
+            "improved_text": improved_text,
+            "correctness_feedback": correctness_feedback,
+            "language_feedback": language_feedback,
+            "improvement_feedback": improvement_feedback,
+            "metadata_feedback": metadata_feedback,
+            "stage_fingerprints": stage_fingerprints,
+            "route": route
+        }])
+    print(f"Appended version {stored[0]['version_number']} for question {question_id} to {DB_FILE}")
+    return stored[0]
+
+def _insert_stage_fingerprints(conn: sqlite3.Connection, question_id: str, version_number: int, stage_fingerprints: dict):
+    if stage_fingerprints:
+        conn.executemany(
+            "INSERT INTO stage_fingerprints (question_id, version_number, stage, fingerprint, prompt_sha256, model) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (question_id, version_number, stage, value["fingerprint"], value["prompt_sha256"], value["model"])
+                for stage, value in stage_fingerprints.items()
+            ]
+        )
 
-    with open(CSV_FILE, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=headers)
-        writer.writerow(row)
-    print(f"Appended version {version_number} for question {question_id} to {CSV_FILE}")
+def insert_versions(conn: sqlite3.Connection, versions: list) -> list:
+    """
+    Inserts versions inside the caller's open transaction, so other writes
+    to the same database can commit atomically with them. Each item takes
+    the same keyword arguments as append_question_version; a missing
+    version_number is allocated as the question's next one, which is only
+    race-free inside write_transaction(). Returns the stored versions.
+    """
+    stored = []
+    stored_max = {}
+    assigned_max = {}
+    for version in versions:
+        version = dict(version)
+        stage_fingerprints = version.pop("stage_fingerprints", None)
+        route = version.pop("route", None)
+        question_id = version["question_id"]
+        if version.get("version_number") is None:
+            if question_id not in stored_max:
+                stored_max[question_id] = conn.execute(
+                    "SELECT COALESCE(MAX(version_number), 0) FROM question_versions WHERE question_id = ?",
+                    (question_id,)
+                ).fetchone()[0]
+            version["version_number"] = max(stored_max[question_id], assigned_max.get(question_id, 0)) + 1
+        assigned_max[question_id] = max(assigned_max.get(question_id, 0), version["version_number"])
+        stored.append({**_version_fields(**version), "route": route})
+        _insert_stage_fingerprints(conn, question_id, version["version_number"], stage_fingerprints)
+    conn.executemany(_INSERT_SQL, [_stored_row(conn, version) for version in stored])
+    conn.executemany(
+        "INSERT INTO version_routes (question_id, version_number, route) VALUES (?, ?, ?)",
+        [(version["question_id"], version["version_number"], version["route"]) for version in stored if version["route"]]
+    )
+    _update_rollups(conn, stored)
+    _index_similarity(conn, stored)
+    return stored
 
+def _update_rollups(conn: sqlite3.Connection, versions: list):
+    """
+    Adds the stored AI versions to version_rollups inside the caller's
+    transaction, after they were inserted.
+    """
+    deltas = {}
+    for version in versions:
+        if version["created_by"] != "AI":
+            continue
+        author = conn.execute(
+            _AUTHOR_SQL.format(question_id="?", version_number="?"), (version["question_id"], version["version_number"])
+        ).fetchone()
+        author = author[0] if author else ""
+        day = version["timestamp"][:10]
+        is_correct = version["correctness_feedback_is_correct"]
+        issues_found = version["language_feedback_issues_found"]
+        delta = (1, is_correct is not None, is_correct is True, issues_found is not None, issues_found is True)
+        for dimension in ("", *ROLLUP_DIMENSIONS):
+            value = version[dimension] if dimension else ""
+            for key in ((dimension, 1, day, author, value), (dimension, 0, day, "", value),
+                        (dimension, 1, "", author, value), (dimension, 0, "", "", value)):
+                counts = deltas.setdefault(key, [0] * len(ROLLUP_COUNTS))
+                for i, count in enumerate(delta):
+                    counts[i] += count
+    conn.executemany(_ROLLUP_INSERT_SQL, [(*key, *counts) for key, counts in deltas.items()])
 
-def get_question_versions(question_id: str):
-    if not os.path.exists(CSV_FILE):
+def rebuild_rollups(batch_size: int = 100000) -> int:
+    """
+    Recomputes version_rollups from the whole history in one write
+    transaction, so appends wait rather than being counted twice or missed.
+    Each batch of versions is aggregated by SQLite in a handful of GROUP BY
+    statements rather than row by row. Returns the AI versions counted.
+    """
+    conn = get_connection()
+    counted = 0
+    with write_transaction(conn):
+        conn.execute("DELETE FROM version_rollups")
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM question_versions").fetchone()[0]
+        for start in range(0, last_rowid, batch_size):
+            # Resolve each version's author once, then roll the batch up by each dimension.
+            conn.execute("DROP TABLE IF EXISTS temp.rollup_batch")
+            conn.execute(
+                "CREATE TEMP TABLE rollup_batch AS "
+                "SELECT substr(v.timestamp, 1, 10) AS day, "
+                f"COALESCE(({_AUTHOR_SQL.format(question_id='v.question_id', version_number='v.version_number')}), '') AS author, "
+                f"{', '.join('v.' + dimension for dimension in ROLLUP_DIMENSIONS)}, "
+                "v.correctness_feedback_is_correct AS is_correct, v.language_feedback_issues_found AS issues_found "
+                "FROM question_versions v WHERE v.rowid > ? AND v.rowid <= ? AND v.created_by = 'AI'",
+                (start, start + batch_size)
+            )
+            for dimension in ("", *ROLLUP_DIMENSIONS):
+                value = dimension or "''"
+                conn.execute(_ROLLUP_UPSERT.format(values=(
+                    f"SELECT '{dimension}', by_author, CASE WHEN by_day THEN day ELSE '' END, "
+                    f"CASE WHEN by_author THEN author ELSE '' END, {value}, COUNT(*), COUNT(is_correct), "
+                    "TOTAL(is_correct = 1), COUNT(issues_found), TOTAL(issues_found = 1) "
+                    "FROM rollup_batch, (SELECT column1 AS by_day, column2 AS by_author FROM (VALUES (1, 1), (1, 0), (0, 1), (0, 0))) "
+                    # WHERE true: SQLite's upsert needs it to parse INSERT ... SELECT ... ON CONFLICT.
+                    "WHERE true GROUP BY 1, 2, 3, 4, 5"
+                )))
+            counted += conn.execute("SELECT COUNT(*) FROM rollup_batch").fetchone()[0]
+        conn.execute("DROP TABLE IF EXISTS temp.rollup_batch")
+    print(f"Rebuilt rollups from {counted} AI versions in {DB_FILE}")
+    return counted
+
+STATS_GROUPS = ("day", "author") + ROLLUP_DIMENSIONS
+
+@metrics.storage_timer("stats")
+def get_stats(group_by: list = None, author: str = None, since: str = None, until: str = None) -> list:
+    """
+    Returns QC counts and rates of AI versions from version_rollups, one item
+    per group: `group_by` takes day, author and at most one metadata column.
+    `since`/`until` bound the day (YYYY-MM-DD; until is exclusive). The cost
+    depends on the days, authors and values in range, not on the history.
+    """
+    group_by = list(group_by or [])
+    unknown = set(group_by) - set(STATS_GROUPS)
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(sorted(unknown))}")
+    dimensions = [column for column in group_by if column in ROLLUP_DIMENSIONS]
+    if len(dimensions) > 1:
+        raise ValueError("Group by at most one metadata column")
+
+    by_author = "author" in group_by or author is not None
+    clauses, params = ["dimension = ?", "by_author = ?"], [dimensions[0] if dimensions else "", int(by_author)]
+    if author is not None:
+        clauses.append("author = ?")
+        params.append(author)
+    if "day" in group_by or since or until:
+        clauses.append("day != ''")
+        if since:
+            clauses.append("day >= ?")
+            params.append(since)
+        if until:
+            clauses.append("day < ?")
+            params.append(until)
+    else:
+        clauses.append("day = ''")
+    keys = [f"value AS {column}" if column in ROLLUP_DIMENSIONS else column for column in group_by]
+    sums = [f"COALESCE(SUM({count}), 0) AS {count}" for count in ROLLUP_COUNTS]
+    positions = ", ".join(str(i + 1) for i in range(len(keys)))
+    rows = get_connection().execute(
+        f"SELECT {', '.join(keys + sums)} FROM version_rollups WHERE {' AND '.join(clauses)}"
+        + (f" GROUP BY {positions} ORDER BY {positions}" if keys else ""),
+        params
+    ).fetchall()
+    items = []
+    for row in rows:
+        item = dict(row)
+        item["pass_rate"] = item["passed"] / item["checked"] if item["checked"] else None
+        item["language_issue_rate"] = item["language_issues"] / item["language_checked"] if item["language_checked"] else None
+        items.append(item)
+    return items
+
+def _similarity_text(version: dict) -> str:
+    # AI versions carry the submitted text too, so only their rewrite is new.
+    if version["created_by"] == "AI" and version.get("improved_text"):
+        return version["improved_text"]
+    return version.get("original_text") or ""
+
+def _index_similarity(conn: sqlite3.Connection, versions: list):
+    """
+    Adds the versions' LSH buckets to the near-duplicate index inside the
+    caller's transaction.
+    """
+    indexed = []
+    buckets = []
+    for version in versions:
+        sig = similarity.signature(_similarity_text(version))
+        if sig is None:
+            continue
+        key = (version["question_id"], version["version_number"])
+        indexed.append(key)
+        buckets.extend((band, bucket, *key) for band, bucket in similarity.band_keys(sig))
+    conn.executemany(
+        "INSERT OR IGNORE INTO similarity_indexed (question_id, version_number) VALUES (?, ?)",
+        indexed
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO similarity_buckets (band, bucket, question_id, version_number) VALUES (?, ?, ?, ?)",
+        buckets
+    )
+
+def index_missing_similarity(batch_size: int = 1000) -> int:
+    """
+    Indexes stored versions missing from the near-duplicate index, such as
+    rows migrated from CSV or written before the index existed.
+    """
+    conn = get_connection()
+    indexed = 0
+    after = 0
+    selected, source = _version_source(("question_id", "version_number", "created_by", "original_text", "improved_text"))
+    while True:
+        rows = conn.execute(
+            f"SELECT v.rowid AS _cursor, {selected} FROM {source} LEFT JOIN similarity_indexed s "
+            "    ON s.question_id = v.question_id AND s.version_number = v.version_number "
+            "WHERE v.rowid > ? AND s.question_id IS NULL "
+            "AND (v.original_text_id IS NOT NULL OR v.improved_text_id IS NOT NULL) "
+            "ORDER BY v.rowid LIMIT ?",
+            (after, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        with write_transaction(conn):
+            _index_similarity(conn, _load_versions(rows))
+        indexed += len(rows)
+        after = rows[-1]["_cursor"]
+    if indexed:
+        print(f"Indexed {indexed} versions for near-duplicate search in {DB_FILE}")
+    return indexed
+
+@metrics.storage_timer("find_similar")
+def find_similar_versions(text: str, threshold: float, limit: int = 10, exclude_question_id: str = None) -> list:
+    """
+    Returns up to `limit` stored questions whose text is at
+    least `threshold` similar (Jaccard over token shingles) to `text`, most
+    similar first, with the best-matching version of each. Only versions
+    sharing an LSH bucket with `text` are scored, so the cost does not grow
+    with the size of the question bank.
+    """
+    sig = similarity.signature(text)
+    if sig is None:
         return []
+    keys = similarity.band_keys(sig)
+    # Boilerplate shared by many questions can fill a whole band, so each
+    # band's bucket is read up to the candidate cap; near-duplicates share
+    # several bands and are still found through the others.
+    band_rows = " UNION ALL ".join(
+        "SELECT * FROM (SELECT question_id, version_number FROM similarity_buckets "
+        "WHERE band = ? AND bucket = ? LIMIT ?)" for _ in keys
+    )
+    selected, source = _version_source(("question_id", "version_number", "created_by", "original_text", "improved_text"))
+    rows = get_connection().execute(
+        "WITH candidates AS ("
+        f"    SELECT question_id, version_number, COUNT(*) AS hits FROM ({band_rows}) "
+        "    GROUP BY question_id, version_number ORDER BY hits DESC LIMIT ?) "
+        f"SELECT {selected} FROM candidates c "
+        f"JOIN {source.replace('question_versions v', 'question_versions v ON v.question_id = c.question_id AND v.version_number = c.version_number', 1)}",
+        (*(value for band, bucket in keys for value in (band, bucket, SIMILAR_MAX_CANDIDATES)), SIMILAR_MAX_CANDIDATES)
+    ).fetchall()
+
+    shingles = similarity.shingles(text)
+    best = {}
+    for row in _load_versions(rows):
+        if row["question_id"] == exclude_question_id:
+            continue
+        candidate_text = _similarity_text(row)
+        candidate = similarity.shingles(candidate_text)
+        score = len(shingles & candidate) / len(shingles | candidate)
+        if score >= threshold and score > best.get(row["question_id"], {}).get("similarity", -1):
+            best[row["question_id"]] = {
+                "question_id": row["question_id"],
+                "version_number": row["version_number"],
+                "created_by": row["created_by"],
+                "similarity": score,
+                "text": candidate_text
+            }
+    return sorted(best.values(), key=lambda match: match["similarity"], reverse=True)[:limit]
+
+@metrics.storage_timer("append_versions_bulk")
+def append_question_versions_bulk(versions: list) -> list:
+    """
+    Writes many versions in a single transaction and returns them as stored.
+    """
+    with write_transaction() as conn:
+        stored = insert_versions(conn, versions)
+    print(f"Appended {len(versions)} versions to {DB_FILE}")
+    return stored
+
+class GroupCommitWriter:
+    """
+    Commits version appends from concurrent requests together. One thread
+    takes everything queued, up to GROUP_COMMIT_MAX_BATCH versions, and
+    writes it in a single transaction, so under load many appends share one
+    write lock and one WAL sync. If a shared transaction fails, its appends
+    are retried one by one so only the offending one fails. An append
+    cancelled before its transaction starts is not written.
+    """
+
+    def __init__(self, max_batch: int, window_seconds: float):
+        self.max_batch = max_batch
+        self.window_seconds = window_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
 
+    def submit(self, versions: list) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self._queue.put((versions, future))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="version-writer", daemon=True)
+                    self._thread.start()
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.window_seconds
+            while size < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            # An append whose caller gave up while it was queued is dropped;
+            # the rest can no longer be cancelled.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Fail this batch's appends, not the thread every later append waits on.
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _write(self, batch: list):
+        try:
+            with metrics.storage_timer("group_commit"), write_transaction() as conn:
+                results = [insert_versions(conn, versions) for versions, _ in batch]
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    self._write([item])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        metrics.group_commit_versions.observe(sum(len(versions) for versions, _ in batch))
+        for (_, future), stored in zip(batch, results):
+            future.set_result(stored)
+        print(f"Appended {sum(len(stored) for stored in results)} versions from {len(batch)} requests to {DB_FILE}")
+
+version_writer = GroupCommitWriter(GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_WINDOW_MS / 1000)
+
+_ROUTE_JOIN = "LEFT JOIN version_routes r ON r.question_id = v.question_id AND r.version_number = v.version_number"
+
+class _Encoded:
+    """
+    A compressed text or a list's JSON, as stored, until a caller reads it.
+    """
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body
+
+    def decode(self, as_list: bool):
+        data = _decode_body(self.body)
+        return json.loads(data) if as_list else data
+
+class StoredVersion(MutableMapping):
+    """
+    A stored version: a mapping with the CSV_HEADERS columns that were read
+    (and "route", where joined). Text and list fields are decoded the first
+    time they are read, so a caller that looks at a few fields of a page of
+    versions never decompresses or parses the rest.
+    """
+    __slots__ = ("_fields",)
+
+    def __init__(self, fields: dict):
+        self._fields = fields
+
+    def __getitem__(self, key):
+        value = self._fields[key]
+        if value.__class__ is _Encoded:
+            value = self._fields[key] = value.decode(key in LIST_COLUMNS)
+        return value
+
+    def get(self, key, default=None):
+        # Mapping.get() goes through a try/except; this is read for every field.
+        return self[key] if key in self._fields else default
+
+    def __setitem__(self, key, value):
+        self._fields[key] = value
+
+    def __delitem__(self, key):
+        del self._fields[key]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"StoredVersion({dict(self)!r})"
+
+@functools.lru_cache(maxsize=64)
+def _version_source(columns: tuple) -> tuple:
+    """
+    Returns (select list, FROM clause) reading `columns` from question_versions
+    v, each interned column joined to its text under the column's own name.
+    """
+    selected, joins = [], []
+    for column in columns:
+        if column in INTERNED_COLUMNS:
+            alias = f"t{len(joins)}"
+            joins.append(f"LEFT JOIN version_texts {alias} ON {alias}.text_id = v.{column}_id")
+            selected.append(f"{alias}.body AS {column}" if column in LIST_COLUMNS else f"COALESCE({alias}.body, '') AS {column}")
+        else:
+            selected.append(f"v.{column}")
+    return ", ".join(selected), " ".join(["question_versions v", *joins])
+
+@functools.lru_cache(maxsize=64)
+def _column_kinds(keys: tuple) -> tuple:
+    return (
+        [column for column in keys if column in TEXT_COLUMNS],
+        [column for column in keys if column in LIST_COLUMNS],
+        [column for column in keys if column in BOOL_COLUMNS]
+    )
+
+def _load_versions(rows: list) -> list:
+    """
+    Builds StoredVersions from rows selected through _version_source().
+    Lists and compressed texts are left encoded until they are read.
+    """
+    if not rows:
+        return []
+    keys = tuple(rows[0].keys())
+    texts, lists, bools = _column_kinds(keys)
     versions = []
-    with open(CSV_FILE, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row.get("question_id") == question_id:
-                if "version_number" in row:
-                    row["version_number"] = int(row["version_number"])
-                if "correctness_feedback_is_correct" in row:
-                    row["correctness_feedback_is_correct"] = row["correctness_feedback_is_correct"].lower() == 'true'
-                if "language_feedback_issues_found" in row:
-                    row["language_feedback_issues_found"] = row["language_feedback_issues_found"].lower() == 'true'
-                if "correctness_feedback_errors" in row and row["correctness_feedback_errors"]:
-                    row["correctness_feedback_errors"] = row["correctness_feedback_errors"].split('; ')
-                else:
-                    row["correctness_feedback_errors"] = []
-                if "language_feedback_feedback" in row and row["language_feedback_feedback"]:
-                    row["language_feedback_feedback"] = row["language_feedback_feedback"].split('; ')
-                else:
-                    row["language_feedback_feedback"] = []
-
-                versions.append(row)
+    for row in rows:
+        # zip() reads the row by position; dict(row) looks every key up by name.
+        fields = dict(zip(keys, row))
+        fields.pop("_cursor", None)
+        for column in texts:
+            if fields[column].__class__ is bytes:
+                fields[column] = _Encoded(fields[column])
+        for column in lists:
+            fields[column] = [] if fields[column] is None else _Encoded(fields[column])
+        for column in bools:
+            if fields[column] is not None:
+                fields[column] = fields[column] == 1
+        versions.append(StoredVersion(fields))
     return versions
 
+@metrics.storage_timer("get_versions")
+def get_question_versions(question_id: str):
+    selected, source = _version_source(tuple(CSV_HEADERS))
+    rows = get_connection().execute(
+        f"SELECT {selected}, r.route FROM {source} {_ROUTE_JOIN} "
+        "WHERE v.question_id = ? ORDER BY v.version_number",
+        (question_id,)
+    ).fetchall()
+    return _load_versions(rows)
+
+@metrics.storage_timer("get_stage_fingerprints")
+def get_stage_fingerprints(question_id: str, version_number: int) -> dict:
+    """
+    Returns {stage: {"fingerprint", "prompt_sha256", "model"}} for the stages
+    that produced a version. Versions stored before fingerprints have none.
+    """
+    rows = get_connection().execute(
+        "SELECT stage, fingerprint, prompt_sha256, model FROM stage_fingerprints "
+        "WHERE question_id = ? AND version_number = ?",
+        (question_id, version_number)
+    ).fetchall()
+    return {row["stage"]: {"fingerprint": row["fingerprint"], "prompt_sha256": row["prompt_sha256"], "model": row["model"]}
+            for row in rows}
+
+@metrics.storage_timer("list_stale_stage_versions")
+def list_stale_stage_versions(stage: str, prompt_sha256: str, model: str, limit: int = 100, cursor: str = None):
+    """
+    Returns (versions, next_cursor): the latest AI version of each question
+    whose `stage` output was not produced with this prompt and model, with
+    each version's stage fingerprints under "stage_fingerprints". Versions
+    routed to needs_human are left out: no stage after the checks runs for them.
+    """
+    try:
+        after = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    selected, source = _version_source(tuple(CSV_HEADERS))
+    rows = get_connection().execute(
+        f"SELECT v.rowid AS _cursor, {selected}, r.route FROM {source} {_ROUTE_JOIN} "
+        "WHERE v.rowid > ? AND v.created_by = 'AI' AND r.route IS NOT 'needs_human' "
+        "AND v.version_number = (SELECT MAX(version_number) FROM question_versions "
+        "    WHERE question_id = v.question_id AND created_by = 'AI') "
+        "AND NOT EXISTS (SELECT 1 FROM stage_fingerprints f WHERE f.question_id = v.question_id "
+        "    AND f.version_number = v.version_number AND f.stage = ? AND f.prompt_sha256 = ? AND f.model = ?) "
+        "ORDER BY v.rowid LIMIT ?",
+        (after, stage, prompt_sha256, model, limit + 1)
+    ).fetchall()
+    next_cursor = str(rows[limit - 1]["_cursor"]) if len(rows) > limit else None
+    versions = _load_versions(rows[:limit])
+    for version in versions:
+        version["stage_fingerprints"] = get_stage_fingerprints(version["question_id"], version["version_number"])
+    return versions, next_cursor
+
+@metrics.storage_timer("next_version_number")
 def get_next_version_number(question_id: str) -> int:
-    versions = get_question_versions(question_id)
-    if not versions:
-        return 1
-    return max(v["version_number"] for v in versions) + 1
+    row = get_connection().execute(
+        "SELECT MAX(version_number) FROM question_versions WHERE question_id = ?",
+        (question_id,)
+    ).fetchone()
+    return (row[0] or 0) + 1
+
+def migrate_csv(csv_path: str = CSV_FILE) -> int:
+    """
+    One-shot import of a legacy question_versions.csv into the version store.
+    Rows already present (same question_id and version_number) are skipped.
+    """
+    versions = []
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+        for raw in csv.DictReader(file):
+            version = {column: raw.get(column) or "" for column in CSV_HEADERS}
+            version["version_number"] = int(raw["version_number"])
+            for column in BOOL_COLUMNS:
+                version[column] = _to_bool(raw.get(column))
+            # The CSV joined lists with "; ", so splitting is the best we can recover.
+            for column in LIST_COLUMNS:
+                version[column] = raw[column].split("; ") if raw.get(column) else []
+            versions.append(version)
+
+    conn = get_connection()
+    with conn:
+        conn.executescript(SCHEMA)
+    migrated = []
+    with write_transaction(conn):
+        for version in versions:
+            if conn.execute(
+                "SELECT 1 FROM question_versions WHERE question_id = ? AND version_number = ?",
+                (version["question_id"], version["version_number"])
+            ).fetchone() is None:
+                conn.execute(_INSERT_SQL, _stored_row(conn, version))
+                migrated.append(version)
+        _update_rollups(conn, migrated)
+    print(f"Migrated {len(migrated)} of {len(versions)} rows from {csv_path} to {DB_FILE}")
+    return len(migrated)
+
+def compress_cold_history(older_than_days: float = COLD_HISTORY_DAYS, batch_size: int = 1000) -> tuple:
+    """
+    Deflates the interned texts of versions stored more than
+    `older_than_days` ago, so recent versions, which are read most, never
+    pay for decompression. Returns (texts compressed, bytes saved). The
+    space is reused by later writes; VACUUM returns it to the filesystem.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    conn = get_connection()
+    compressed = saved = 0
+    after = 0
+    while True:
+        # The unary + keeps the scan on rowid order rather than the timestamp index.
+        rows = conn.execute(
+            f"SELECT rowid, {', '.join(_stored_column(column) for column in INTERNED_COLUMNS)} "
+            "FROM question_versions WHERE rowid > ? AND +timestamp < ? ORDER BY rowid LIMIT ?",
+            (after, cutoff, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        after = rows[-1][0]
+        text_ids = list({text_id for row in rows for text_id in tuple(row)[1:]} - {None})
+        updates = []
+        for start in range(0, len(text_ids), 500):
+            chunk = text_ids[start:start + 500]
+            for text_id, body in conn.execute(
+                "SELECT text_id, body FROM version_texts WHERE typeof(body) = 'text' "
+                f"AND length(CAST(body AS BLOB)) >= ? AND text_id IN ({', '.join('?' for _ in chunk)})",
+                (COMPRESS_MIN_BYTES, *chunk)
+            ):
+                data = body.encode("utf-8")
+                deflate = zlib.compressobj(9, zlib.DEFLATED, DEFLATE_WBITS)
+                packed = deflate.compress(data) + deflate.flush()
+                if len(packed) < len(data):
+                    updates.append((packed, text_id))
+                    saved += len(data) - len(packed)
+        if updates:
+            with write_transaction(conn):
+                conn.executemany(
+                    "UPDATE version_texts SET body = ? WHERE text_id = ? AND typeof(body) = 'text'",
+                    updates
+                )
+            compressed += len(updates)
+    print(f"Compressed {compressed} texts of versions older than {older_than_days:g} days in {DB_FILE}, "
+          f"saving {saved} bytes")
+    return compressed, saved
+
+LIST_FILTERS = ("created_by", "metadata_topic", "metadata_difficulty")
+
+@metrics.storage_timer("list_versions")
+def list_question_versions(limit: int = 50, cursor: str = None, fields: list = None, since: str = None,
+                           until: str = None, **filters):
+    """
+    Returns (versions, next_cursor) for one page of the version store in
+    insertion order. `filters` are exact matches on LIST_FILTERS columns,
+    `since`/`until` bound the ISO timestamp, and `fields` limits the columns
+    returned; texts outside `fields` are not even read. The cursor is opaque
+    to callers; None means no more pages.
+    """
+    columns = fields or CSV_HEADERS
+    unknown = set(columns) - set(CSV_HEADERS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    clauses, params = [], []
+    if cursor:
+        try:
+            clauses.append("v.rowid > ?")
+            params.append(int(cursor))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    for column, value in filters.items():
+        if column not in LIST_FILTERS:
+            raise ValueError(f"Cannot filter on {column}")
+        if value is not None:
+            clauses.append(f"v.{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("v.timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("v.timestamp < ?")
+        params.append(until)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    selected, source = _version_source(tuple(columns))
+    rows = get_connection().execute(
+        f"SELECT v.rowid AS _cursor, {selected} FROM {source} {where} ORDER BY v.rowid LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+    next_cursor = str(rows[limit - 1]["_cursor"]) if len(rows) > limit else None
+    return _load_versions(rows[:limit]), next_cursor
+
+def export_snapshot() -> tuple:
+    """
+    Returns (row_count, last_rowid). Versions are only ever appended, so the
+    pair identifies the exact content of an export bounded by last_rowid.
+    """
+    row = get_connection().execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM question_versions").fetchone()
+    return row[0], row[1]
+
+def _iter_export_rows(last_rowid: int = None):
+    # StreamingResponse may resume these generators on different threadpool
+    # threads, so they get a connection of their own rather than a per-thread one.
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        selected, source = _version_source(tuple(CSV_HEADERS))
+        cursor = conn.execute(
+            f"SELECT {selected} FROM {source} WHERE v.rowid <= ? ORDER BY v.rowid",
+            (last_rowid if last_rowid is not None else sys.maxsize,)
+        )
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            yield _load_versions(rows)
+    finally:
+        conn.close()
+
+def export_versions_csv(last_rowid: int = None):
+    """
+    Yields the version store, up to last_rowid, as CSV text in the legacy
+    column layout, one chunk per batch of rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADERS)
+    for versions in _iter_export_rows(last_rowid):
+        for version in versions:
+            for column in BOOL_COLUMNS:
+                version[column] = "" if version[column] is None else str(version[column]).lower()
+            for column in LIST_COLUMNS:
+                version[column] = "; ".join(version[column])
+            writer.writerow([version[column] for column in CSV_HEADERS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_versions_jsonl(last_rowid: int = None):
+    """
+    Yields the version store, up to last_rowid, as one JSON object per line.
+    """
+    for versions in _iter_export_rows(last_rowid):
+        yield "".join(json.dumps(dict(version), ensure_ascii=False) + "\n" for version in versions)
+
+# Async wrappers run the blocking storage I/O in a worker thread so request
+# handlers never stall the event loop on storage.
+# Appends go through the group-commit writer instead of a thread each.
+async def append_question_version_async(**kwargs):
+    with metrics.storage_timer("append_version"):
+        stored = await asyncio.wrap_future(version_writer.submit([kwargs]))
+    return stored[0]
+
+async def append_question_versions_bulk_async(versions: list):
+    with metrics.storage_timer("append_versions_bulk"):
+        return await asyncio.wrap_future(version_writer.submit(versions))
+
+async def get_question_versions_async(question_id: str):
+    return await asyncio.to_thread(get_question_versions, question_id)
+
+async def get_stage_fingerprints_async(question_id: str, version_number: int):
+    return await asyncio.to_thread(get_stage_fingerprints, question_id, version_number)
+
+async def list_stale_stage_versions_async(stage: str, prompt_sha256: str, model: str, limit: int = 100, cursor: str = None):
+    return await asyncio.to_thread(list_stale_stage_versions, stage, prompt_sha256, model, limit, cursor)
+
+async def find_similar_versions_async(text: str, threshold: float, limit: int = 10, exclude_question_id: str = None):
+    return await asyncio.to_thread(find_similar_versions, text, threshold, limit, exclude_question_id)
+
+async def get_next_version_number_async(question_id: str) -> int:
+    return await asyncio.to_thread(get_next_version_number, question_id)
+
+async def list_question_versions_async(**kwargs):
+    return await asyncio.to_thread(list_question_versions, **kwargs)
+
+async def get_stats_async(**kwargs):
+    return await asyncio.to_thread(get_stats, **kwargs)
 
 if __name__ == "__main__":
-    pass
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        initialize_storage()
+        migrate_csv(sys.argv[2] if len(sys.argv) > 2 else CSV_FILE)
+        index_missing_similarity()
+    elif len(sys.argv) >= 2 and sys.argv[1] == "compact":
+        initialize_storage()
+        days = [arg for arg in sys.argv[2:] if arg != "--vacuum"]
+        compress_cold_history(float(days[0]) if days else COLD_HISTORY_DAYS)
+        if "--vacuum" in sys.argv:
+            # Rewrites the whole file and blocks writers meanwhile.
+            get_connection().execute("VACUUM")
+            print(f"Vacuumed {DB_FILE}: {os.path.getsize(DB_FILE)} bytes")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "rollups":
+        initialize_storage()
+        rebuild_rollups()
+    else:
+        print("Usage: python utils.py migrate [path/to/question_versions.csv]")
+        print("       python utils.py compact [older_than_days] [--vacuum]")
+        print("       python utils.py rollups")